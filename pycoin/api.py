@@ -0,0 +1,197 @@
+import json
+import struct
+
+import flask
+
+from pycoin import serialization
+from pycoin.consts import Network
+from pycoin.exceptions import PyCoinException
+from pycoin.peers import PeerManager
+
+api = flask.Blueprint('api', __name__)
+# transactions per page of /wallets/info
+MAX_HISTORY_PAGE = 1000
+
+
+def get_blockchain():
+    return flask.current_app.blockchain
+
+
+def get_peers():
+    return flask.current_app.peers
+
+
+def make_conditional(response, etag=None):
+    """
+    Tags the response with ``etag``, or a hash of its body, and turns it
+    into an empty 304 when the client sent the same tag in If-None-Match.
+    """
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    return response.make_conditional(flask.request)
+
+
+@api.route('/blockchain/block_count')
+def block_count():
+    block_count, tip_hash = get_blockchain().get_tip()
+    return make_conditional(flask.jsonify({'block_count': block_count}),
+                            tip_hash)
+
+
+@api.route('/blockchain/blocks')
+def filter_blocks():
+    start_index = flask.request.args.get('start')
+    end_index = flask.request.args.get('end')
+    verbose = flask.request.args.get('verbose', 'false') != 'false'
+    blocks = get_blockchain().get_serialized_blocks(start_index, end_index,
+                                                    verbose=verbose)
+    return make_conditional(flask.Response(b'[' + b','.join(blocks) + b']',
+                                           mimetype='application/json'))
+
+
+@api.route('/blockchain/export')
+def export_blocks():
+    blockchain = get_blockchain()
+    after = blockchain.force_int(flask.request.args.get('after'), default=-1)
+    limit = blockchain.force_int(flask.request.args.get('limit'))
+    if flask.request.args.get('format') == 'binary':
+        blocks = blockchain.iter_blocks(after, limit, verbose=True)
+        return flask.Response(encode_block_records(blocks),
+                              mimetype='application/octet-stream')
+    verbose = flask.request.args.get('verbose', 'true') != 'false'
+    blocks = blockchain.iter_blocks(after, limit, verbose=verbose)
+    return flask.Response((json.dumps(block) + '\n' for block in blocks),
+                          mimetype='application/x-ndjson')
+
+
+def encode_block_records(blocks):
+    key_table = serialization.KeyTable()
+    for block in blocks:
+        yield serialization.encode_block_record(block, key_table)
+
+
+@api.route('/blockchain/proof/<tx_id>')
+def transaction_proof(tx_id):
+    try:
+        proof = get_blockchain().get_tx_proof(tx_id)
+    except PyCoinException as err:
+        return flask.Response(repr(err), status=400)
+    if proof is None:
+        return flask.Response('Unknown or unconfirmed transaction',
+                              status=404)
+    return flask.jsonify(proof)
+
+
+@api.route('/tx/submit', methods=['post'])
+def submit_transaction():
+    post_data = flask.request.form
+    from_addr = post_data.get('from')
+    to_addr = post_data.get('to')
+    signature = post_data.get('signature')
+    public_key = post_data.get('public_key')
+    blockchain = get_blockchain()
+    try:
+        amount = float(post_data.get('amount'))
+        ts = float(post_data.get('ts'))
+        fee = blockchain.force_fee(post_data.get('fee'))
+    except (TypeError, ValueError):
+        return flask.Response('Malformed transaction', status=400)
+    key_type = post_data.get('key_type')
+    try:
+        tx_id = blockchain.submit_transaction(
+            from_addr, to_addr, amount, ts, signature, public_key, fee,
+            key_type)
+    except PyCoinException as err:
+        return flask.Response(repr(err), status=400)
+    return flask.jsonify({'tx_id': tx_id, 'status': 'pending'})
+
+
+@api.route('/tx/submit_batch', methods=['post'])
+def submit_transactions():
+    transactions = flask.request.get_json(silent=True)
+    if not isinstance(transactions, list) or \
+            not all(isinstance(tx, dict) for tx in transactions):
+        return flask.Response('Expected a JSON array of transactions',
+                              status=400)
+    return flask.jsonify(get_blockchain().submit_transactions(transactions))
+
+
+@api.route('/tx/status/<tx_id>')
+def transaction_status(tx_id):
+    status = get_blockchain().get_tx_status(tx_id)
+    if status is None:
+        return flask.Response('Unknown transaction', status=404)
+    return flask.jsonify(status)
+
+
+@api.route('/peers/tx', methods=['post'])
+def receive_transaction():
+    tx_data = flask.request.get_json(silent=True)
+    if not isinstance(tx_data, dict):
+        return flask.Response('Expected a JSON transaction', status=400)
+    try:
+        status = get_peers().receive_tx(tx_data)
+    except (KeyError, TypeError, ValueError):
+        return flask.Response('Malformed transaction', status=400)
+    except PyCoinException as err:
+        return flask.Response(repr(err), status=400)
+    return flask.jsonify({'status': status})
+
+
+@api.route('/peers/block', methods=['post'])
+def receive_block():
+    block_data = flask.request.get_json(silent=True)
+    if not isinstance(block_data, dict):
+        return flask.Response('Expected a JSON block', status=400)
+    try:
+        status = get_peers().receive_block(block_data)
+    except (KeyError, TypeError, ValueError, struct.error):
+        return flask.Response('Malformed block', status=400)
+    except PyCoinException as err:
+        return flask.Response(repr(err), status=400)
+    return flask.jsonify({'status': status})
+
+
+@api.route('/mempool/stats')
+def mempool_stats():
+    return flask.jsonify(get_blockchain().mempool.stats())
+
+
+@api.route('/node/stats')
+def node_stats():
+    return flask.jsonify(get_blockchain().get_stats())
+
+
+@api.route('/wallets/info/<address>')
+def wallet_info(address):
+    blockchain = get_blockchain()
+    # the history comes in pages, long ones would be too large a response
+    limit = blockchain.force_int(flask.request.args.get('limit'),
+                                 default=MAX_HISTORY_PAGE)
+    limit = min(max(limit, 1), MAX_HISTORY_PAGE)
+    try:
+        info = blockchain.get_address_info(
+            address, limit=limit, before=flask.request.args.get('before'))
+    except PyCoinException as err:
+        return flask.Response(repr(err), status=400)
+    return flask.jsonify(info)
+
+
+@api.route('/wallets/balance/<address>')
+def wallet_balance(address):
+    blockchain = get_blockchain()
+    return flask.jsonify({
+        'balance': blockchain.get_addr_balance(address),
+        'available': blockchain.get_available_balance(address),
+    })
+
+
+def create_app(blockchain, peers=None):
+    app = flask.Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = Network.MAX_REQUEST_SIZE
+    app.blockchain = blockchain
+    app.peers = peers or PeerManager(blockchain)
+    app.register_blueprint(api)
+    return app
@@ -0,0 +1,138 @@
+import collections
+import threading
+
+from pycoin.exceptions import NotEnoughBalanceError, ValidationError
+from pycoin.mempool import get_tx_fee, get_tx_id
+
+
+class AccountStateIndex(object):
+    """
+    In memory address -> balance index.
+
+    The confirmed balances are loaded once from the storage and then kept up
+    to date with :meth:`apply_block`. Transactions waiting in the mempool
+    reserve their amount and fee from the sender's balance, so that several queued
+    transactions can't spend the same coins.
+    """
+    # allowed float rounding error of the pending debits
+    OVERDRAFT_TOLERANCE = 1e-9
+
+    def __init__(self):
+        self._confirmed = collections.defaultdict(float)
+        self._pending_debits = collections.defaultdict(float)
+        self._pending_counts = collections.Counter()
+        self._reservations = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_storage(cls, storage):
+        index = cls()
+        index._confirmed.update(storage.get_balances())
+        return index
+
+    def get_balance(self, address):
+        with self._lock:
+            return self._confirmed.get(address, 0)
+
+    def get_available_balance(self, address):
+        """
+        The confirmed balance minus what pending transactions already spend.
+        """
+        with self._lock:
+            return (self._confirmed.get(address, 0) -
+                    self._pending_debits.get(address, 0))
+
+    def reserve(self, tx_id, address, amount):
+        with self._lock:
+            if tx_id in self._reservations:
+                raise ValidationError('Transaction already submitted')
+            available = (self._confirmed.get(address, 0) -
+                         self._pending_debits.get(address, 0))
+            if available < amount:
+                raise NotEnoughBalanceError()
+            self._reservations[tx_id] = (address, amount)
+            self._pending_debits[address] += amount
+            self._pending_counts[address] += 1
+
+    def release(self, tx_id):
+        with self._lock:
+            self._release(tx_id)
+
+    def _release(self, tx_id):
+        reservation = self._reservations.pop(tx_id, None)
+        if reservation is None:
+            return
+        address, amount = reservation
+        self._pending_debits[address] -= amount
+        self._pending_counts[address] -= 1
+        if not self._pending_counts[address]:
+            # drop the entry instead of leaving float rounding leftovers
+            del self._pending_debits[address]
+            del self._pending_counts[address]
+
+    def get_overdrawn(self):
+        """
+        Returns the ids of the pending transactions spending more than their
+        sender's confirmed balance, the last reserved first. Blocks of other
+        nodes and reorganizations can spend what they reserved.
+        """
+        with self._lock:
+            excess = {}
+            for address, debit in self._pending_debits.items():
+                overdraft = debit - self._confirmed.get(address, 0)
+                if overdraft > self.OVERDRAFT_TOLERANCE:
+                    excess[address] = overdraft
+            tx_ids = []
+            if not excess:
+                return tx_ids
+            for tx_id, (address, amount) in reversed(
+                    list(self._reservations.items())):
+                if excess.get(address, 0) > self.OVERDRAFT_TOLERANCE:
+                    tx_ids.append(tx_id)
+                    excess[address] -= amount
+            return tx_ids
+
+    def check_block(self, block_data):
+        """
+        Raises :class:`NotEnoughBalanceError` if a transaction of the block
+        spends more than its sender's confirmed balance, counting the
+        transactions before it in the block.
+        """
+        changes = collections.defaultdict(float)
+        with self._lock:
+            for item in block_data['data']:
+                if item['type'] == 'tx':
+                    available = (self._confirmed.get(item['from'], 0) +
+                                 changes[item['from']])
+                    spent = item['amount'] + get_tx_fee(item)
+                    if available < spent:
+                        raise NotEnoughBalanceError()
+                    changes[item['from']] -= spent
+                    changes[item['to']] += item['amount']
+                elif item['type'] == 'reward':
+                    changes[item['to']] += item['amount']
+
+    def apply_block(self, block_data):
+        with self._lock:
+            for item in block_data['data']:
+                if item['type'] == 'tx':
+                    self._confirmed[item['from']] -= (item['amount'] +
+                                                      get_tx_fee(item))
+                    self._confirmed[item['to']] += item['amount']
+                    self._release(get_tx_id(item))
+                elif item['type'] == 'reward':
+                    self._confirmed[item['to']] += item['amount']
+
+    def revert_block(self, block_data):
+        """
+        Undoes :meth:`apply_block`, for blocks rolled back by a chain
+        reorganization.
+        """
+        with self._lock:
+            for item in block_data['data']:
+                if item['type'] == 'tx':
+                    self._confirmed[item['from']] += (item['amount'] +
+                                                      get_tx_fee(item))
+                    self._confirmed[item['to']] -= item['amount']
+                elif item['type'] == 'reward':
+                    self._confirmed[item['to']] -= item['amount']
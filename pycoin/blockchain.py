@@ -1,18 +1,27 @@
+import concurrent.futures
 import json
+import math
+import threading
 import time
-import hashlib
-import os.path
 
-import click
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import padding
-
-from pycoin.consts import Paths, InitialCapital
-from pycoin.exceptions import NotEnoughBalanceError, ValidationError
-from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork
+from pycoin.balances import AccountStateIndex
+from pycoin.blocktree import BlockTree
+from pycoin.cache import SizedLRUCache
+from pycoin.consts import InitialCapital, Difficulty, Genesis
+from pycoin.exceptions import (PyCoinException, ValidationError,
+                               OrphanBlockError, StaleBlockError)
+from pycoin import serialization
+from pycoin.mempool import Mempool, get_tx_fee, get_tx_id
+from pycoin.merkle import get_merkle_root, get_merkle_proof
+from pycoin.pow.backends import SerialMiningBackend
+from pycoin.pow.sha256_hash_pow import (Sha256ProofOfWork, parse_target,
+                                         format_target)
+from pycoin.signatures import SignatureVerifier
 from pycoin.validators import is_valid_address
-from pycoin.wallet import KeySerializer
-from pycoin.persistence.models import Block, Transaction, BlockData, Reward, db
+from pycoin.wallet import (KEY_TYPE_ED25519, KEY_TYPE_RSA, KEY_TYPE_SECP256K1,
+                           public_key_to_address)
+from pycoin.persistence.models import Reward
+from pycoin.persistence.sqlite import SqliteStorage
 
 """
 
@@ -22,8 +31,11 @@ block = {
     'previous_hash': '....',
     'timestamp': ...,
     'hash': '...',
-    'nonce': '...'
-}   
+    'nonce': '...',
+    'target': '...',  // hex, hash must be lower than it
+    'version': 3,  // absent for version 1 (JSON hashed) blocks
+    'merkle_root': '...'  // from version 3
+}
 
 transaction = {
     'type': 'tx',
@@ -32,6 +44,8 @@ transaction = {
     'signature': '...',
     'public_key': '...',
     'amount': '...',
+    'fee': ...,  // optional
+    'key_type': 'ed25519|secp256k1',  // absent for RSA keys
     'ts': ...
 }
 
@@ -49,28 +63,154 @@ reward = {
 """
 
 
+def is_number(value):
+    # JSON numbers, booleans are ints for isinstance
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_history_cursor(position):
+    # "<ts>:<id>" of a storage history position, opaque to the clients
+    return None if position is None else '{!r}:{}'.format(*position)
+
+
+def parse_history_cursor(cursor):
+    if cursor is None:
+        return None
+    ts, _, entry_id = cursor.rpartition(':')
+    try:
+        return float(ts), int(entry_id)
+    except ValueError:
+        raise ValidationError('Invalid history cursor')
+
+
+def serialize_block(block_data):
+    # the same JSON as flask.jsonify
+    return json.dumps(block_data, sort_keys=True,
+                      separators=(',', ':')).encode()
+
+
 class Blockchain(object):
     TX_PER_BLOCK = 5
+    # new blocks only hash their header, in the compact binary encoding,
+    # which commits to the block data through a Merkle root. See
+    # pycoin.serialization and pycoin.merkle
+    BLOCK_VERSION = 3
+    # blocks loaded per query when streaming the chain
+    EXPORT_PAGE_SIZE = 100
+    # threads verifying the signatures of a submitted batch, the signature
+    # verification releases the GIL
+    VERIFY_WORKERS = 4
+    # how far in the future the timestamp of a received block may be
+    MAX_FUTURE_BLOCK_TIME = 2 * 60 * 60
+    # a block's timestamp is at least this much after its parent's
+    MIN_BLOCK_TIME = 0.001
+    # memory taken by the blocks serialized for the API
+    BLOCK_CACHE_BYTES = 64 * 1024 * 1024
 
-    def __init__(self):
-        if self.get_block_count() == 0:
-            genesis_block = self.get_genesis_block()
-            proof_of_work = Sha256ProofOfWork(genesis_block)
-            nonce, hash = proof_of_work.search_for_correct_hash()
-            genesis_block['nonce'] = nonce
-            genesis_block['hash'] = hash
-            self.persist_block(genesis_block)
-        self.tx_queue = []
+    def __init__(self, mining_backend=None, storage=None):
+        self.mining_backend = mining_backend or SerialMiningBackend()
+        # see pycoin.persistence, defaults to the database opened by init_db
+        self.storage = storage or SqliteStorage()
+        self.balances = AccountStateIndex.from_storage(self.storage)
+        self.signatures = SignatureVerifier()
+        self.verify_pool = concurrent.futures.ThreadPoolExecutor(
+            self.VERIFY_WORKERS)
+        # serializes the blocks appended to the chain, mined or received
+        self.write_lock = threading.RLock()
+        # called with every transaction queued and every block appended,
+        # see pycoin.peers
+        self.tx_listeners = []
+        self.block_listeners = []
+        # JSON of the stored blocks by (index, verbose), see
+        # get_serialized_blocks. Blocks only change when a reorganization
+        # deletes them, which bumps the generation: blocks loaded before
+        # that are not cached
+        self.block_cache = SizedLRUCache(self.BLOCK_CACHE_BYTES)
+        self.block_cache_generation = 0
+        self._block_cache_lock = threading.Lock()
+        if self.storage.get_block_count() == 0:
+            self.persist_block(self.get_genesis_block())
+        self.tree = BlockTree.from_storage(self.storage)
+        # evicted, expired and removed transactions give back their
+        # reservation
+        self.mempool = Mempool(on_remove=self.balances.release)
 
     def get_block_count(self):
-        return Block.select().count()
+        return self.tree.tip.index + 1
+
+    def get_tip(self):
+        """
+        Returns the block count and the hash of the last block, which
+        changes with every block appended or reorganization.
+        """
+        tip = self.tree.tip
+        return tip.index + 1, tip.hash
 
     def get_blocks(self, start_index, end_index, *, verbose=False):
         start_index = self.force_int(start_index, default=0)
-        end_index = self.force_int(end_index, default=self.get_block_count())
-        return [b.to_dict(verbose=verbose) for b in
-                Block.select().where(Block.index >= start_index,
-                                     Block.index < end_index)]
+        end_index = self.force_int(end_index)
+        if end_index is None:
+            end_index = self.get_block_count()
+        return self.storage.get_blocks(start_index, end_index,
+                                       verbose=verbose)
+
+    def get_serialized_blocks(self, start_index, end_index, *,
+                              verbose=False):
+        """
+        The blocks of :meth:`get_blocks`, each one serialized as JSON bytes.
+        Only the blocks missing from ``block_cache`` are loaded, in a single
+        range read.
+        """
+        start_index = max(self.force_int(start_index, default=0), 0)
+        end_index = self.force_int(end_index)
+        block_count = self.get_block_count()
+        if end_index is None or end_index > block_count:
+            end_index = block_count
+        verbose = bool(verbose)
+        blocks = [self.block_cache.get((index, verbose))
+                  for index in range(start_index, end_index)]
+        missing = [position for position, block in enumerate(blocks)
+                   if block is None]
+        if not missing:
+            return blocks
+        with self._block_cache_lock:
+            generation = self.block_cache_generation
+        loaded = [
+            (block_data['index'], serialize_block(block_data))
+            for block_data in self.storage.get_blocks(
+                start_index + missing[0], start_index + missing[-1] + 1,
+                verbose=verbose)
+        ]
+        with self._block_cache_lock:
+            if generation == self.block_cache_generation:
+                for index, block in loaded:
+                    self.block_cache.put((index, verbose), block)
+        for index, block in loaded:
+            blocks[index - start_index] = block
+        # blocks deleted in the meantime by a reorganization
+        if None in blocks:
+            del blocks[blocks.index(None):]
+        return blocks
+
+    def iter_blocks(self, after=-1, limit=None, *, verbose=True):
+        """
+        Lazily yields up to ``limit`` blocks with an index greater than
+        ``after``, in index order. Blocks are loaded ``EXPORT_PAGE_SIZE`` at a
+        time, continuing after the last index seen, so memory use doesn't
+        depend on the length of the chain.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_size = self.EXPORT_PAGE_SIZE
+            if remaining is not None:
+                page_size = min(page_size, remaining)
+                remaining -= page_size
+            blocks = self.storage.get_blocks(after + 1, after + 1 + page_size,
+                                             verbose=verbose)
+            yield from blocks
+            if len(blocks) < page_size:
+                return
+            after = blocks[-1]['index']
 
     def force_int(self, item, *, default=None):
         try:
@@ -83,154 +223,456 @@ class Blockchain(object):
             'index': 0,
             'data': self.get_initial_capital_rewards(),
             'previous_hash': '',
-            'timestamp': time.time(),
+            'timestamp': Genesis.TIMESTAMP,
+            'target': format_target(Difficulty.INITIAL_TARGET),
+            'nonce': Genesis.NONCE,
+            'hash': Genesis.HASH,
         }
 
     def hash_block(self, block):
-        content = json.dumps(block, sort_keys=True)
-        return hashlib.sha256(content.encode()).hexdigest()
+        return Sha256ProofOfWork(block).hash_block(block)
 
     def format_content_entry(self, content_entry):
         return json.dumps(content_entry, sort_keys=True)
 
     def submit_transaction(self, from_addr, to_addr, amount, ts, signature,
-                           public_key):
-        signature_binary = bytes.fromhex(signature)
-        tx_data = {'from': from_addr, 'to': to_addr, 'amount': amount,
-                   'ts': ts, 'public_key': public_key}
-        # validation
-        is_valid_address(from_addr)
-        is_valid_address(to_addr)
+                           public_key, fee=None, key_type=None):
+        tx_data = self.build_transaction(from_addr, to_addr, amount, ts,
+                                         signature, public_key, fee, key_type)
+        self.check_tx_signature(tx_data)
+        return self.queue_transaction(tx_data)
+
+    def submit_transactions(self, transactions):
+        """
+        Submits a batch of transactions, given as dicts with the fields of
+        :meth:`submit_transaction`. Signatures are verified in parallel.
+        Returns, in order, ``{'tx_id': ..., 'status': 'pending'}`` for every
+        accepted transaction and ``{'error': ...}`` for the rejected ones.
+        """
+        results = [None] * len(transactions)
+        built = []
+        for position, tx in enumerate(transactions):
+            try:
+                built.append((position, self.build_transaction(
+                    tx['from'], tx['to'], float(tx['amount']),
+                    float(tx['ts']), tx['signature'], tx['public_key'],
+                    self.force_fee(tx.get('fee')), tx.get('key_type'))))
+            except (KeyError, TypeError, ValueError):
+                results[position] = {'error': 'Malformed transaction'}
+            except PyCoinException as err:
+                results[position] = {'error': repr(err)}
+        errors = self.verify_pool.map(self.get_signature_error,
+                                      [tx_data for _, tx_data in built])
+        for (position, tx_data), error in zip(built, errors):
+            try:
+                if error is not None:
+                    raise error
+                results[position] = {'tx_id': self.queue_transaction(tx_data),
+                                     'status': 'pending'}
+            except PyCoinException as err:
+                results[position] = {'error': repr(err)}
+        return results
+
+    def build_transaction(self, from_addr, to_addr, amount, ts, signature,
+                          public_key, fee=None, key_type=None):
+        """
+        Returns the dict of a transaction, once its fields are checked.
+        Raises :class:`ValidationError` for an invalid transaction, field
+        types included, whether it was submitted or is part of a block.
+        """
+        if not all(isinstance(field, str) for field in
+                   (from_addr, to_addr, signature, public_key)) or \
+                not all(is_number(field) for field in (amount, ts)) or \
+                not (fee is None or is_number(fee)) or \
+                not (key_type is None or isinstance(key_type, str)):
+            raise ValidationError('Malformed transaction')
+        if not is_valid_address(from_addr) or not is_valid_address(to_addr):
+            raise ValidationError('Invalid address')
         if from_addr == to_addr:
             raise ValidationError('Sender and receiver cannot be the same')
-        self.check_signature(
-            json.dumps(tx_data, sort_keys=True).encode(),
-            signature_binary,
-            public_key)
-        if self.get_addr_balance(from_addr) < amount:
-            raise NotEnoughBalanceError()
-        tx_data['signature'] = signature
-        tx_data['type'] = 'tx'
-        self.add_tx_to_queue(tx_data)
-        self.trigger_generate_block()
-
-    def check_signature(self, data, signature, public_key_hex):
-        key = KeySerializer.hex_to_pub_key(public_key_hex)
-        key.verify(
-            signature, data, padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
+        # NaN would pass every balance check, and break the fee ordering
+        if not math.isfinite(amount) or amount <= 0:
+            raise ValidationError('Invalid amount')
+        if not math.isfinite(ts):
+            raise ValidationError('Invalid timestamp')
+        if public_key_to_address(public_key) != from_addr:
+            raise ValidationError('Public key does not match the sender')
+        tx_data = {'type': 'tx', 'from': from_addr, 'to': to_addr,
+                   'amount': amount, 'ts': ts, 'public_key': public_key,
+                   'signature': signature}
+        # the fee is signed along with the other fields, it is only part of
+        # the transaction when the sender set one
+        if fee is not None:
+            if not math.isfinite(fee) or fee < 0:
+                raise ValidationError('Invalid fee')
+            tx_data['fee'] = fee
+        # likewise for the key type, RSA keys having none
+        if key_type is not None:
+            if key_type not in (KEY_TYPE_ED25519, KEY_TYPE_SECP256K1):
+                raise ValidationError('Invalid key type')
+            tx_data['key_type'] = key_type
+        return tx_data
+
+    def force_fee(self, fee):
+        return None if fee is None else float(fee)
+
+    def check_tx_signature(self, tx_data):
+        self.signatures.verify_tx(tx_data)
+
+    def get_signature_error(self, tx_data):
+        try:
+            self.check_tx_signature(tx_data)
+        except PyCoinException as err:
+            return err
+        return None
+
+    def queue_transaction(self, tx_data):
+        tx_id = get_tx_id(tx_data)
+        if self.get_tx_status(tx_id) is not None:
+            raise ValidationError('Transaction already submitted')
+        # checks the balance left after the sender's pending transactions
+        self.balances.reserve(tx_id, tx_data['from'],
+                              tx_data['amount'] + get_tx_fee(tx_data))
+        try:
+            self.mempool.add(tx_data)
+        except Exception:
+            self.balances.release(tx_id)
+            raise
+        for listener in self.tx_listeners:
+            listener(tx_data)
+        return tx_id
+
+    def get_tx_status(self, tx_id):
+        if tx_id in self.mempool:
+            return {'status': 'pending'}
+        block_index = self.get_tx_block(tx_id)
+        if block_index is None:
+            return None
+        return {'status': 'confirmed', 'block': block_index}
+
+    def get_tx_block(self, tx_id):
+        """
+        Returns the index of the block confirming a transaction, or ``None``.
+        """
+        return self.storage.get_tx_block(tx_id)
+
+    def check_signature(self, data, signature, public_key_hex,
+                        key_type=KEY_TYPE_RSA):
+        self.signatures.verify(data, signature, public_key_hex, key_type)
+
+    def get_stats(self):
+        return {
+            'mempool': self.mempool.stats(),
+            'signatures': self.signatures.stats(),
+            'blocks': self.block_cache.stats(),
+        }
 
     def get_last_block(self):
-        return Block.select().where(
-            Block.index == self.get_block_count() - 1).first()
-
-    def add_tx_to_queue(self, tx_data):
-        self.tx_queue.append(tx_data)
-
-    def trigger_generate_block(self):
-        if len(self.tx_queue) >= self.TX_PER_BLOCK:
-            print('Currently {} transactions in queue. '
-                  'Generating new block'.format(len(self.tx_queue)))
-            _start = time.time()
-            self.generate_new_block()
-            print('Generated new block in {} seconds'.format(
-                time.time() - _start))
-
-    def generate_new_block(self):
-        last_block = self.get_last_block()
-        transactions = self.tx_queue[:]
+        index = self.tree.tip.index
+        return self.storage.get_blocks(index, index + 1)[0]
+
+    def get_tx_proof(self, tx_id):
+        """
+        Returns what a light wallet needs to check that a transaction is in
+        a block without downloading it: the transaction, the block header
+        and the Merkle path from the transaction to the header's root.
+        """
+        status = self.get_tx_status(tx_id)
+        if status is None or status['status'] != 'confirmed':
+            return None
+        block = self.get_blocks(status['block'], status['block'] + 1,
+                                verbose=True)[0]
+        if 'merkle_root' not in block:
+            raise ValidationError(
+                'Block {} has no Merkle root'.format(block['index']))
+        position, tx = next(
+            (position, item) for position, item in enumerate(block['data'])
+            if item['type'] == 'tx' and get_tx_id(item) == tx_id)
+        return {
+            'tx': tx,
+            'block': block['index'],
+            'block_hash': block['hash'],
+            'header': serialization.encode_header(block).hex(),
+            'proof': get_merkle_proof(block['data'], position),
+        }
+
+    def mine_pending(self, timeout=None):
+        """
+        Waits for ``TX_PER_BLOCK`` transactions in the mempool and mines them
+        into a new block. Returns the persisted block, or ``None`` if not
+        enough transactions arrived within ``timeout`` seconds.
+        """
+        self.mempool.expire()
+        transactions = self.mempool.take_batch(self.TX_PER_BLOCK, timeout)
+        if not transactions:
+            return None
+        try:
+            block = self.generate_new_block(transactions)
+        except StaleBlockError:
+            # but those the received block confirmed or overdrew
+            self.mempool.restore(transactions)
+            raise
+        except PyCoinException:
+            # the balances don't cover the batch, it would fail again
+            self.mempool.remove([get_tx_id(tx) for tx in transactions])
+            raise
+        except Exception:
+            self.mempool.restore(transactions)
+            raise
+        self.mempool.confirm(transactions)
+        return block
+
+    def generate_new_block(self, transactions):
+        parent = self.tree.tip
         new_block = {
-            'index': last_block.index + 1,
-            'previous_hash': last_block.hash,
-            'timestamp': time.time(),
+            'version': self.BLOCK_VERSION,
+            'index': parent.index + 1,
+            'previous_hash': parent.hash,
+            # after the parent's, even when its miner's clock is ahead
+            'timestamp': max(time.time(), parent.ts + self.MIN_BLOCK_TIME),
             'nonce': 0,
+            'target': format_target(self.get_next_target(parent)),
+            'merkle_root': get_merkle_root(transactions),
             'data': transactions
         }
-        proof_of_work = Sha256ProofOfWork(new_block)
-        nonce, hash_ = proof_of_work.search_for_correct_hash()
+        # before spending the work, the tip may change meanwhile
+        self.validate_block_state(new_block)
+        nonce, hash_ = self.mining_backend.search(new_block)
         new_block['nonce'] = nonce
         new_block['hash'] = hash_
-        self.persist_block(new_block)
-        self.tx_queue = []
+        with self.write_lock:
+            if self.tree.tip is not parent:
+                raise StaleBlockError()
+            self.validate_block_state(new_block)
+            block = self.persist_block(new_block)
+            self.tree.tip = self.tree.add(new_block, parent, side=False)
+        self.notify_block(new_block)
+        return block
 
-    def persist_block(self, block_data):
-        if isinstance(block_data, dict):
-            block = Block.create(index=block_data['index'],
-                                 previous_hash=block_data['previous_hash'],
-                                 hash=block_data['hash'],
-                                 ts=block_data['timestamp'],
-                                 nonce=block_data['nonce'])
-            for item in block_data['data']:
-                if item['type'] == 'tx':
-                    tx_obj = Transaction.create(from_addr=item['from'],
-                                                to_addr=item['to'],
-                                                amount=item['amount'],
-                                                ts=item['ts'],
-                                                signature=item['signature'],
-                                                public_key=item['public_key'])
-                    # create relation between block and current tx
-                    block_relation = BlockData.create(block=block,
-                                                      transaction=tx_obj,
-                                                      reward=None)
-                elif item['type'] == 'reward':
-                    reward = Reward.create(to_addr=item['to'],
-                                           amount=item['amount'],
-                                           ts=item['ts'],
-                                           reason=item['reason'],
-                                           block=item.get('block'))
-                    # create relation between block and current reward
-                    block_relation = BlockData.create(block=block,
-                                                      transaction=None,
-                                                      reward=reward)
+    def add_block(self, block_data):
+        """
+        Adds a block mined by another node, once it is validated, and
+        returns its node in the block tree. A block extending the tip is
+        appended to the chain, a block on another branch is kept aside and
+        the chain is reorganized if that branch gets more work than the main
+        chain. Raises :class:`OrphanBlockError` if the parent block is
+        unknown.
+        """
+        with self.write_lock:
+            node = self.tree.get(block_data['hash'])
+            if node is not None:
+                return node
+            parent = self.tree.get(block_data['previous_hash'])
+            if parent is None:
+                raise OrphanBlockError()
+            if block_data['index'] != parent.index + 1:
+                raise ValidationError('Invalid block index')
+            self.validate_block(block_data, parent)
+            if parent is self.tree.tip:
+                self.validate_block_state(block_data)
+                self.persist_block(block_data)
+                node = self.tree.tip = self.tree.add(block_data, parent,
+                                                     side=False)
+                self.mempool.confirm(block_data['data'])
+                self.drop_overdrawn()
+            else:
+                node = self.tree.add(block_data, parent)
+                if node.work > self.tree.tip.work:
+                    self.reorganize(node)
+            self.tree.prune()
+        self.notify_block(block_data)
+        return node
+
+    def validate_block(self, block_data, parent):
+        """
+        Checks what a block received from another node can be checked for
+        on its own branch: proof of work, target, Merkle root and
+        signatures.
+        """
+        if block_data.get('version') != self.BLOCK_VERSION:
+            raise ValidationError('Unsupported block version')
+        if block_data.get('target') != format_target(
+                self.get_next_target(parent)):
+            raise ValidationError('Unexpected block target')
+        if not Sha256ProofOfWork.verify(block_data):
+            raise ValidationError('Invalid proof of work')
+        if block_data['timestamp'] > time.time() + self.MAX_FUTURE_BLOCK_TIME:
+            raise ValidationError('Block timestamp is too far in the future')
+        # backdated blocks would make the next targets easier
+        if block_data['timestamp'] < parent.ts + self.MIN_BLOCK_TIME:
+            raise ValidationError('Block timestamp is before its parent')
+        if get_merkle_root(block_data['data']) != block_data['merkle_root']:
+            raise ValidationError('Merkle root does not match the block data')
+        tx_ids = set()
+        for item in block_data['data']:
+            # only the genesis block mints coins
+            if item['type'] != 'tx':
+                raise ValidationError('Blocks can only hold transactions')
+            self.build_transaction(item['from'], item['to'], item['amount'],
+                                   item['ts'], item['signature'],
+                                   item['public_key'], item.get('fee'),
+                                   item.get('key_type'))
+            tx_id = get_tx_id(item)
+            if tx_id in tx_ids:
+                raise ValidationError('Duplicate transaction in block')
+            tx_ids.add(tx_id)
+        for error in self.verify_pool.map(self.get_signature_error,
+                                          block_data['data']):
+            if error is not None:
+                raise error
+
+    def validate_block_state(self, block_data):
+        """
+        Checks a block against the chain it is appended to: its transactions
+        must not be confirmed already and must be covered by the balances.
+        """
+        for item in block_data['data']:
+            if self.get_tx_block(get_tx_id(item)) is not None:
+                raise ValidationError('Transaction already confirmed')
+        self.balances.check_block(block_data)
+
+    def reorganize(self, new_tip):
+        """
+        Switches the main chain to the branch ending at ``new_tip``. The
+        blocks above the fork point are rolled back and kept as a side
+        branch, their transactions missing from the new branch go back to
+        the mempool. If a block of the new branch turns out to be invalid,
+        it is dropped along with its descendants and the previous chain is
+        restored.
+        """
+        old_tip = self.tree.tip
+        fork_point = self.tree.get_fork_point(old_tip, new_tip)
+        old_branch = self.tree.get_branch(fork_point, old_tip)
+        new_branch = self.tree.get_branch(fork_point, new_tip)
+        new_blocks = [node.data for node in new_branch]
+        old_blocks = self.rollback_blocks(fork_point.index)
+        for node, block_data in zip(old_branch, old_blocks):
+            self.tree.set_side(node, block_data)
+        self.tree.tip = fork_point
+        try:
+            self.switch_to_branch(new_branch, new_blocks)
+        except PyCoinException:
+            for node, block_data in zip(new_branch, new_blocks):
+                if node.data is None:
+                    self.tree.set_side(node, block_data)
                 else:
-                    raise ValueError(
-                        'Invalid block data type: {}'.format(item['type']))
-        else:
+                    # the invalid block and the ones after it
+                    self.tree.remove(node)
+            self.rollback_blocks(fork_point.index)
+            self.tree.tip = fork_point
+            self.switch_to_branch(old_branch, old_blocks)
+            raise
+        confirmed = set()
+        for block_data in new_blocks:
+            self.mempool.confirm(block_data['data'])
+            confirmed.update(get_tx_id(item) for item in block_data['data'])
+        self.drop_overdrawn()
+        for block_data in old_blocks:
+            for item in block_data['data']:
+                if item['type'] != 'tx' or get_tx_id(item) in confirmed:
+                    continue
+                try:
+                    self.queue_transaction(item)
+                except PyCoinException:
+                    # spent again by the new branch
+                    pass
+
+    def drop_overdrawn(self):
+        """
+        Drops the pending transactions the balances no longer cover, once a
+        block of another node spent the coins they reserved.
+        """
+        self.mempool.remove(self.balances.get_overdrawn())
+
+    def switch_to_branch(self, branch, blocks):
+        for node, block_data in zip(branch, blocks):
+            self.validate_block_state(block_data)
+            self.persist_block(block_data)
+            self.tree.set_stored(node)
+            self.tree.tip = node
+
+    def rollback_blocks(self, index):
+        """
+        Deletes the blocks after ``index`` and reverts their balance changes.
+        Returns the deleted blocks, in index order.
+        """
+        blocks = self.storage.get_blocks(index + 1, self.get_block_count())
+        self.storage.delete_blocks(index + 1)
+        with self._block_cache_lock:
+            self.block_cache_generation += 1
+            self.block_cache.clear()
+        for block_data in reversed(blocks):
+            self.balances.revert_block(block_data)
+        return blocks
+
+    def notify_block(self, block_data):
+        for listener in self.block_listeners:
+            listener(block_data)
+
+    def get_next_target(self, last_block):
+        """
+        Keeps the target of the previous block, except every
+        ``Difficulty.RETARGET_INTERVAL`` blocks when it is scaled by how long
+        the last interval actually took compared to the expected time. The
+        interval includes the time spent waiting for transactions, so the
+        target never gets easier than ``Difficulty.MAX_TARGET``, the initial
+        one.
+        """
+        target = parse_target(last_block.target)
+        next_index = last_block.index + 1
+        if next_index % Difficulty.RETARGET_INTERVAL != 0:
+            return target
+        # on the branch of the last block, which may be a side branch
+        first_block = self.tree.get_ancestor(
+            self.tree.get(last_block.hash),
+            next_index - Difficulty.RETARGET_INTERVAL)
+        expected = (Difficulty.RETARGET_INTERVAL - 1) * \
+            Difficulty.BLOCK_INTERVAL
+        actual = last_block.ts - first_block.ts
+        actual = max(expected / Difficulty.MAX_ADJUSTMENT,
+                     min(actual, expected * Difficulty.MAX_ADJUSTMENT))
+        # integer arithmetic in milliseconds, floats can't hold the target
+        target = target * int(actual * 1000) // (expected * 1000)
+        return max(1, min(target, Difficulty.MAX_TARGET))
+
+    def persist_block(self, block_data):
+        if not isinstance(block_data, dict):
             raise TypeError('Expected dict, got {} instead'.format(
                 type(block_data).__name__
             ))
-        db.commit()
-        return block
+        self.storage.append_block(block_data)
+        self.balances.apply_block(block_data)
+        return block_data
 
-    def get_address_info(self, address, items=('balance', 'txes')):
-        txes = []
-        balance = 0
-        for item in Transaction.select().where(
-                        (Transaction.to_addr == address) | (
-                            Transaction.from_addr == address)):
-            if item.to_addr == address:
-                if 'txes' in items:
-                    txes.append(
-                        {'received': item.amount, 'from': item.from_addr,
-                         'ts': item.ts})
-                if 'balance' in items:
-                    balance += item.amount
-            else:
-                if 'txes' in items:
-                    txes.append(
-                        {'sent': item.amount, 'to': item.to_addr,
-                         'ts': item.ts})
-                if 'balance' in items:
-                    balance -= item.amount
-        for item in Reward.select().where(Reward.to_addr == address):
-            if 'txes' in items:
-                txes.append({'reward': item.amount, 'ts': item.ts})
-            if 'balance' in items:
-                balance += item.amount
-        txes = list(sorted(txes, key=lambda x: x['ts']))
+    def get_address_info(self, address, items=('balance', 'txes'),
+                         limit=None, before=None):
+        """
+        With a ``limit``, only the latest ``limit`` transactions (before the
+        ``before`` cursor) come, newest first, and ``next_before`` is the
+        cursor of the next page, ``None`` after the last one. Raises
+        :class:`ValidationError` for a malformed cursor.
+        """
         data = {}
         if 'txes' in items:
-            data['transactions'] = txes
+            if limit is None:
+                data['transactions'] = self.get_address_history(address)
+            else:
+                data['transactions'], last = \
+                    self.storage.get_address_history_page(
+                        address, limit, parse_history_cursor(before))
+                data['next_before'] = format_history_cursor(last)
         if 'balance' in items:
-            data['balance'] = balance
+            data['balance'] = self.get_addr_balance(address)
         return data
 
+    def get_address_history(self, address):
+        return self.storage.get_address_history(address)
+
     def get_addr_balance(self, address):
-        return self.get_address_info(address, items=('balance',))['balance']
+        return self.balances.get_balance(address)
+
+    def get_available_balance(self, address):
+        return self.balances.get_available_balance(address)
 
     def get_initial_capital_rewards(self):
         rewards = []
@@ -238,8 +680,9 @@ class Blockchain(object):
             rewards.append({
                 'type': 'reward',
                 'to': owner,
-                'amount': InitialCapital.INITIAL_CAPITAL,
-                'ts': time.time(),
+                # stored as a float, the amount must be hashed as one too
+                'amount': float(InitialCapital.INITIAL_CAPITAL),
+                'ts': Genesis.TIMESTAMP,
                 'reason': Reward.INITIAL_CAPITAL
             })
         return rewards
@@ -0,0 +1,128 @@
+from pycoin.pow.sha256_hash_pow import parse_target
+
+
+def get_block_work(target):
+    """
+    The expected number of hashes needed to find a hash below ``target``.
+    """
+    return 2 ** 256 // (parse_target(target) + 1)
+
+
+class BlockNode(object):
+    """
+    A block of the tree. Blocks of the main chain are stored in the database
+    and only keep their header fields here, blocks of side branches keep
+    their whole dict in ``data``.
+    """
+    __slots__ = ('hash', 'previous_hash', 'index', 'ts', 'target', 'work',
+                 'data')
+
+    def __init__(self, hash_, previous_hash, index, ts, target, work,
+                 data=None):
+        self.hash = hash_
+        self.previous_hash = previous_hash
+        self.index = index
+        self.ts = ts
+        self.target = target
+        # cumulative, from the genesis block up to this block included
+        self.work = work
+        self.data = data
+
+
+class BlockTree(object):
+    """
+    In memory index of every known block by hash, with the cumulative
+    proof of work of each of them. The main chain is the branch ending at
+    ``tip``, the block with the most cumulative work.
+    """
+    # side branch blocks further than this below the tip are forgotten
+    SIDE_BRANCH_DEPTH = 1000
+
+    def __init__(self):
+        self.nodes = {}
+        self.side_nodes = {}
+        self.tip = None
+
+    @classmethod
+    def from_storage(cls, storage):
+        tree = cls()
+        for hash_, previous_hash, index, ts, target in storage.iter_headers():
+            parent = tree.nodes.get(previous_hash)
+            work = get_block_work(target)
+            if parent is not None:
+                work += parent.work
+            node = BlockNode(hash_, previous_hash, index, ts, target, work)
+            tree.nodes[hash_] = node
+            tree.tip = node
+        return tree
+
+    def __contains__(self, hash_):
+        return hash_ in self.nodes
+
+    def get(self, hash_):
+        return self.nodes.get(hash_)
+
+    def add(self, block_data, parent, side=True):
+        """
+        Adds a block extending ``parent``. Side branch blocks keep their
+        data until they are stored.
+        """
+        node = BlockNode(block_data['hash'], block_data['previous_hash'],
+                         block_data['index'], block_data['timestamp'],
+                         block_data.get('target'),
+                         parent.work + get_block_work(block_data.get('target')),
+                         block_data if side else None)
+        self.nodes[node.hash] = node
+        if side:
+            self.side_nodes[node.hash] = node
+        return node
+
+    def remove(self, node):
+        self.nodes.pop(node.hash, None)
+        self.side_nodes.pop(node.hash, None)
+
+    def set_stored(self, node):
+        node.data = None
+        self.side_nodes.pop(node.hash, None)
+
+    def set_side(self, node, block_data):
+        node.data = block_data
+        self.side_nodes[node.hash] = node
+
+    def get_ancestor(self, node, index):
+        while node.index > index:
+            node = self.nodes[node.previous_hash]
+        return node
+
+    def get_fork_point(self, node, other):
+        """
+        Returns the last block shared by the branches of two blocks.
+        """
+        while node.index > other.index:
+            node = self.nodes[node.previous_hash]
+        while other.index > node.index:
+            other = self.nodes[other.previous_hash]
+        while node is not other:
+            node = self.nodes[node.previous_hash]
+            other = self.nodes[other.previous_hash]
+        return node
+
+    def get_branch(self, fork_point, node):
+        """
+        Returns the blocks after ``fork_point`` up to ``node``, in index
+        order.
+        """
+        branch = []
+        while node is not fork_point:
+            branch.append(node)
+            node = self.nodes[node.previous_hash]
+        branch.reverse()
+        return branch
+
+    def prune(self):
+        min_index = self.tip.index - self.SIDE_BRANCH_DEPTH
+        # parents first, so that their descendants go along with them
+        for node in sorted(self.side_nodes.values(),
+                           key=lambda node: node.index):
+            if node.index < min_index or node.previous_hash not in self.nodes:
+                self.remove(node)
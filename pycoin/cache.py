@@ -0,0 +1,85 @@
+import collections
+import threading
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping that keeps at most ``maxsize`` items, dropping the
+    least recently used ones first, and counts its hits and misses.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SizedLRUCache(LRUCache):
+    """
+    LRU cache of byte strings, keeping at most ``maxbytes`` of them.
+    """
+
+    def __init__(self, maxbytes):
+        super().__init__(maxsize=None)
+        self.maxbytes = maxbytes
+        self.bytes = 0
+
+    def put(self, key, value):
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            if len(value) > self.maxbytes:
+                return
+            self._data[key] = value
+            self.bytes += len(value)
+            while self.bytes > self.maxbytes:
+                _, dropped = self._data.popitem(last=False)
+                self.bytes -= len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({'bytes': self.bytes, 'maxbytes': self.maxbytes})
+        return stats
@@ -1,16 +1,120 @@
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import io
+import itertools
 import json
+import threading
+import time
 import urllib.parse
-import urllib.request
 
+from pycoin import serialization
+from pycoin.cache import LRUCache
 from pycoin.exceptions import ClientError
 
+# errors of a kept alive connection the node closed in the meantime
+CONNECTION_DROPPED = (http.client.RemoteDisconnected, ConnectionResetError,
+                      BrokenPipeError)
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of the idle keep-alive connections to a node, at most
+    ``size`` of them are kept. Connections idle for more than ``MAX_IDLE``
+    seconds are closed instead of reused, before the node times them out.
+    """
+    MAX_IDLE = 30
+
+    def __init__(self, node_addr, size, timeout):
+        host, _, port = node_addr.partition(':')
+        self.host = host
+        self.port = int(port) if port else 80
+        self.size = size
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns ``(connection, reused)``, ``reused`` being set for a
+        connection that already served a request.
+        """
+        with self._lock:
+            # the longest idle come first
+            while self._idle and \
+                    time.time() - self._idle[0][1] > self.MAX_IDLE:
+                self._idle.popleft()[0].close()
+            if self._idle:
+                return self._idle.pop()[0], True
+        return http.client.HTTPConnection(self.host, self.port,
+                                          timeout=self.timeout), False
+
+    def put(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.time()))
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
 
 class BlockchainHttpClient(object):
+    """
+    Client of the node API. Connections are kept alive and reused, up to
+    ``pool_size`` idle connections per node.
+
+    ``node_addr`` is a ``host:port`` string or a list of them: requests are
+    then spread over the nodes in turns. A request failing to reach a node
+    (or answered with a 503) is retried up to ``retries`` times on the next
+    node, waiting ``backoff`` seconds, doubled after every attempt. Only GET
+    requests are retried when the connection fails after the request was
+    sent: the node may have handled a POST already, a transaction would
+    then be submitted twice.
+    """
+    IDEMPOTENT_METHODS = ('GET', 'HEAD')
     API_WALLET_INFO = '/wallets/info/{address}'
+    API_WALLET_BALANCE = '/wallets/balance/{address}'
     API_TX_SUBMIT = '/tx/submit'
+    API_TX_SUBMIT_BATCH = '/tx/submit_batch'
+    API_TX_STATUS = '/tx/status/{tx_id}'
+    API_EXPORT = '/blockchain/export'
+    API_TX_PROOF = '/blockchain/proof/{tx_id}'
+    API_BLOCK_COUNT = '/blockchain/block_count'
+    API_BLOCKS = '/blockchain/blocks'
+    API_PEER_TX = '/peers/tx'
+    API_PEER_BLOCK = '/peers/block'
+    EXPORT_PAGE_SIZE = 1000
+    DEFAULT_TIMEOUT = 30
+    DEFAULT_RETRIES = 2
+    DEFAULT_BACKOFF = 0.2
+    DEFAULT_POOL_SIZE = 8
+    # responses kept for conditional requests, see get_conditional_json
+    CONDITIONAL_CACHE_SIZE = 128
 
-    def __init__(self, node_addr):
-        self.node_addr = node_addr
+    def __init__(self, node_addr, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.node_addrs = ([node_addr] if isinstance(node_addr, str)
+                           else list(node_addr))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pools = {addr: ConnectionPool(addr, pool_size, timeout)
+                      for addr in self.node_addrs}
+        self._turns = itertools.cycle(self.node_addrs)
+        self._turns_lock = threading.Lock()
+        # runs the blocking requests of the asyncio methods
+        self._executor = concurrent.futures.ThreadPoolExecutor(pool_size)
+        self._conditional = LRUCache(self.CONDITIONAL_CACHE_SIZE)
+
+    @property
+    def node_addr(self):
+        return self.node_addrs[0]
 
     def get_node_addr(self):
         return 'http://{}/'.format(self.node_addr)
@@ -18,28 +122,218 @@ class BlockchainHttpClient(object):
     def get_api_url(self, api_uri):
         return urllib.parse.urljoin(self.get_node_addr(), api_uri)
 
-    def get_balance(self, address):
-        req = urllib.request.Request(
-            self.get_api_url(self.API_WALLET_INFO.format(address=address))
-        )
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self._executor.shutdown(wait=False)
+
+    def next_node(self):
+        with self._turns_lock:
+            return next(self._turns)
+
+    def open(self, method, api_uri, params=None, body=None, headers=None):
+        """
+        Sends a request and returns ``(pool, connection, response)``; the
+        response must be given back to :meth:`release` once read. Raises
+        :class:`ClientError` when the node answers with an error.
+        """
+        if params:
+            api_uri += '?' + urllib.parse.urlencode(params)
+        attempt = 0
+        while True:
+            pool = self.pools[self.next_node()]
+            connection, reused = pool.get()
+            sent = False
+            try:
+                connection.request(method, api_uri, body, headers or {})
+                sent = True
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError) as err:
+                connection.close()
+                if sent and method not in self.IDEMPOTENT_METHODS:
+                    raise
+                if reused and isinstance(err, CONNECTION_DROPPED):
+                    # the node closed the idle connection before reading
+                    # the request, which doesn't count as an attempt
+                    continue
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status < 400:
+                    return pool, connection, response
+                txt = response.read().decode()
+                self.release(pool, connection, response)
+                if response.status != 503 or attempt >= self.retries:
+                    err = ClientError(txt)
+                    err.message = txt
+                    raise err
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def release(self, pool, connection, response):
+        # a connection can only serve the next request once the response
+        # was read to the end
+        if response.isclosed() and not response.will_close:
+            pool.put(connection)
+        else:
+            connection.close()
+
+    def request(self, method, api_uri, params=None, body=None,
+                headers=None):
+        pool, connection, response = self.open(method, api_uri, params,
+                                               body, headers)
         try:
-            resp = urllib.request.urlopen(req)
-        except urllib.request.HTTPError as e:
-            txt = e.read().decode()
-            err = ClientError(txt)
-            err.message = txt
-            raise err
-        return json.loads(resp.read().decode())
+            data = response.read()
+        finally:
+            self.release(pool, connection, response)
+        return data
 
-    def submit_tx(self, tx_info):
-        url = self.get_api_url(self.API_TX_SUBMIT)
-        request = urllib.request.Request(
-            url, data=urllib.parse.urlencode(tx_info).encode())
+    def get_json(self, api_uri, params=None):
+        return json.loads(self.request('GET', api_uri, params).decode())
+
+    def get_conditional_json(self, api_uri, params=None):
+        """
+        GET of an endpoint tagging its responses with an ETag: the last
+        response is kept, and the node only sends it again once it changed.
+        """
+        if params:
+            api_uri += '?' + urllib.parse.urlencode(params)
+        cached = self._conditional.get(api_uri)
+        headers = {'If-None-Match': cached[0]} if cached else {}
+        pool, connection, response = self.open('GET', api_uri,
+                                               headers=headers)
         try:
-            resp = urllib.request.urlopen(request)
-        except urllib.request.HTTPError as e:
-            err = e.read().decode()
-            err_obj = ClientError()
-            err_obj.message = err
-            raise err_obj
-        return resp.read().decode()
+            data = response.read()
+        finally:
+            self.release(pool, connection, response)
+        if response.status == 304 and cached:
+            data = cached[1]
+        elif response.getheader('ETag'):
+            self._conditional.put(api_uri, (response.getheader('ETag'), data))
+        return json.loads(data.decode())
+
+    def post_form(self, api_uri, data):
+        return json.loads(self.request(
+            'POST', api_uri, body=urllib.parse.urlencode(data),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        ).decode())
+
+    def post_json(self, api_uri, data):
+        return json.loads(self.request(
+            'POST', api_uri, body=json.dumps(data).encode(),
+            headers={'Content-Type': 'application/json'}).decode())
+
+    def get_balance(self, address, limit=None, before=None):
+        """
+        Returns the balance of an address and a page of its transactions,
+        newest first: the latest ``limit`` of them (the node's page size by
+        default) before the ``before`` cursor. The ``next_before`` of the
+        result is the cursor of the next page, ``None`` after the last one.
+        """
+        params = {key: value for key, value in
+                  (('limit', limit), ('before', before))
+                  if value is not None}
+        return self.get_json(self.API_WALLET_INFO.format(address=address),
+                             params)
+
+    def get_address_balance(self, address):
+        """
+        Returns the confirmed and available (after the pending transactions)
+        balance of an address, without its transactions.
+        """
+        return self.get_json(self.API_WALLET_BALANCE.format(address=address))
+
+    async def get_balances(self, addresses):
+        """
+        Fetches the :meth:`get_address_balance` of many addresses
+        concurrently, over up to ``pool_size`` connections per node.
+        Returns them by address.
+        """
+        loop = asyncio.get_running_loop()
+        balances = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self.get_address_balance,
+                                 address)
+            for address in addresses])
+        return dict(zip(addresses, balances))
+
+    def submit_tx(self, tx_info):
+        return self.post_form(self.API_TX_SUBMIT, tx_info)
+
+    def submit_txs(self, txs):
+        """
+        Submits several transactions in one request. Returns one result per
+        transaction, in order: either its ``tx_id`` or an ``error``.
+        """
+        return self.post_json(self.API_TX_SUBMIT_BATCH, list(txs))
+
+    def get_tx_status(self, tx_id):
+        return self.get_json(self.API_TX_STATUS.format(tx_id=tx_id))
+
+    def get_tx_proof(self, tx_id):
+        """
+        Fetches the Merkle inclusion proof of a confirmed transaction, to be
+        checked with :func:`pycoin.merkle.verify_tx_proof`.
+        """
+        return self.get_json(self.API_TX_PROOF.format(tx_id=tx_id))
+
+    def iter_blocks(self, after=-1, *, verbose=True, binary=False):
+        """
+        Lazily yields the node's blocks with an index greater than ``after``,
+        fetching them from the streaming export endpoint one page at a time.
+        With ``binary``, blocks are transferred in the compact binary
+        encoding (always verbose).
+        """
+        while True:
+            params = {
+                'after': after, 'limit': self.EXPORT_PAGE_SIZE,
+                'verbose': 'true' if verbose else 'false'
+            }
+            if binary:
+                params['format'] = 'binary'
+            pool, connection, resp = self.open('GET', self.API_EXPORT,
+                                               params)
+            received = 0
+            if binary:
+                blocks = serialization.read_block_records(resp)
+            else:
+                blocks = (json.loads(line.decode()) for line in resp
+                          if line.strip())
+            try:
+                for block in blocks:
+                    received += 1
+                    after = block['index']
+                    yield block
+            finally:
+                # the connection is closed if the page was not read to the
+                # end
+                self.release(pool, connection, resp)
+            if received < self.EXPORT_PAGE_SIZE:
+                return
+
+    def get_block_count(self):
+        return self.get_conditional_json(self.API_BLOCK_COUNT)['block_count']
+
+    def get_blocks(self, start=None, end=None, verbose=False):
+        """
+        Returns the blocks ``[start, end)``, all of them by default.
+        """
+        params = {key: value for key, value in
+                  (('start', start), ('end', end)) if value is not None}
+        if verbose:
+            params['verbose'] = 'true'
+        return self.get_conditional_json(self.API_BLOCKS, params)
+
+    def get_block_range(self, start, count):
+        """
+        Fetches the blocks ``[start, start + count)`` in a single binary
+        export request.
+        """
+        data = self.request('GET', self.API_EXPORT, {
+            'after': start - 1, 'limit': count, 'format': 'binary'})
+        return list(serialization.read_block_records(io.BytesIO(data)))
+
+    def send_tx(self, tx_data):
+        return self.post_json(self.API_PEER_TX, tx_data)
+
+    def send_block(self, block_data):
+        return self.post_json(self.API_PEER_BLOCK, block_data)
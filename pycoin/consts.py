@@ -10,11 +10,31 @@ class Paths:
     WALLET_DIR = os.path.join(ROOT_DIR, 'wallets')
     BLOCKCHAIN_DATA = os.path.join(ROOT_DIR, 'data')
     BLOCKCHAIN_DB = os.path.join(BLOCKCHAIN_DATA, 'blockchain.db')
+    BLOCKFILE_DIR = os.path.join(BLOCKCHAIN_DATA, 'blocks')
 
 
 class Network:
     NODE_PORT = 64788
-    
+    # bytes, larger request bodies are refused with a 413
+    MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+
+class Difficulty:
+    # a block hash must be lower than the target of its block. The initial
+    # target is the old "three leading hex zeros" rule.
+    INITIAL_TARGET = 2 ** 244
+    # the easiest target. Blocks are only mined once enough transactions
+    # wait (see Blockchain.mine_pending), so the time between blocks also
+    # counts the idle time between transactions: retargeting makes mining
+    # harder on faster hardware, but quiet periods can't make it easier than
+    # the initial target
+    MAX_TARGET = INITIAL_TARGET
+    # every RETARGET_INTERVAL blocks the target is scaled so that blocks are
+    # found every BLOCK_INTERVAL seconds, by at most MAX_ADJUSTMENT at a time
+    RETARGET_INTERVAL = 10
+    BLOCK_INTERVAL = 30
+    MAX_ADJUSTMENT = 4
+
 
 class InitialCapital:
     INITIAL_CAPITAL = 50
@@ -24,5 +44,9 @@ class InitialCapital:
     ]
 
 
-ensure_dir(Paths.WALLET_DIR)
-ensure_dir(Paths.BLOCKCHAIN_DATA)
+class Genesis:
+    # the genesis block is the same for every node: it holds the initial
+    # capital rewards, stamped with TIMESTAMP, and was mined in advance
+    TIMESTAMP = 1514764800.0
+    NONCE = 569
+    HASH = '000cc57bb61dcaf820d391dee1a8f3538519f0a28f9ba7c335a9aa0fd8319e51'
@@ -2,7 +2,8 @@ class PyCoinException(Exception):
     message = ''
 
     def __init__(self, msg=''):
-        self.message = msg
+        if msg:
+            self.message = msg
 
     def __str__(self):
         return repr(self)
@@ -21,3 +22,19 @@ class NotEnoughBalanceError(PyCoinException):
 
 class ClientError(PyCoinException):
     pass
+
+
+class ChainVerificationError(PyCoinException):
+    message = 'Invalid block'
+
+    def __init__(self, index, msg=''):
+        super().__init__(msg)
+        self.index = index
+
+
+class OrphanBlockError(ValidationError):
+    message = 'Unknown parent block'
+
+
+class StaleBlockError(ValidationError):
+    message = 'The chain tip changed while mining'
@@ -0,0 +1,133 @@
+import collections
+import concurrent.futures
+import http.client
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+
+LoadTestReport = collections.namedtuple(
+    'LoadTestReport', ['endpoint', 'requests', 'errors', 'elapsed',
+                       'latencies'])
+
+# GET requests are made to a path, POST requests also carry a form
+LoadRequest = collections.namedtuple('LoadRequest', ['method', 'path', 'form'])
+
+
+def get_percentile(values, percent):
+    """
+    Nearest rank percentile of sorted ``values``.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(round(percent / 100 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+class LoadTester(object):
+    """
+    Measures the throughput and latency of a node's API endpoints, with
+    ``concurrency`` clients sending requests back to back for ``duration``
+    seconds. Every client keeps its connection to the node open, as a wallet
+    or a peer would.
+    """
+    ENDPOINTS = ('wallets', 'blocks', 'submit')
+    # blocks requested by /blockchain/blocks, from the chain tip
+    BLOCK_RANGE = 10
+
+    def __init__(self, node_addr, concurrency=8, duration=10, timeout=10):
+        self.node_addr = node_addr
+        self.concurrency = concurrency
+        self.duration = duration
+        self.timeout = timeout
+
+    def run(self, endpoint, requests):
+        """
+        Sends the requests of the ``requests`` iterable until the duration
+        elapses or the iterable is exhausted. Returns a
+        :class:`LoadTestReport`, with the latencies of the requests sorted.
+        """
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+        deadline = time.time() + self.duration
+
+        def next_request():
+            with lock:
+                return next(requests, None)
+
+        def client():
+            nonlocal errors
+            connection = self.connect()
+            own_latencies = []
+            own_errors = 0
+            try:
+                while time.time() < deadline:
+                    request = next_request()
+                    if request is None:
+                        break
+                    _start = time.time()
+                    try:
+                        status = self.send(connection, request)
+                    except (http.client.HTTPException, OSError):
+                        connection.close()
+                        connection = self.connect()
+                        status = None
+                    own_latencies.append(time.time() - _start)
+                    if status is None or status >= 400:
+                        own_errors += 1
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors += own_errors
+
+        _start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as pool:
+            for future in [pool.submit(client)
+                           for _ in range(self.concurrency)]:
+                future.result()
+        return LoadTestReport(endpoint=endpoint, requests=len(latencies),
+                              errors=errors, elapsed=time.time() - _start,
+                              latencies=sorted(latencies))
+
+    def connect(self):
+        host, _, port = self.node_addr.partition(':')
+        return http.client.HTTPConnection(host, int(port or 80),
+                                          timeout=self.timeout)
+
+    def send(self, connection, request):
+        body = None
+        headers = {}
+        if request.form is not None:
+            body = urllib.parse.urlencode(request.form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection.request(request.method, request.path, body, headers)
+        response = connection.getresponse()
+        # the whole response is read, so the connection can be reused
+        response.read()
+        return response.status
+
+    def get_block_count(self):
+        connection = self.connect()
+        try:
+            connection.request('GET', '/blockchain/block_count')
+            return json.loads(
+                connection.getresponse().read().decode())['block_count']
+        finally:
+            connection.close()
+
+    def wallet_requests(self, address):
+        return itertools.repeat(LoadRequest(
+            'GET', '/wallets/info/{}'.format(address), None))
+
+    def block_requests(self):
+        end = self.get_block_count()
+        query = urllib.parse.urlencode({
+            'start': max(0, end - self.BLOCK_RANGE), 'end': end})
+        return itertools.repeat(LoadRequest(
+            'GET', '/blockchain/blocks?' + query, None))
+
+    def submit_requests(self, transactions):
+        return (LoadRequest('POST', '/tx/submit', tx) for tx in transactions)
@@ -0,0 +1,266 @@
+import collections
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import threading
+import time
+
+from pycoin import serialization
+from pycoin.exceptions import ValidationError
+
+
+def get_tx_id(tx_data):
+    """
+    The id of a transaction is the sha256 of its signed content, signature
+    included.
+    """
+    content = {k: v for k, v in tx_data.items() if k != 'type'}
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def get_tx_fee(tx_data):
+    return tx_data.get('fee') or 0.0
+
+
+def get_tx_size(tx_data):
+    """
+    Size of the transaction in the binary encoding, public key included.
+    """
+    out = io.BytesIO()
+    serialization.encode_tx(tx_data, serialization.KeyTable(), out)
+    return len(out.getvalue())
+
+
+class MempoolEntry(object):
+    __slots__ = ('tx_id', 'tx_data', 'fee', 'size', 'added')
+
+    def __init__(self, tx_id, tx_data, added):
+        self.tx_id = tx_id
+        self.tx_data = tx_data
+        self.fee = get_tx_fee(tx_data)
+        self.size = get_tx_size(tx_data)
+        self.added = added
+
+
+class Mempool(object):
+    """
+    Thread safe pool of the transactions waiting to be included in a block.
+
+    Transactions are indexed by id. Blocks are filled with the highest fee
+    transactions first, the transactions of a sender being always taken in
+    timestamp order. The pool holds at most ``max_count`` transactions and
+    ``max_bytes`` of encoded transactions: past that, the lowest fee
+    transactions are evicted. Transactions waiting for more than
+    ``expiry`` seconds are dropped. ``on_remove`` is called with the id of
+    every evicted, expired or removed transaction.
+
+    Transactions taken by the miner stay known to the mempool (as pending)
+    until the block holding them is persisted and they are confirmed.
+    """
+    DEFAULT_MAX_COUNT = 50000
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    DEFAULT_EXPIRY = 3 * 60 * 60
+
+    def __init__(self, max_count=DEFAULT_MAX_COUNT, max_bytes=DEFAULT_MAX_BYTES,
+                 expiry=DEFAULT_EXPIRY, on_remove=None):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.on_remove = on_remove
+        # by arrival, oldest first
+        self._pending = collections.OrderedDict()
+        self._mining = {}
+        # (fee, -sequence, tx_id) of the pending transactions, the cheapest
+        # and then newest first. Entries of transactions that left the pool
+        # are skipped when popped
+        self._eviction_heap = []
+        self._sequence = itertools.count()
+        self._bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self.removed = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def __contains__(self, tx_id):
+        with self._condition:
+            return tx_id in self._pending or tx_id in self._mining
+
+    def add(self, tx_data):
+        """
+        Adds a transaction, evicting lower fee ones if the pool is full.
+        Raises :class:`ValidationError` for duplicates, and when the pool is
+        full of transactions paying at least as much.
+        """
+        tx_id = get_tx_id(tx_data)
+        removed = []
+        with self._condition:
+            if tx_id in self._pending or tx_id in self._mining:
+                raise ValidationError('Transaction already submitted')
+            removed.extend(self._expire(time.time()))
+            entry = MempoolEntry(tx_id, tx_data, time.time())
+            self._insert(entry)
+            heapq.heappush(self._eviction_heap,
+                           (entry.fee, -next(self._sequence), tx_id))
+            while len(self._pending) > self.max_count or \
+                    self._bytes > self.max_bytes:
+                evicted = self._pop_cheapest()
+                if evicted is entry:
+                    self._notify_removed(removed)
+                    raise ValidationError('Mempool is full')
+                self.evicted += 1
+                removed.append(evicted.tx_id)
+            self._condition.notify_all()
+        self._notify_removed(removed)
+        return tx_id
+
+    def take_batch(self, size, timeout=None):
+        """
+        Waits up to ``timeout`` seconds for ``size`` transactions and takes
+        the ``size`` paying the highest fees out of the pool. Returns an
+        empty list on timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: len(self._pending) >= size, timeout):
+                return []
+            batch = []
+            for entry in self._select(size):
+                self._remove(entry.tx_id)
+                self._mining[entry.tx_id] = entry
+                batch.append(entry.tx_data)
+            return batch
+
+    def _select(self, size):
+        # every sender's earliest transaction competes on fee, taking one
+        # puts the sender's next transaction in the running
+        by_sender = collections.defaultdict(list)
+        for entry in self._pending.values():
+            by_sender[entry.tx_data['from']].append(entry)
+        heads = []
+        for entries in by_sender.values():
+            entries.sort(key=lambda entry: entry.tx_data['ts'], reverse=True)
+            head = entries.pop()
+            heads.append((-head.fee, head.tx_data['ts'], head.tx_id,
+                          head, entries))
+        heapq.heapify(heads)
+        selected = []
+        while heads and len(selected) < size:
+            _, _, _, entry, entries = heapq.heappop(heads)
+            selected.append(entry)
+            if entries:
+                head = entries.pop()
+                heapq.heappush(heads, (-head.fee, head.tx_data['ts'],
+                                       head.tx_id, head, entries))
+        return selected
+
+    def confirm(self, transactions):
+        """
+        Forgets the transactions of a persisted block, whether they were
+        being mined or still waiting (for blocks received from other nodes).
+        """
+        with self._condition:
+            for tx_data in transactions:
+                tx_id = get_tx_id(tx_data)
+                self._mining.pop(tx_id, None)
+                self._remove(tx_id)
+
+    def restore(self, transactions):
+        """
+        Puts back transactions taken by :meth:`take_batch` that did not make
+        it into a block, ahead of the ones submitted since. Those confirmed
+        or removed in the meantime are left out.
+        """
+        with self._condition:
+            for tx_data in reversed(transactions):
+                tx_id = get_tx_id(tx_data)
+                entry = self._mining.pop(tx_id, None)
+                if entry is None or tx_id in self._pending:
+                    continue
+                self._insert(entry)
+                self._pending.move_to_end(tx_id, last=False)
+                heapq.heappush(self._eviction_heap,
+                               (entry.fee, -next(self._sequence), tx_id))
+            self._condition.notify_all()
+
+    def remove(self, tx_ids):
+        """
+        Drops transactions, waiting or being mined, that can't be confirmed
+        anymore.
+        """
+        removed = []
+        with self._condition:
+            for tx_id in tx_ids:
+                if self._remove(tx_id) is not None or \
+                        self._mining.pop(tx_id, None) is not None:
+                    removed.append(tx_id)
+            self.removed += len(removed)
+        self._notify_removed(removed)
+
+    def expire(self):
+        """
+        Drops the transactions that waited for too long.
+        """
+        with self._condition:
+            removed = self._expire(time.time())
+        self._notify_removed(removed)
+
+    def stats(self):
+        with self._condition:
+            fees = [entry.fee for entry in self._pending.values()]
+            return {
+                'size': len(self._pending),
+                'bytes': self._bytes,
+                'mining': len(self._mining),
+                'max_size': self.max_count,
+                'max_bytes': self.max_bytes,
+                'min_fee': min(fees, default=0.0),
+                'max_fee': max(fees, default=0.0),
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'removed': self.removed,
+            }
+
+    def _insert(self, entry):
+        self._pending[entry.tx_id] = entry
+        self._bytes += entry.size
+
+    def _remove(self, tx_id):
+        entry = self._pending.pop(tx_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _pop_cheapest(self):
+        while True:
+            _, _, tx_id = heapq.heappop(self._eviction_heap)
+            entry = self._remove(tx_id)
+            if entry is not None:
+                return entry
+
+    def _expire(self, now):
+        removed = []
+        while self._pending:
+            entry = next(iter(self._pending.values()))
+            if now - entry.added < self.expiry:
+                break
+            self._remove(entry.tx_id)
+            self.expired += 1
+            removed.append(entry.tx_id)
+        if len(self._eviction_heap) > 2 * len(self._pending) + 1024:
+            # drop the entries of the transactions that left the pool
+            self._eviction_heap = [item for item in self._eviction_heap
+                                   if item[2] in self._pending]
+            heapq.heapify(self._eviction_heap)
+        return removed
+
+    def _notify_removed(self, tx_ids):
+        if self.on_remove is not None:
+            for tx_id in tx_ids:
+                self.on_remove(tx_id)
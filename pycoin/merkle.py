@@ -0,0 +1,100 @@
+"""
+Merkle trees over the entries of a block.
+
+A leaf is the sha256 of the binary encoding of an entry (with its public key
+written in full). Each level hashes pairs of nodes, the last node of a level
+with an odd size being paired with itself.
+"""
+import hashlib
+import io
+
+from pycoin import serialization
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork, parse_target
+
+EMPTY_ROOT = bytes(32)
+
+
+def get_entry_hash(entry):
+    out = io.BytesIO()
+    serialization.encode_entry(entry, serialization.KeyTable(), out)
+    return hashlib.sha256(out.getvalue()).digest()
+
+
+def hash_pair(left, right):
+    return hashlib.sha256(left + right).digest()
+
+
+def get_next_level(level):
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [hash_pair(level[i], level[i + 1])
+            for i in range(0, len(level), 2)]
+
+
+def get_merkle_root(entries):
+    level = [get_entry_hash(entry) for entry in entries]
+    if not level:
+        return EMPTY_ROOT.hex()
+    while len(level) > 1:
+        level = get_next_level(level)
+    return level[0].hex()
+
+
+def get_merkle_proof(entries, position):
+    """
+    Returns the sibling hashes needed to rebuild the Merkle root from the
+    entry at ``position``, from the leaves up, as ``{'hash', 'side'}`` dicts
+    where ``side`` tells on which side of the current node the sibling is.
+    """
+    level = [get_entry_hash(entry) for entry in entries]
+    if not 0 <= position < len(level):
+        raise IndexError('No entry at position {}'.format(position))
+    proof = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        if position % 2:
+            proof.append({'hash': level[position - 1].hex(), 'side': 'left'})
+        else:
+            proof.append({'hash': level[position + 1].hex(),
+                          'side': 'right'})
+        level = get_next_level(level)
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(entry, proof, merkle_root):
+    node = get_entry_hash(entry)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        if step['side'] == 'left':
+            node = hash_pair(sibling, node)
+        else:
+            node = hash_pair(node, sibling)
+    return node.hex() == merkle_root
+
+
+def verify_tx_proof(tx_proof, expected_target=None):
+    """
+    Checks a proof returned by the node's ``/blockchain/proof/<tx_id>``: the
+    header must hash to the block hash and satisfy its target, and the
+    Merkle path must lead from the transaction to the header's root.
+
+    The target is the one the header claims: anyone can mine a header
+    against an easy target. Unless the caller already knows the header is
+    part of its chain, it must pass the ``expected_target`` of that height
+    (an int or a hex string), which the header's target has to match.
+    """
+    header = bytes.fromhex(tx_proof['header'])
+    block = serialization.decode_header(io.BytesIO(header))
+    if hashlib.sha256(header).hexdigest() != tx_proof['block_hash']:
+        return False
+    if expected_target is not None:
+        if isinstance(expected_target, str):
+            expected_target = int(expected_target, 16)
+        if parse_target(block.get('target')) != expected_target:
+            return False
+    if not Sha256ProofOfWork(block).hash_is_valid(tx_proof['block_hash']):
+        return False
+    return verify_merkle_proof(tx_proof['tx'], tx_proof['proof'],
+                               block.get('merkle_root'))
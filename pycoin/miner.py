@@ -0,0 +1,39 @@
+import threading
+import time
+import traceback
+
+from pycoin.exceptions import StaleBlockError
+
+
+class MinerThread(threading.Thread):
+    """
+    Takes batches of ``Blockchain.TX_PER_BLOCK`` transactions from the
+    mempool and turns them into blocks, away from the request handlers.
+    """
+
+    def __init__(self, blockchain, poll_interval=1.0):
+        super().__init__(name='pycoin-miner', daemon=True)
+        self.blockchain = blockchain
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            _start = time.time()
+            try:
+                block = self.blockchain.mine_pending(
+                    timeout=self.poll_interval)
+            except StaleBlockError:
+                # another node's block got in first, its transactions are
+                # back in the mempool
+                print('Dropped a block mined on a stale tip')
+                continue
+            except Exception:
+                traceback.print_exc()
+                continue
+            if block is not None:
+                print('Generated block {} in {} seconds'.format(
+                    block['index'], time.time() - _start))
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,50 +1,22 @@
-import click
-import flask
-
-from pycoin.blockchain import Blockchain
-from pycoin.consts import Network
-from pycoin.exceptions import PyCoinException
-
-app = flask.Flask(__name__)
-blockchain = Blockchain()
-
-
-@app.route('/blockchain/block_count')
-def block_count():
-    return flask.jsonify({
-        'block_count': blockchain.get_block_count()
-    })
+import getpass
+import os.path
+import sys
 
+import click
 
-@app.route('/blockchain/blocks')
-def filter_blocks():
-    start_index = flask.request.args.get('start')
-    end_index = flask.request.args.get('end')
-    verbose = flask.request.args.get('verbose', False)
-    return flask.jsonify(
-        blockchain.get_blocks(start_index, end_index, verbose=verbose))
+from pycoin.consts import InitialCapital, Network
+from pycoin.persistence import DB_MODES, STORAGE_BACKENDS, get_storage
+from pycoin.pow.backends import MINING_BACKENDS, get_mining_backend
 
+# flask, cryptography and the database are only loaded by the commands
+# needing them, which keeps the CLI startup cheap
 
-@app.route('/tx/submit', methods=['post'])
-def submit_transaction():
-    post_data = flask.request.form
-    from_addr = post_data.get('from')
-    to_addr = post_data.get('to')
-    amount = float(post_data.get('amount'))
-    signature = post_data.get('signature')
-    public_key = post_data.get('public_key')
-    ts = float(post_data.get('ts'))
-    try:
-        blockchain.submit_transaction(from_addr, to_addr, amount, ts, signature,
-                                      public_key)
-    except PyCoinException as err:
-        return flask.Response(repr(err), status=400)
-    return 'Submitted'
 
+def create_blockchain(db_path=None, mining_backend=None, storage='sqlite',
+                      db_mode=DB_MODES[0]):
+    from pycoin.blockchain import Blockchain
 
-@app.route('/wallets/info/<address>')
-def wallet_info(address):
-    return flask.jsonify(blockchain.get_address_info(address))
+    return Blockchain(mining_backend, get_storage(storage, db_path, db_mode))
 
 
 @click.group()
@@ -53,8 +25,188 @@ def cli():
 
 
 @cli.command('start')
-def start_node():
-    app.run('0.0.0.0', Network.NODE_PORT, debug=True)
+@click.option('--miner', type=click.Choice(MINING_BACKENDS), default='serial')
+@click.option('--workers', type=click.INT, default=None,
+              help='Number of mining processes (multiprocess miner only)')
+@click.option('--port', type=click.INT, default=Network.NODE_PORT)
+@click.option('--peer', 'peers', multiple=True,
+              help='host:port of a node to exchange blocks and transactions '
+                   'with, can be repeated')
+@click.option('--db', 'db_path', default=None,
+              help='Path of the blockchain database, or directory of the '
+                   'block files')
+@click.option('--storage', type=click.Choice(STORAGE_BACKENDS),
+              default='sqlite')
+@click.option('--db-mode', type=click.Choice(DB_MODES), default=DB_MODES[0],
+              help='Journal mode of the sqlite database: wal lets API reads '
+                   'run while blocks are written, safe syncs every commit')
+@click.option('--threads', type=click.INT, default=None,
+              help='Serve the API with waitress and this many threads, '
+                   'instead of the Flask development server')
+@click.option('--debug', is_flag=True,
+              help='Run the Flask development server in debug mode, only '
+                   'reachable from this machine')
+def start_node(miner, workers, port, peers, db_path, storage, db_mode,
+               threads, debug):
+    from pycoin.api import create_app
+    from pycoin.miner import MinerThread
+    from pycoin.peers import PeerManager
+
+    blockchain = create_blockchain(
+        db_path, get_mining_backend(miner, workers), storage, db_mode)
+    peer_manager = PeerManager(blockchain, peers)
+    peer_manager.request_sync()
+    MinerThread(blockchain).start()
+    app = create_app(blockchain, peer_manager)
+    serve(app, port, threads, debug)
+
+
+def serve(app, port, threads=None, debug=False):
+    """
+    Serves the API from this process: its threads share the chain, which
+    takes one writer at a time (the miner, or a block received from a peer)
+    and any number of readers.
+    """
+    if threads is None:
+        # the debugger runs any code sent to it, it must not be reachable
+        # from the network. The reloader would run a second node process,
+        # with its own miner
+        app.run('127.0.0.1' if debug else '0.0.0.0', port, debug=debug,
+                use_reloader=False)
+        return
+    try:
+        import waitress
+    except ImportError:
+        click.echo(click.style(
+            'waitress is not installed: pip install pycoin[node]', fg='red'))
+        sys.exit(1)
+    # HTTP/1.1 connections are kept alive between requests
+    waitress.serve(app, host='0.0.0.0', port=port, threads=threads,
+                   max_request_body_size=Network.MAX_REQUEST_SIZE)
+
+
+@cli.command('sync')
+@click.option('--peer', 'peers', multiple=True, required=True,
+              help='host:port of a node to download blocks from, can be '
+                   'repeated')
+@click.option('--db', 'db_path', default=None,
+              help='Path of the blockchain database, or directory of the '
+                   'block files')
+@click.option('--storage', type=click.Choice(STORAGE_BACKENDS),
+              default='sqlite')
+@click.option('--db-mode', type=click.Choice(DB_MODES), default=DB_MODES[0],
+              help='Journal mode of the sqlite database: wal lets API reads '
+                   'run while blocks are written, safe syncs every commit')
+def sync_chain(peers, db_path, storage, db_mode):
+    """
+    Downloads the blocks the peers have beyond the local chain and exits.
+    """
+    from pycoin.peers import PeerManager
+
+    report = PeerManager(create_blockchain(db_path, storage=storage,
+                                           db_mode=db_mode),
+                         peers).sync()
+    rate = report.blocks / report.elapsed if report.elapsed else 0
+    click.echo('Synced {} blocks in {:.2f} seconds ({:.1f} blocks/sec)'.format(
+        report.blocks, report.elapsed, rate))
+    click.echo('Chain height: {}'.format(report.height))
+
+
+@cli.command('verify')
+@click.option('--workers', type=click.INT, default=None,
+              help='Number of verification processes')
+@click.option('--full', is_flag=True,
+              help='Verify the whole chain, ignoring the last checkpoint')
+@click.option('--db', 'db_path', default=None,
+              help='Path of the blockchain database, or directory of the '
+                   'block files')
+@click.option('--storage', type=click.Choice(STORAGE_BACKENDS),
+              default='sqlite')
+def verify_chain(workers, full, db_path, storage):
+    from pycoin.verifier import ChainVerifier
+
+    checkpoint_path = None
+    if db_path is not None:
+        # the checkpoint belongs to the database next to it
+        checkpoint_path = os.path.join(
+            os.path.dirname(os.path.normpath(db_path)), 'verified.json')
+    blockchain = create_blockchain(db_path, storage=storage)
+    report = ChainVerifier(blockchain, workers,
+                           checkpoint_path).verify(full=full)
+    rate = report.blocks / report.elapsed if report.elapsed else 0
+    click.echo('Verified {} blocks in {:.2f} seconds ({:.1f} blocks/sec)'.format(
+        report.blocks, report.elapsed, rate))
+    if report.error is not None:
+        click.echo(click.style('Block {} is invalid: {}'.format(
+            report.error.index, repr(report.error)), fg='red'))
+        sys.exit(1)
+    click.echo(click.style('Chain is valid up to block {}'.format(
+        report.last_index), fg='green'))
+
+
+@cli.command('loadtest')
+@click.option('--node', default='127.0.0.1:{}'.format(Network.NODE_PORT))
+@click.option('--endpoint', 'endpoints', multiple=True,
+              type=click.Choice(['wallets', 'blocks', 'submit']),
+              help='Endpoint to load, can be repeated (default: all)')
+@click.option('--concurrency', type=click.INT, default=8,
+              help='Number of clients sending requests at once')
+@click.option('--duration', type=click.FLOAT, default=10,
+              help='Seconds spent on each endpoint')
+@click.option('--address', default=InitialCapital.INITIAL_OWNERS[0],
+              help='Address looked up by /wallets/info, and receiving the '
+                   'submitted transactions')
+@click.option('--wallet', 'wallet_name', default=None,
+              help='Wallet signing the submitted transactions, a new one '
+                   'without funds (all its transactions are rejected) if '
+                   'not given')
+@click.option('--transactions', 'tx_count', type=click.INT, default=200,
+              help='Number of transactions signed ahead of the submit test')
+def load_test(node, endpoints, concurrency, duration, address, wallet_name,
+              tx_count):
+    """
+    Reports the requests per second and latency percentiles of a running
+    node's API.
+    """
+    from pycoin.loadtest import LoadTester, get_percentile
+    from pycoin.wallet import WalletManager
+
+    tester = LoadTester(node, concurrency, duration)
+    for endpoint in endpoints or LoadTester.ENDPOINTS:
+        if endpoint == 'wallets':
+            requests = tester.wallet_requests(address)
+        elif endpoint == 'blocks':
+            requests = tester.block_requests()
+        else:
+            if wallet_name is not None:
+                wallet = WalletManager.get_wallet(wallet_name)
+                if not wallet:
+                    sys.exit(-1)
+                password = getpass.getpass('Wallet password: ')
+            else:
+                wallet = WalletManager.create_wallet('loadtest')
+                password = 'loadtest'
+            # the key is decrypted once for all the transactions
+            try:
+                wallet.unlock(password)
+            except ValueError as e:
+                click.echo(click.style(str(e), fg='red'))
+                sys.exit(-1)
+            click.echo('Signing {} transactions'.format(tx_count))
+            try:
+                transactions = [wallet.create_tx(address, 0.0001)
+                                for _ in range(tx_count)]
+            finally:
+                wallet.lock()
+            requests = tester.submit_requests(transactions)
+        report = tester.run(endpoint, requests)
+        rate = report.requests / report.elapsed if report.elapsed else 0
+        click.echo(
+            '{}: {} requests ({} errors) in {:.2f} seconds, {:.1f} req/sec, '
+            'latency p50 {:.1f}ms p90 {:.1f}ms p99 {:.1f}ms'.format(
+                endpoint, report.requests, report.errors, report.elapsed,
+                rate, *(get_percentile(report.latencies, percent) * 1000
+                        for percent in (50, 90, 99))))
 
 
 if __name__ == '__main__':
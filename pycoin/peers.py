@@ -0,0 +1,211 @@
+import collections
+import concurrent.futures
+import http.client
+import threading
+import time
+import traceback
+
+from pycoin.cache import LRUCache
+from pycoin.client import BlockchainHttpClient
+from pycoin.exceptions import OrphanBlockError, PyCoinException
+from pycoin.mempool import get_tx_id
+
+SyncReport = collections.namedtuple('SyncReport',
+                                    ['blocks', 'elapsed', 'height'])
+
+
+class PeerManager(object):
+    """
+    Keeps a node in sync with a fixed list of peers, given as
+    ``host:port`` strings.
+
+    New transactions and blocks, mined here or received from a peer, are
+    gossiped to every peer. Transaction ids and block hashes already seen are
+    remembered, so an item goes around the network only once.
+
+    A node missing blocks (when starting, or when a peer announces a block
+    further than its tip) downloads them from all the peers at once: the
+    missing range is split in ``SYNC_RANGE_SIZE`` block requests, spread
+    over the peers, with up to ``SYNC_WINDOW`` requests in flight while the
+    blocks already received are validated and appended in order.
+    """
+    SEEN_CACHE_SIZE = 100000
+    SYNC_RANGE_SIZE = 100
+    SYNC_WINDOW = 8
+    GOSSIP_WORKERS = 8
+    REQUEST_TIMEOUT = 10
+
+    def __init__(self, blockchain, peers=()):
+        self.blockchain = blockchain
+        self.peers = list(peers)
+        # no retries, an unreachable peer's requests go to the other peers
+        self.clients = {peer: BlockchainHttpClient(peer, self.REQUEST_TIMEOUT,
+                                                   retries=0)
+                        for peer in self.peers}
+        self.seen = LRUCache(self.SEEN_CACHE_SIZE)
+        self.gossip_pool = concurrent.futures.ThreadPoolExecutor(
+            self.GOSSIP_WORKERS)
+        self.sync_pool = concurrent.futures.ThreadPoolExecutor(
+            self.SYNC_WINDOW)
+        self._sync_lock = threading.Lock()
+        blockchain.tx_listeners.append(self.broadcast_tx)
+        blockchain.block_listeners.append(self.broadcast_block)
+
+    def is_seen(self, key):
+        return self.seen.get(key) is not None
+
+    def broadcast_tx(self, tx_data):
+        self.broadcast(get_tx_id(tx_data), 'send_tx', tx_data)
+
+    def broadcast_block(self, block_data):
+        self.broadcast(block_data['hash'], 'send_block', block_data)
+
+    def broadcast(self, key, method, data):
+        if self.is_seen(key):
+            return
+        self.seen.put(key, True)
+        for client in self.clients.values():
+            self.gossip_pool.submit(self.send, client, method, data)
+
+    def send(self, client, method, data):
+        try:
+            getattr(client, method)(data)
+        except (PyCoinException, http.client.HTTPException, OSError):
+            # the peer either rejected the item or is unreachable, it will
+            # catch up through a later block download
+            pass
+
+    def receive_tx(self, tx_data):
+        """
+        Queues a transaction gossiped by a peer. The blockchain's listener
+        forwards it to the other peers once it is accepted.
+        """
+        if self.is_seen(get_tx_id(tx_data)):
+            return 'known'
+        self.blockchain.submit_transaction(
+            tx_data['from'], tx_data['to'], float(tx_data['amount']),
+            float(tx_data['ts']), tx_data['signature'], tx_data['public_key'],
+            self.blockchain.force_fee(tx_data.get('fee')),
+            tx_data.get('key_type'))
+        return 'accepted'
+
+    def receive_block(self, block_data):
+        """
+        Adds a block gossiped by a peer. A block whose parent is unknown
+        starts a block download.
+        """
+        if self.is_seen(block_data['hash']):
+            return 'known'
+        try:
+            self.blockchain.add_block(block_data)
+        except OrphanBlockError:
+            self.request_sync()
+            return 'syncing'
+        return 'accepted'
+
+    def request_sync(self):
+        """
+        Starts a block download in the background, unless one is running.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._run_sync, name='pycoin-sync',
+                         daemon=True).start()
+
+    def _run_sync(self):
+        try:
+            self._sync()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """
+        Downloads the blocks the peers have beyond the local chain. Returns a
+        :class:`SyncReport`.
+        """
+        with self._sync_lock:
+            return self._sync()
+
+    def _sync(self):
+        _start = time.time()
+        heights = self.get_peer_heights()
+        start = self.blockchain.get_block_count()
+        height = max(heights.values(), default=0)
+        added = 0
+        step = self.SYNC_RANGE_SIZE
+        while height > start:
+            try:
+                added = self.download_blocks(start, height, heights)
+                break
+            except OrphanBlockError:
+                # the peers are on another branch, look further back for
+                # the block it forks from
+                if start <= 1:
+                    raise
+                start = max(1, start - step)
+                step *= 2
+        return SyncReport(blocks=added, elapsed=time.time() - _start,
+                          height=self.blockchain.get_block_count())
+
+    def get_peer_heights(self):
+        heights = {}
+        counts = self.sync_pool.map(self.get_peer_height, self.peers)
+        for peer, count in zip(self.peers, counts):
+            if count is not None:
+                heights[peer] = count
+        return heights
+
+    def get_peer_height(self, peer):
+        try:
+            return self.clients[peer].get_block_count()
+        except (PyCoinException, http.client.HTTPException, OSError, ValueError):
+            return None
+
+    def download_blocks(self, start, height, heights):
+        ranges = iter(range(start, height, self.SYNC_RANGE_SIZE))
+        in_flight = collections.deque()
+
+        def request_next():
+            range_start = next(ranges, None)
+            if range_start is None:
+                return
+            count = min(self.SYNC_RANGE_SIZE, height - range_start)
+            # peers holding the whole range, taking turns
+            sources = [peer for peer, peer_height in heights.items()
+                       if peer_height >= range_start + count]
+            turn = (range_start - start) // self.SYNC_RANGE_SIZE % len(sources)
+            in_flight.append(self.sync_pool.submit(
+                self.fetch_range, sources[turn:] + sources[:turn],
+                range_start, count))
+
+        for _ in range(self.SYNC_WINDOW):
+            request_next()
+        added = 0
+        while in_flight:
+            blocks = in_flight.popleft().result()
+            request_next()
+            for block_data in blocks:
+                # downloaded blocks are not gossiped
+                self.seen.put(block_data['hash'], True)
+                self.blockchain.add_block(block_data)
+                added += 1
+        return added
+
+    def fetch_range(self, sources, start, count):
+        """
+        Fetches a range of blocks from the first of ``sources`` answering.
+        """
+        error = None
+        for peer in sources:
+            try:
+                blocks = self.clients[peer].get_block_range(start, count)
+            except (PyCoinException, http.client.HTTPException, OSError,
+                    ValueError) as err:
+                error = err
+                continue
+            if len(blocks) == count:
+                return blocks
+        raise PyCoinException('Could not download blocks {}-{}: {!r}'.format(
+            start, start + count - 1, error))
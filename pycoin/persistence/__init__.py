@@ -0,0 +1,21 @@
+from pycoin.consts import Paths
+
+STORAGE_BACKENDS = ('sqlite', 'blockfile')
+# see pycoin.persistence.models.DB_MODES, the first one is the default
+DB_MODES = ('wal', 'safe')
+
+
+def get_storage(name, path=None, db_mode=DB_MODES[0]):
+    """
+    Opens a block storage. ``path`` is the database file for ``sqlite`` and
+    the directory of the block files for ``blockfile``. ``db_mode`` only
+    applies to ``sqlite``.
+    """
+    # the storages are only imported when used, peewee is slow to load
+    if name == 'sqlite':
+        from pycoin.persistence.sqlite import SqliteStorage
+        return SqliteStorage(path or Paths.BLOCKCHAIN_DB, db_mode)
+    elif name == 'blockfile':
+        from pycoin.persistence.blockfile import BlockFileStorage
+        return BlockFileStorage(path or Paths.BLOCKFILE_DIR)
+    raise ValueError('Unknown storage: {}'.format(name))
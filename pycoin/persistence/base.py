@@ -0,0 +1,69 @@
+class BlockStorage(object):
+    """
+    Stores the blocks of the main chain, in index order, along with the
+    lookups the node needs: transaction to block, address history and
+    balances. Blocks are handled as the dicts described in
+    ``pycoin.blockchain``.
+    """
+    name = None
+
+    def get_block_count(self):
+        raise NotImplementedError()
+
+    def get_blocks(self, start_index, end_index, verbose=True):
+        """
+        Returns the blocks with ``start_index <= index < end_index``. Without
+        ``verbose``, transactions come without their signature and public
+        key.
+        """
+        raise NotImplementedError()
+
+    def iter_headers(self):
+        """
+        Yields ``(hash, previous_hash, index, timestamp, target)`` for every
+        block, in index order.
+        """
+        raise NotImplementedError()
+
+    def append_block(self, block_data):
+        raise NotImplementedError()
+
+    def delete_blocks(self, start_index):
+        """
+        Deletes the blocks with ``index >= start_index``.
+        """
+        raise NotImplementedError()
+
+    def get_tx_block(self, tx_id):
+        """
+        Returns the index of the block holding a transaction, or ``None``.
+        """
+        raise NotImplementedError()
+
+    def get_address_history(self, address):
+        """
+        Returns the transactions and rewards of an address as
+        ``{'received': amount, 'from': ..., 'ts': ...}``,
+        ``{'sent': amount, 'to': ..., 'ts': ...[, 'fee': ...]}`` or
+        ``{'reward': amount, 'ts': ...}`` dicts, oldest first.
+        """
+        raise NotImplementedError()
+
+    def get_address_history_page(self, address, limit, before=None):
+        """
+        Returns the ``limit`` latest entries of :meth:`get_address_history`
+        positioned before ``before``, newest first, and the position of the
+        last one to continue from, ``None`` after the last page. Positions
+        are ``(ts, id)`` tuples, the id telling apart the entries of the
+        same timestamp.
+        """
+        raise NotImplementedError()
+
+    def get_balances(self):
+        """
+        Returns the ``address -> balance`` of every address of the chain.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
@@ -0,0 +1,284 @@
+"""
+Append-only block storage in segment files.
+
+::
+
+    <directory>/index.dat          one record per block, by block index:
+                                   segment (u32), offset (u64),
+                                   length (u32), hash (32)
+    <directory>/blocks00000.dat    segments of consecutive block records
+    <directory>/blocks00001.dat    ...
+
+Block records are those of ``pycoin.serialization.encode_block_record``,
+each written with its own key table so that any block can be decoded on its
+own. Segments are read through memory maps: the blocks of an index range
+are next to each other, so a range read is one slice of the mapped segment
+(or one per segment when the range spans several of them).
+
+Transaction and address lookups are kept in memory, rebuilt from the blocks
+when the storage is opened.
+"""
+import bisect
+import collections
+import io
+import mmap
+import os
+import struct
+import threading
+
+from pycoin import serialization
+from pycoin.consts import ensure_dir
+from pycoin.mempool import get_tx_fee, get_tx_id
+from pycoin.persistence.base import BlockStorage
+
+INDEX_RECORD = struct.Struct('>IQI32s')
+
+
+class BlockFileStorage(BlockStorage):
+    name = 'blockfile'
+    SEGMENT_SIZE = 128 * 1024 * 1024
+    # blocks decoded at once when scanning the whole chain
+    SCAN_PAGE_SIZE = 1000
+
+    def __init__(self, directory):
+        ensure_dir(directory)
+        self.directory = directory
+        # (segment, offset, length, hash) by block index
+        self._index = []
+        self._maps = {}
+        self._tx_blocks = {}
+        # address -> [(ts, id, block index, history entry)], sorted. The id
+        # of an entry comes from its place in the chain, see _index_block
+        self._history = collections.defaultdict(list)
+        self._lock = threading.RLock()
+        self._recover()
+        self._index_file = open(self.get_index_path(), 'ab')
+        self._segment_file = None
+        for block_data in self.scan_blocks():
+            self._index_block(block_data)
+
+    def get_index_path(self):
+        return os.path.join(self.directory, 'index.dat')
+
+    def get_segment_path(self, segment):
+        return os.path.join(self.directory,
+                            'blocks{:05d}.dat'.format(segment))
+
+    def _recover(self):
+        """
+        Loads the index, dropping what a crash in the middle of an append
+        left behind: a partial index record, index records pointing past the
+        end of their segment and segment data that isn't indexed.
+        """
+        index_path = self.get_index_path()
+        data = b''
+        if os.path.isfile(index_path):
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        sizes = {}
+        for position in range(0, len(data) - INDEX_RECORD.size + 1,
+                              INDEX_RECORD.size):
+            segment, offset, length, hash_ = INDEX_RECORD.unpack_from(
+                data, position)
+            if segment not in sizes:
+                path = self.get_segment_path(segment)
+                sizes[segment] = (os.path.getsize(path)
+                                  if os.path.isfile(path) else 0)
+            if offset + length > sizes[segment]:
+                break
+            self._index.append((segment, offset, length, hash_))
+        with open(index_path, 'ab') as f:
+            f.truncate(len(self._index) * INDEX_RECORD.size)
+        self._truncate_segments(*self._get_end())
+
+    def _get_end(self):
+        """
+        Returns the ``(segment, offset)`` right after the last block.
+        """
+        if not self._index:
+            return 0, 0
+        segment, offset, length, _ = self._index[-1]
+        return segment, offset + length
+
+    def _truncate_segments(self, segment, offset):
+        for position in list(self._maps):
+            if position >= segment:
+                self._maps.pop(position).close()
+        path = self.get_segment_path(segment)
+        if os.path.isfile(path):
+            with open(path, 'ab') as f:
+                f.truncate(offset)
+        segment += 1
+        while os.path.isfile(self.get_segment_path(segment)):
+            os.remove(self.get_segment_path(segment))
+            segment += 1
+
+    def get_block_count(self):
+        with self._lock:
+            return len(self._index)
+
+    def get_blocks(self, start_index, end_index, verbose=True):
+        with self._lock:
+            start_index = max(start_index, 0)
+            end_index = min(end_index, len(self._index))
+            blocks = []
+            position = start_index
+            while position < end_index:
+                segment, first_offset, _, _ = self._index[position]
+                last = position
+                while last + 1 < end_index and \
+                        self._index[last + 1][0] == segment:
+                    last += 1
+                _, offset, length, _ = self._index[last]
+                data = self._get_map(segment, offset + length)[
+                    first_offset:offset + length]
+                blocks.extend(serialization.read_block_records(
+                    io.BytesIO(data)))
+                position = last + 1
+        return [self._to_dict(block_data, verbose) for block_data in blocks]
+
+    def _to_dict(self, block_data, verbose):
+        # the same dicts as the sqlite storage
+        for item in block_data['data']:
+            if item['type'] == 'reward':
+                item.setdefault('block', None)
+            elif not verbose:
+                del item['signature']
+                del item['public_key']
+        return block_data
+
+    def _get_map(self, segment, size):
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < size:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self.get_segment_path(segment), 'rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map
+
+    def scan_blocks(self, verbose=True):
+        for start in range(0, self.get_block_count(), self.SCAN_PAGE_SIZE):
+            yield from self.get_blocks(start, start + self.SCAN_PAGE_SIZE,
+                                       verbose=verbose)
+
+    def iter_headers(self):
+        for index in range(self.get_block_count()):
+            with self._lock:
+                segment, offset, length, hash_ = self._index[index]
+                header = serialization.decode_header(io.BytesIO(
+                    self._get_map(segment, offset + length)[
+                        offset + serialization.COUNT.size:offset + length]))
+            yield (serialization.decode_hash(hash_), header['previous_hash'],
+                   header['index'], header['timestamp'], header.get('target'))
+
+    def append_block(self, block_data):
+        record = serialization.encode_block_record(block_data,
+                                                   serialization.KeyTable())
+        with self._lock:
+            if block_data['index'] != len(self._index):
+                raise ValueError('Expected block {}, got {}'.format(
+                    len(self._index), block_data['index']))
+            segment, offset = self._get_end()
+            if offset and offset + len(record) > self.SEGMENT_SIZE:
+                segment, offset = segment + 1, 0
+            if self._segment_file is None or \
+                    self._segment_file.name != self.get_segment_path(segment):
+                if self._segment_file is not None:
+                    self._segment_file.close()
+                self._segment_file = open(self.get_segment_path(segment), 'ab')
+            # the block is written before its index record: a crash in
+            # between leaves unindexed data, dropped when reopening
+            self._segment_file.write(record)
+            self._segment_file.flush()
+            hash_ = serialization.encode_hash(block_data['hash'])
+            self._index_file.write(INDEX_RECORD.pack(segment, offset,
+                                                     len(record), hash_))
+            self._index_file.flush()
+            self._index.append((segment, offset, len(record), hash_))
+            self._index_block(block_data)
+
+    def _index_block(self, block_data):
+        index = block_data['index']
+        for position, item in enumerate(block_data['data']):
+            # entries with the same timestamp are kept in block order
+            entry_id = (index << 32) | (position << 1)
+            if item['type'] == 'tx':
+                self._tx_blocks[get_tx_id(item)] = index
+                self._add_history(item['to'], entry_id, index, {
+                    'received': item['amount'], 'from': item['from'],
+                    'ts': item['ts']})
+                sent = {'sent': item['amount'], 'to': item['to'],
+                        'ts': item['ts']}
+                if item.get('fee'):
+                    sent['fee'] = item['fee']
+                self._add_history(item['from'], entry_id | 1, index, sent)
+            elif item['type'] == 'reward':
+                self._add_history(item['to'], entry_id, index, {
+                    'reward': item['amount'], 'ts': item['ts']})
+
+    def _add_history(self, address, entry_id, index, entry):
+        # blocks mostly come in time order, the entry then goes at the end
+        bisect.insort(self._history[address],
+                      (entry['ts'], entry_id, index, entry))
+
+    def delete_blocks(self, start_index):
+        with self._lock:
+            if start_index >= len(self._index):
+                return
+            deleted = self.get_blocks(start_index, len(self._index))
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+            del self._index[start_index:]
+            # the segments after the last kept block go away entirely
+            self._truncate_segments(*self._get_end())
+            self._index_file.truncate(len(self._index) * INDEX_RECORD.size)
+            for block_data in deleted:
+                for item in block_data['data']:
+                    if item['type'] == 'tx':
+                        self._tx_blocks.pop(get_tx_id(item), None)
+                    for address in (item.get('from'), item['to']):
+                        if address in self._history:
+                            self._history[address] = [
+                                entry for entry in self._history[address]
+                                if entry[2] < start_index]
+
+    def get_tx_block(self, tx_id):
+        with self._lock:
+            return self._tx_blocks.get(tx_id)
+
+    def get_address_history(self, address):
+        with self._lock:
+            return [dict(entry[3])
+                    for entry in self._history.get(address, [])]
+
+    def get_address_history_page(self, address, limit, before=None):
+        with self._lock:
+            history = self._history.get(address, [])
+            end = len(history)
+            if before is not None:
+                # the entry at ``before`` sorts after the (ts, id) pair
+                end = bisect.bisect_left(history, tuple(before))
+            page = history[max(0, end - limit):end][::-1]
+        last = page[-1][:2] if len(page) == limit else None
+        return [dict(entry[3]) for entry in page], last
+
+    def get_balances(self):
+        balances = collections.defaultdict(float)
+        for block_data in self.scan_blocks(verbose=False):
+            for item in block_data['data']:
+                if item['type'] == 'tx':
+                    balances[item['from']] -= (item['amount'] +
+                                               get_tx_fee(item))
+                balances[item['to']] += item['amount']
+        return balances
+
+    def close(self):
+        with self._lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
+            if self._segment_file is not None:
+                self._segment_file.close()
+            self._index_file.close()
@@ -1,9 +1,33 @@
+import collections
+import os.path
+import pathlib
+
 import peewee
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.pool import PooledSqliteDatabase
+
+from pycoin.consts import Paths, ensure_dir
 
-from pycoin.consts import Paths
+# opened by init_db. Every write goes through this single connection, shared
+# by the threads of the node, which Blockchain.write_lock takes turns on
+db = peewee.SqliteDatabase(None, thread_safe=False, check_same_thread=False)
+# read only connections to the same database, checked out by the readers for
+# the duration of a query, see pycoin.persistence.sqlite
+read_db = PooledSqliteDatabase(None, max_connections=16, timeout=10,
+                               check_same_thread=False)
 
-print(Paths.BLOCKCHAIN_DB)
-db = peewee.SqliteDatabase(Paths.BLOCKCHAIN_DB)
+DB_MODES = {
+    # the sqlite defaults: writers and readers lock each other out, every
+    # commit is synced to disk
+    'safe': {'journal_mode': 'delete', 'synchronous': 'full'},
+    # readers see the last commit while a block is being written, commits
+    # are only synced at checkpoints: a power loss may lose the last blocks,
+    # downloaded again from the peers
+    'wal': {'journal_mode': 'wal', 'synchronous': 'normal'},
+}
+DEFAULT_DB_MODE = 'wal'
+# per connection: 64MB page cache (in KiB when negative), 256MB mapped
+CACHE_PRAGMAS = {'cache_size': -64 * 1024, 'mmap_size': 256 * 1024 * 1024}
 
 
 class BaseModel(peewee.Model):
@@ -18,18 +42,52 @@ class Transaction(BaseModel):
     ts = peewee.FloatField()
     signature = peewee.CharField(max_length=1500)
     public_key = peewee.CharField(max_length=2000)
+    tx_hash = peewee.CharField(null=True, index=True)
+    # empty for transactions without a fee
+    fee = peewee.FloatField(null=True)
+    # empty for RSA keys
+    key_type = peewee.CharField(null=True)
+
+    def to_dict(self, full=True):
+        tx_dict = {
+            'type': 'tx',
+            'from': self.from_addr,
+            'to': self.to_addr,
+            'amount': self.amount,
+            'ts': self.ts,
+        }
+        if self.fee is not None:
+            tx_dict['fee'] = self.fee
+        if self.key_type is not None:
+            tx_dict['key_type'] = self.key_type
+        if full:
+            tx_dict.update({
+                'signature': self.signature,
+                'public_key': self.public_key
+            })
+        return tx_dict
 
 
 class Reward(BaseModel):
     REASON_MINE = 'mine'
     INITIAL_CAPITAL = 'initial'
 
-    to_addr = peewee.CharField()
+    to_addr = peewee.CharField(index=True)
     amount = peewee.FloatField()
     ts = peewee.FloatField()
     reason = peewee.CharField(choices=(INITIAL_CAPITAL, REASON_MINE))
     block = peewee.IntegerField(null=True)
 
+    def to_dict(self):
+        return {
+            'type': 'reward',
+            'to': self.to_addr,
+            'amount': self.amount,
+            'ts': self.ts,
+            'reason': self.reason,
+            'block': self.block
+        }
+
 
 class Block(BaseModel):
     index = peewee.IntegerField(primary_key=True)
@@ -37,45 +95,113 @@ class Block(BaseModel):
     previous_hash = peewee.CharField()
     nonce = peewee.IntegerField(default=0)
     ts = peewee.FloatField()
+    # hex encoded proof of work target, empty for blocks mined before
+    # targets were recorded
+    target = peewee.CharField(null=True)
+    # empty for version 1 blocks
+    version = peewee.IntegerField(null=True)
+    # from version 3
+    merkle_root = peewee.CharField(null=True)
 
-    def to_dict(self, verbose=True):
-        return {
+    def to_dict(self, verbose=True, data=None):
+        if data is None:
+            data = self.get_data_as_list(full=verbose)
+        block_dict = {
             'index': self.index,
             'hash': self.hash,
             'previous_hash': self.previous_hash,
             'nonce': self.nonce,
             'timestamp': self.ts,
-            'data': self.get_data_as_list(full=verbose)
+            'data': data
         }
+        if self.target is not None:
+            block_dict['target'] = self.target
+        if self.version is not None:
+            block_dict['version'] = self.version
+        if self.merkle_root is not None:
+            block_dict['merkle_root'] = self.merkle_root
+        return block_dict
 
     def get_data_as_list(self, full):
         data = []
         for item in self.data:
             if item.transaction is not None:
-                tx = item.transaction
-                tx_dict = {
-                    'type': 'tx',
-                    'from': tx.from_addr,
-                    'to': tx.from_addr,
-                    'amount': tx.amount,
-                    'ts': tx.ts,
-                }
-                if full:
-                    tx_dict.update({
-                        'signature': tx.signature,
-                        'public_key': tx.public_key
-                    })
-                data.append(tx_dict)
+                data.append(item.transaction.to_dict(full=full))
             else:
-                data.append({
-                    'type': 'reward',
-                    'to': item.reward.to_addr,
-                    'amount': item.reward.amount,
-                    'reason': item.reward.reason,
-                    'block': item.reward.block
-                })
+                data.append(item.reward.to_dict())
         return data
 
+    @classmethod
+    def range_to_dicts(cls, start_index, end_index, verbose=True,
+                       database=None):
+        """
+        Returns the blocks with ``start_index <= index < end_index`` as
+        dicts. Blocks, block data, transactions and rewards are each fetched
+        with a single query, whatever the size of the range. The queries run
+        on ``database`` when given.
+        """
+        database = database or cls._meta.database
+
+        def in_range(field):
+            return (field >= start_index) & (field < end_index)
+
+        tx_fields = [Transaction.id, Transaction.from_addr,
+                     Transaction.to_addr, Transaction.amount, Transaction.ts,
+                     Transaction.fee, Transaction.key_type]
+        if verbose:
+            tx_fields += [Transaction.signature, Transaction.public_key]
+        transactions = {
+            tx.id: tx for tx in
+            Transaction.select(*tx_fields)
+            .join(BlockData, on=(BlockData.transaction == Transaction.id))
+            .where(in_range(BlockData.block))
+            .bind(database)
+        }
+        rewards = {
+            reward.id: reward for reward in
+            Reward.select()
+            .join(BlockData, on=(BlockData.reward == Reward.id))
+            .where(in_range(BlockData.block))
+            .bind(database)
+        }
+        data = collections.defaultdict(list)
+        entries = (BlockData
+                   .select(BlockData.block, BlockData.transaction,
+                           BlockData.reward)
+                   .where(in_range(BlockData.block))
+                   .order_by(BlockData.id)
+                   .tuples()
+                   .bind(database))
+        for block_index, tx_id, reward_id in entries:
+            if tx_id is not None:
+                data[block_index].append(
+                    transactions[tx_id].to_dict(full=verbose))
+            else:
+                data[block_index].append(rewards[reward_id].to_dict())
+        return [block.to_dict(verbose=verbose, data=data[block.index])
+                for block in cls.select()
+                .where(in_range(cls.index))
+                .order_by(cls.index)
+                .bind(database)]
+
+    @classmethod
+    def delete_range(cls, start_index):
+        """
+        Deletes the blocks with ``index >= start_index``, with their
+        transactions and rewards, in one database transaction.
+        """
+        entries = BlockData.select().where(BlockData.block >= start_index)
+        with db.atomic():
+            Transaction.delete().where(Transaction.id.in_(
+                entries.select(BlockData.transaction))).execute()
+            Reward.delete().where(Reward.id.in_(
+                entries.select(BlockData.reward))).execute()
+            BlockData.delete().where(
+                BlockData.block >= start_index).execute()
+            AddressHistory.delete().where(
+                AddressHistory.block >= start_index).execute()
+            cls.delete().where(cls.index >= start_index).execute()
+
 
 class BlockData(BaseModel):
     block = peewee.ForeignKeyField(Block, related_name='data')
@@ -83,4 +209,135 @@ class BlockData(BaseModel):
     reward = peewee.ForeignKeyField(Reward, null=True)
 
 
-db.create_tables([Transaction, Reward, Block, BlockData], safe=True)
+class AddressHistory(BaseModel):
+    """
+    One row per address taking part in a transaction or reward, so that the
+    history of an address is read in time order from a single index.
+    """
+    RECEIVED = 'received'
+    SENT = 'sent'
+    REWARD = 'reward'
+
+    address = peewee.CharField()
+    ts = peewee.FloatField()
+    block = peewee.IntegerField(index=True)
+    direction = peewee.CharField(choices=(RECEIVED, SENT, REWARD))
+    amount = peewee.FloatField()
+    # the other address of a transaction
+    counterparty = peewee.CharField(null=True)
+    # paid by the sender
+    fee = peewee.FloatField(null=True)
+
+    class Meta:
+        indexes = (
+            (('address', 'ts'), False),
+        )
+
+    def to_dict(self):
+        if self.direction == self.RECEIVED:
+            return {'received': self.amount, 'from': self.counterparty,
+                    'ts': self.ts}
+        if self.direction == self.SENT:
+            entry = {'sent': self.amount, 'to': self.counterparty,
+                     'ts': self.ts}
+            if self.fee:
+                entry['fee'] = self.fee
+            return entry
+        return {'reward': self.amount, 'ts': self.ts}
+
+    @classmethod
+    def rows_for_block(cls, block_data):
+        rows = []
+        for item in block_data['data']:
+            if item['type'] == 'tx':
+                rows.append({'address': item['to'], 'ts': item['ts'],
+                             'block': block_data['index'],
+                             'direction': cls.RECEIVED,
+                             'amount': item['amount'],
+                             'counterparty': item['from'], 'fee': None})
+                rows.append({'address': item['from'], 'ts': item['ts'],
+                             'block': block_data['index'],
+                             'direction': cls.SENT, 'amount': item['amount'],
+                             'counterparty': item['to'],
+                             'fee': item.get('fee')})
+            elif item['type'] == 'reward':
+                rows.append({'address': item['to'], 'ts': item['ts'],
+                             'block': block_data['index'],
+                             'direction': cls.REWARD,
+                             'amount': item['amount'], 'counterparty': None,
+                             'fee': None})
+        return rows
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Fills the history from the stored transactions and rewards, for
+        databases created before it.
+        """
+        fields = [cls.address, cls.ts, cls.block, cls.direction, cls.amount,
+                  cls.counterparty, cls.fee]
+        with db.atomic():
+            cls.delete().execute()
+            cls.insert_from(
+                Transaction.select(Transaction.to_addr, Transaction.ts,
+                                   BlockData.block,
+                                   peewee.Value(cls.RECEIVED),
+                                   Transaction.amount, Transaction.from_addr,
+                                   peewee.Value(None))
+                .join(BlockData,
+                      on=(BlockData.transaction == Transaction.id)),
+                fields).execute()
+            cls.insert_from(
+                Transaction.select(Transaction.from_addr, Transaction.ts,
+                                   BlockData.block, peewee.Value(cls.SENT),
+                                   Transaction.amount, Transaction.to_addr,
+                                   Transaction.fee)
+                .join(BlockData,
+                      on=(BlockData.transaction == Transaction.id)),
+                fields).execute()
+            cls.insert_from(
+                Reward.select(Reward.to_addr, Reward.ts, BlockData.block,
+                              peewee.Value(cls.REWARD), Reward.amount,
+                              peewee.Value(None), peewee.Value(None))
+                .join(BlockData, on=(BlockData.reward == Reward.id)),
+                fields).execute()
+
+
+def migrate_schema():
+    """
+    Adds the columns introduced after a table was first created.
+    """
+    migrator = SqliteMigrator(db)
+    operations = []
+    for model in (Transaction, Reward, Block, BlockData, AddressHistory):
+        table = model._meta.table_name
+        if not db.table_exists(table):
+            continue
+        existing = {column.name for column in db.get_columns(table)}
+        for field in model._meta.sorted_fields:
+            if field.column_name not in existing:
+                operations.append(
+                    migrator.add_column(table, field.column_name, field))
+    if operations:
+        migrate(*operations)
+
+
+def init_db(path=Paths.BLOCKCHAIN_DB, mode=DEFAULT_DB_MODE):
+    """
+    Opens the node database, creating or upgrading its tables as needed,
+    and the pool of read only connections to it. ``mode`` is one of
+    ``DB_MODES``.
+    """
+    ensure_dir(os.path.dirname(path))
+    db.init(path, pragmas=dict(DB_MODES[mode], **CACHE_PRAGMAS))
+    migrate_schema()
+    new_history = not db.table_exists(AddressHistory._meta.table_name)
+    # also adds the indexes missing from tables created by older versions
+    db.create_tables([Transaction, Reward, Block, BlockData, AddressHistory],
+                     safe=True)
+    if new_history:
+        AddressHistory.rebuild()
+    # the journal mode is recorded in the database file, read only
+    # connections can't change it
+    read_db.init('{}?mode=ro'.format(pathlib.Path(path).resolve().as_uri()),
+                 uri=True, pragmas=CACHE_PRAGMAS)
@@ -0,0 +1,190 @@
+import collections
+import contextlib
+
+import peewee
+
+from pycoin.mempool import get_tx_id
+from pycoin.persistence.base import BlockStorage
+from pycoin.persistence.models import (DEFAULT_DB_MODE, AddressHistory,
+                                       Block, BlockData, Reward, Transaction,
+                                       db, init_db, read_db)
+
+
+class SqliteStorage(BlockStorage):
+    """
+    Stores blocks in the normalized tables of ``pycoin.persistence.models``.
+    Without a ``path``, uses the database already opened with ``init_db``.
+
+    Blocks are written through the single writer connection, reads check
+    out a read only connection from a pool for each call: in the ``wal``
+    mode, API requests don't wait for the block being written.
+    """
+    name = 'sqlite'
+    # rows per INSERT statement, keeps the bound parameters of a statement
+    # under sqlite's default limit of 999
+    INSERT_BATCH_SIZE = 100
+
+    def __init__(self, path=None, mode=DEFAULT_DB_MODE):
+        if path is not None:
+            init_db(path, mode)
+
+    @contextlib.contextmanager
+    def reading(self):
+        """
+        Holds a read only connection for the current thread, unless it
+        already has one. The queries made meanwhile run in one transaction,
+        so they all see the same blocks.
+        """
+        if not read_db.is_closed():
+            yield
+            return
+        read_db.connect()
+        try:
+            with read_db.atomic():
+                yield
+        finally:
+            read_db.close()
+
+    def get_block_count(self):
+        with self.reading():
+            return Block.select().bind(read_db).count()
+
+    def get_blocks(self, start_index, end_index, verbose=True):
+        with self.reading():
+            return Block.range_to_dicts(start_index, end_index,
+                                        verbose=verbose, database=read_db)
+
+    def iter_headers(self):
+        with self.reading():
+            yield from (Block.select(Block.hash, Block.previous_hash,
+                                     Block.index, Block.ts, Block.target)
+                        .order_by(Block.index).tuples().bind(read_db)
+                        .iterator())
+
+    def append_block(self, block_data):
+        transactions = []
+        rewards = []
+        # (kind, position in transactions or rewards) for every block entry
+        entries = []
+        for item in block_data['data']:
+            if item['type'] == 'tx':
+                entries.append(('tx', len(transactions)))
+                transactions.append({'from_addr': item['from'],
+                                     'to_addr': item['to'],
+                                     'amount': item['amount'],
+                                     'fee': item.get('fee'),
+                                     'key_type': item.get('key_type'),
+                                     'ts': item['ts'],
+                                     'signature': item['signature'],
+                                     'public_key': item['public_key'],
+                                     'tx_hash': get_tx_id(item)})
+            elif item['type'] == 'reward':
+                entries.append(('reward', len(rewards)))
+                rewards.append({'to_addr': item['to'],
+                                'amount': item['amount'],
+                                'ts': item['ts'],
+                                'reason': item['reason'],
+                                'block': item.get('block')})
+            else:
+                raise ValueError(
+                    'Invalid block data type: {}'.format(item['type']))
+        # the whole block is written in one transaction, so a failure never
+        # leaves a partially stored block behind
+        with db.atomic():
+            block = Block.create(index=block_data['index'],
+                                 previous_hash=block_data['previous_hash'],
+                                 hash=block_data['hash'],
+                                 ts=block_data['timestamp'],
+                                 nonce=block_data['nonce'],
+                                 target=block_data.get('target'),
+                                 version=block_data.get('version'),
+                                 merkle_root=block_data.get('merkle_root'))
+            tx_ids = self.insert_rows(Transaction, transactions)
+            reward_ids = self.insert_rows(Reward, rewards)
+            # relations between the block and its transactions and rewards
+            self.insert_rows(BlockData, [
+                {'block': block.index,
+                 'transaction': tx_ids[position] if kind == 'tx' else None,
+                 'reward': reward_ids[position] if kind == 'reward' else None}
+                for kind, position in entries
+            ])
+            self.insert_rows(AddressHistory,
+                             AddressHistory.rows_for_block(block_data))
+
+    def insert_rows(self, model, rows):
+        """
+        Bulk inserts ``rows`` and returns the ids they were given.
+        """
+        ids = []
+        for start in range(0, len(rows), self.INSERT_BATCH_SIZE):
+            batch = rows[start:start + self.INSERT_BATCH_SIZE]
+            last_id = model.insert_many(batch).execute()
+            # sqlite gives the rows of a single INSERT consecutive ids
+            ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+        return ids
+
+    def delete_blocks(self, start_index):
+        Block.delete_range(start_index)
+
+    def get_tx_block(self, tx_id):
+        with self.reading():
+            relation = (BlockData.select(BlockData.block)
+                        .join(Transaction)
+                        .where(Transaction.tx_hash == tx_id)
+                        .bind(read_db)
+                        .first())
+        if relation is None:
+            return None
+        return relation.block_id
+
+    def get_address_history(self, address):
+        # served by the (address, ts) index, which also orders by row id
+        query = (AddressHistory.select()
+                 .where(AddressHistory.address == address)
+                 .order_by(AddressHistory.ts, AddressHistory.id))
+        with self.reading():
+            return [entry.to_dict() for entry in query.bind(read_db)]
+
+    def get_address_history_page(self, address, limit, before=None):
+        query = AddressHistory.select().where(
+            AddressHistory.address == address)
+        if before is not None:
+            before_ts, before_id = before
+            query = query.where(
+                (AddressHistory.ts < before_ts) |
+                ((AddressHistory.ts == before_ts) &
+                 (AddressHistory.id < before_id)))
+        query = query.order_by(AddressHistory.ts.desc(),
+                               AddressHistory.id.desc()).limit(limit)
+        with self.reading():
+            rows = list(query.bind(read_db))
+        last = (rows[-1].ts, rows[-1].id) if len(rows) == limit else None
+        return [entry.to_dict() for entry in rows], last
+
+    def get_balances(self):
+        balances = collections.defaultdict(float)
+        received = (Transaction
+                    .select(Transaction.to_addr,
+                            peewee.fn.SUM(Transaction.amount))
+                    .group_by(Transaction.to_addr).tuples())
+        # fees are paid by the sender and go to nobody
+        sent = (Transaction
+                .select(Transaction.from_addr,
+                        peewee.fn.SUM(Transaction.amount + peewee.fn.COALESCE(
+                            Transaction.fee, 0)))
+                .group_by(Transaction.from_addr).tuples())
+        rewarded = (Reward
+                    .select(Reward.to_addr, peewee.fn.SUM(Reward.amount))
+                    .group_by(Reward.to_addr).tuples())
+        with self.reading():
+            for address, amount in received.bind(read_db):
+                balances[address] += amount
+            for address, amount in sent.bind(read_db):
+                balances[address] -= amount
+            for address, amount in rewarded.bind(read_db):
+                balances[address] += amount
+        return balances
+
+    def close(self):
+        read_db.close_all()
+        db.close()
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import queue
+
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork
+
+
+class MiningBackend(object):
+    """
+    Finds a nonce for a block. Implementations return ``(nonce, hash)``.
+    """
+    name = None
+
+    def search(self, block):
+        raise NotImplementedError()
+
+
+class SerialMiningBackend(MiningBackend):
+    name = 'serial'
+
+    def search(self, block):
+        return Sha256ProofOfWork(block).search_for_correct_hash()
+
+
+# state of a multiprocess mining worker, set by _init_worker
+_worker_pow = None
+_worker_stop_event = None
+
+
+def _init_worker(proof_of_work, stop_event):
+    global _worker_pow, _worker_stop_event
+    _worker_pow = proof_of_work
+    _worker_stop_event = stop_event
+
+
+def _search_chunk(chunk_index, chunk_size):
+    start = chunk_index * chunk_size
+    result = _worker_pow.search_range(start, start + chunk_size,
+                                      should_stop=_worker_stop_event.is_set)
+    return chunk_index, result
+
+
+class MultiprocessMiningBackend(MiningBackend):
+    """
+    Splits the nonce space in consecutive chunks of ``chunk_size`` nonces and
+    hands them out to a pool of ``workers`` processes. As soon as a chunk
+    yields a valid hash, the other workers are told to stop and the lowest
+    valid nonce of that chunk is returned.
+    """
+    name = 'multiprocess'
+    DEFAULT_CHUNK_SIZE = 2 ** 14
+
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def search(self, block):
+        proof_of_work = Sha256ProofOfWork(block)
+        stop_event = multiprocessing.Event()
+        results = queue.Queue()
+        pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                    initargs=(proof_of_work, stop_event))
+        try:
+            next_chunk = 0
+            for _ in range(self.workers):
+                pool.apply_async(_search_chunk, (next_chunk, self.chunk_size),
+                                 callback=results.put,
+                                 error_callback=results.put)
+                next_chunk += 1
+            while True:
+                completed = results.get()
+                if isinstance(completed, BaseException):
+                    raise completed
+                _, found = completed
+                if found is not None:
+                    return found
+                pool.apply_async(_search_chunk, (next_chunk, self.chunk_size),
+                                 callback=results.put,
+                                 error_callback=results.put)
+                next_chunk += 1
+        finally:
+            # terminating the pool can kill a worker while it holds the lock
+            # of the result queue, which hangs the pool for good. Stopped
+            # workers give up their chunk within STOP_CHECK_INTERVAL nonces
+            stop_event.set()
+            pool.close()
+            pool.join()
+
+
+MINING_BACKENDS = (SerialMiningBackend.name, MultiprocessMiningBackend.name)
+
+
+def get_mining_backend(name, workers=None):
+    if name == SerialMiningBackend.name:
+        return SerialMiningBackend()
+    elif name == MultiprocessMiningBackend.name:
+        return MultiprocessMiningBackend(workers)
+    raise ValueError('Unknown mining backend: {}'.format(name))
@@ -1,27 +1,109 @@
 import hashlib
 import json
-import re
+
+from pycoin import serialization
+from pycoin.consts import Difficulty
+
+
+def parse_target(target):
+    """
+    Blocks store their target as a hex string. Blocks mined before targets
+    were recorded have none and were mined against the initial target.
+    """
+    if target is None:
+        return Difficulty.INITIAL_TARGET
+    return int(target, 16)
+
+
+def format_target(target):
+    return '{:064x}'.format(target)
 
 
 class Sha256ProofOfWork(object):
-    regex = re.compile(r'^0{3}.*')
+    NONCE_PLACEHOLDER = '__pycoin_nonce__'
+    STOP_CHECK_INTERVAL = 1024
 
     def __init__(self, tx_data: dict):
         self.tx_data = tx_data
+        # version 1 blocks are hashed as sorted JSON, later versions in the
+        # compact binary encoding
+        self.binary = tx_data.get('version', 1) >= 2
+        self.target = parse_target(tx_data.get('target'))
+        # a hash is valid when, read as a big endian number, it is below the
+        # target, which for equal length byte strings is a plain comparison
+        self.target_bytes = self.target.to_bytes(32, 'big')
+        self.prefix = self.suffix = None
+
+    def get_block_template(self, block):
+        """
+        Serializes the block once, the same way :meth:`hash_block` does, and
+        splits the result around the nonce. Hashing ``prefix + nonce + suffix``
+        gives exactly the same digest as hashing the whole block.
+        """
+        if self.binary:
+            return serialization.get_hash_template(block)
+        data = block.copy()
+        data['nonce'] = self.NONCE_PLACEHOLDER
+        content = json.dumps(data, sort_keys=True)
+        placeholder = json.dumps(self.NONCE_PLACEHOLDER)
+        if content.count(placeholder) != 1:
+            raise ValueError('Nonce placeholder found in block content')
+        prefix, _, suffix = content.partition(placeholder)
+        return prefix.encode(), suffix.encode()
 
     def search_for_correct_hash(self):
-        current_nonce = 0
-        while True:
-            data = self.tx_data.copy()
-            data['nonce'] = current_nonce
-            current_hash = self.hash_block(data)
-            if self.hash_is_valid(current_hash):
-                return current_nonce, current_hash
+        return self.search_range(0)
+
+    def search_range(self, start, stop=None, should_stop=None):
+        """
+        Looks for a valid nonce in ``[start, stop)``. Returns ``(nonce, hash)``
+        for the lowest valid nonce in the range, or ``None`` if there is none
+        or ``should_stop()`` returned true while searching.
+        """
+        if self.prefix is None:
+            self.prefix, self.suffix = self.get_block_template(self.tx_data)
+        # the prefix (which holds most of the block data) goes through
+        # sha256 only once, every attempt continues from a copy of its state
+        midstate = hashlib.sha256(self.prefix)
+        suffix = self.suffix
+        target_bytes = self.target_bytes
+        if self.binary:
+            encode_nonce = serialization.NONCE.pack
+        else:
+            def encode_nonce(nonce):
+                return str(nonce).encode()
+        current_nonce = start
+        while stop is None or current_nonce < stop:
+            if should_stop is not None and \
+                    current_nonce % self.STOP_CHECK_INTERVAL == 0 and \
+                    should_stop():
+                return None
+            hasher = midstate.copy()
+            hasher.update(encode_nonce(current_nonce) + suffix)
+            digest = hasher.digest()
+            if digest < target_bytes:
+                return current_nonce, digest.hex()
             current_nonce += 1
+        return None
 
     def hash_block(self, block):
+        if block.get('version', 1) >= 2:
+            prefix, suffix = serialization.get_hash_template(block)
+            content = prefix + serialization.NONCE.pack(block['nonce']) + suffix
+            return hashlib.sha256(content).hexdigest()
         content = json.dumps(block, sort_keys=True)
         return hashlib.sha256(content.encode()).hexdigest()
 
     def hash_is_valid(self, current_hash):
-        return self.regex.match(current_hash) is not None
+        return bytes.fromhex(current_hash) < self.target_bytes
+
+    @classmethod
+    def verify(cls, block):
+        """
+        Checks that the stored hash of ``block`` matches its content and
+        satisfies the target recorded in the block itself.
+        """
+        content = {k: v for k, v in block.items() if k != 'hash'}
+        proof_of_work = cls(content)
+        return (proof_of_work.hash_block(content) == block['hash'] and
+                proof_of_work.hash_is_valid(block['hash']))
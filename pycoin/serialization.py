@@ -0,0 +1,390 @@
+"""
+Compact binary encoding of blocks, transactions and rewards.
+
+All the fields have a fixed width, except public keys and signatures which
+are length prefixed raw bytes. Inside a block (or a stream of blocks) the
+public key of a sender is written once, the following transactions of the
+same address only reference it.
+
+::
+
+    block     = header, hash (32), entry count (u32), entry...
+    header    = format version (u8), block version (u8), flags (u8),
+                index (u64), previous hash (32), timestamp (f64),
+                target (32), [merkle root (32)], nonce (u64)
+    tx        = 0x01, from (35), to (35), amount (f64), ts (f64),
+                public key, signature length (u16), signature
+              | 0x03, from (35), to (35), amount (f64), ts (f64), fee (f64),
+                public key, signature length (u16), signature
+    reward    = 0x02, to (35), amount (f64), ts (f64), reason (u8),
+                rewarded block (i64, -1 if none)
+    public key = 0x00 (referenced by the sender address)
+               | 0x01, length (u16), DER bytes (RSA)
+               | 0x02, length (u16), PEM bytes (RSA)
+               | 0x03, length (u16), raw bytes (ed25519)
+               | 0x04, length (u16), compressed point (secp256k1)
+
+The key type of a transaction is the one of its public key.
+
+Addresses are stored without their ``.py`` suffix. The JSON dicts used
+elsewhere stay the compatibility view of the same data: decoding an encoded
+dict gives back an equal dict.
+"""
+import base64
+import io
+import struct
+
+from pycoin.exceptions import ValidationError
+
+FORMAT_VERSION = 1
+
+ENTRY_TX = 0x01
+ENTRY_REWARD = 0x02
+# transactions paying a fee
+ENTRY_TX_WITH_FEE = 0x03
+
+KEY_REFERENCE = 0x00
+KEY_DER = 0x01
+KEY_PEM = 0x02
+KEY_ED25519 = 0x03
+KEY_SECP256K1 = 0x04
+
+# key kind and public key size of the key types with raw public keys
+RAW_KEY_TYPES = {
+    'ed25519': (KEY_ED25519, 32),
+    'secp256k1': (KEY_SECP256K1, 33),
+}
+RAW_KEY_KINDS = {kind: key_type
+                 for key_type, (kind, _) in RAW_KEY_TYPES.items()}
+
+FLAG_HAS_TARGET = 0x01
+FLAG_HAS_MERKLE_ROOT = 0x02
+
+ADDRESS_SUFFIX = '.py'
+ADDRESS_SIZE = 35
+HASH_SIZE = 32
+
+REWARD_REASONS = ('initial', 'mine')
+
+HEADER = struct.Struct('>BBBQ32sd32s')
+NONCE = struct.Struct('>Q')
+TX_FIELDS = struct.Struct('>35s35sdd')
+FEE = struct.Struct('>d')
+REWARD_FIELDS = struct.Struct('>35sddBq')
+LENGTH = struct.Struct('>H')
+COUNT = struct.Struct('>I')
+
+PEM_HEADER = b'-----BEGIN PUBLIC KEY-----\n'
+PEM_FOOTER = b'-----END PUBLIC KEY-----\n'
+PEM_LINE_SIZE = 64
+
+
+def encode_address(address):
+    if len(address) != ADDRESS_SIZE + len(ADDRESS_SUFFIX) or \
+            not address.endswith(ADDRESS_SUFFIX):
+        raise ValidationError('Invalid address: {}'.format(address))
+    return address[:ADDRESS_SIZE].encode('ascii')
+
+
+def decode_address(data):
+    return data.decode('ascii') + ADDRESS_SUFFIX
+
+
+def encode_hash(hex_hash):
+    # the genesis block has an empty previous hash
+    if not hex_hash:
+        return bytes(HASH_SIZE)
+    return bytes.fromhex(hex_hash)
+
+
+def decode_hash(data):
+    if data == bytes(HASH_SIZE):
+        return ''
+    return data.hex()
+
+
+def pem_to_der(pem):
+    """
+    Returns the DER bytes of a public key PEM, or ``None`` if the PEM would
+    not be rebuilt byte for byte by :func:`der_to_pem`.
+    """
+    if not pem.startswith(PEM_HEADER) or not pem.endswith(PEM_FOOTER):
+        return None
+    body = pem[len(PEM_HEADER):-len(PEM_FOOTER)]
+    try:
+        der = base64.b64decode(body.replace(b'\n', b''), validate=True)
+    except ValueError:
+        return None
+    if der_to_pem(der) != pem:
+        return None
+    return der
+
+
+def der_to_pem(der):
+    body = base64.b64encode(der)
+    lines = [body[i:i + PEM_LINE_SIZE]
+             for i in range(0, len(body), PEM_LINE_SIZE)]
+    return PEM_HEADER + b'\n'.join(lines) + b'\n' + PEM_FOOTER
+
+
+class KeyTable(object):
+    """
+    The public keys, with their key type, already written in a block or
+    stream, by address.
+    """
+
+    def __init__(self):
+        self.keys = {}
+
+
+def encode_public_key(address, public_key_hex, key_type, key_table, out):
+    if key_table.keys.get(address) == (public_key_hex, key_type):
+        out.write(bytes([KEY_REFERENCE]))
+        return
+    if key_type is not None:
+        if key_type not in RAW_KEY_TYPES:
+            raise ValidationError('Invalid key type: {}'.format(key_type))
+        kind, size = RAW_KEY_TYPES[key_type]
+        try:
+            raw = bytes.fromhex(public_key_hex)
+        except ValueError:
+            raw = b''
+        if len(raw) != size:
+            raise ValidationError('Invalid {} public key'.format(key_type))
+        key_table.keys[address] = (public_key_hex, key_type)
+        out.write(bytes([kind]) + LENGTH.pack(len(raw)) + raw)
+        return
+    key_table.keys[address] = (public_key_hex, key_type)
+    pem = bytes.fromhex(public_key_hex)
+    der = pem_to_der(pem)
+    if der is not None:
+        out.write(bytes([KEY_DER]) + LENGTH.pack(len(der)) + der)
+    else:
+        out.write(bytes([KEY_PEM]) + LENGTH.pack(len(pem)) + pem)
+
+
+def decode_public_key(address, key_table, stream):
+    """
+    Returns the ``(public key hex, key type)`` of a sender, the key type
+    being ``None`` for RSA keys.
+    """
+    kind = read(stream, 1)[0]
+    if kind == KEY_REFERENCE:
+        try:
+            return key_table.keys[address]
+        except KeyError:
+            raise ValueError('Unknown public key reference: {}'.format(
+                address))
+    raw = read(stream, read_struct(LENGTH, stream)[0])
+    key_type = None
+    if kind == KEY_DER:
+        public_key_hex = der_to_pem(raw).hex()
+    elif kind == KEY_PEM:
+        public_key_hex = raw.hex()
+    elif kind in RAW_KEY_KINDS:
+        public_key_hex = raw.hex()
+        key_type = RAW_KEY_KINDS[kind]
+    else:
+        raise ValueError('Invalid public key kind: {}'.format(kind))
+    key_table.keys[address] = (public_key_hex, key_type)
+    return public_key_hex, key_type
+
+
+def encode_tx(tx, key_table, out):
+    fee = tx.get('fee')
+    out.write(bytes([ENTRY_TX if fee is None else ENTRY_TX_WITH_FEE]))
+    out.write(TX_FIELDS.pack(encode_address(tx['from']),
+                             encode_address(tx['to']),
+                             tx['amount'], tx['ts']))
+    if fee is not None:
+        out.write(FEE.pack(fee))
+    encode_public_key(tx['from'], tx['public_key'], tx.get('key_type'),
+                      key_table, out)
+    signature = bytes.fromhex(tx['signature'])
+    out.write(LENGTH.pack(len(signature)) + signature)
+
+
+def decode_tx(key_table, stream, with_fee=False):
+    from_addr, to_addr, amount, ts = read_struct(TX_FIELDS, stream)
+    fee = read_struct(FEE, stream)[0] if with_fee else None
+    from_addr = decode_address(from_addr)
+    public_key, key_type = decode_public_key(from_addr, key_table, stream)
+    signature = read(stream, read_struct(LENGTH, stream)[0])
+    tx = {
+        'type': 'tx',
+        'from': from_addr,
+        'to': decode_address(to_addr),
+        'amount': amount,
+        'ts': ts,
+        'public_key': public_key,
+        'signature': signature.hex(),
+    }
+    if fee is not None:
+        tx['fee'] = fee
+    if key_type is not None:
+        tx['key_type'] = key_type
+    return tx
+
+
+def encode_reward(reward, out):
+    block = reward.get('block')
+    out.write(bytes([ENTRY_REWARD]))
+    out.write(REWARD_FIELDS.pack(encode_address(reward['to']),
+                                 reward['amount'], reward['ts'],
+                                 REWARD_REASONS.index(reward['reason']),
+                                 -1 if block is None else block))
+
+
+def decode_reward(stream):
+    to_addr, amount, ts, reason, block = read_struct(REWARD_FIELDS, stream)
+    reward = {
+        'type': 'reward',
+        'to': decode_address(to_addr),
+        'amount': amount,
+        'ts': ts,
+        'reason': REWARD_REASONS[reason],
+    }
+    if block >= 0:
+        reward['block'] = block
+    return reward
+
+
+def encode_entry(item, key_table, out):
+    if item['type'] == 'tx':
+        encode_tx(item, key_table, out)
+    elif item['type'] == 'reward':
+        encode_reward(item, out)
+    else:
+        raise ValueError('Invalid block data type: {}'.format(item['type']))
+
+
+def encode_entries(entries, key_table, out):
+    out.write(COUNT.pack(len(entries)))
+    for item in entries:
+        encode_entry(item, key_table, out)
+
+
+def decode_entries(key_table, stream):
+    entries = []
+    for _ in range(read_struct(COUNT, stream)[0]):
+        kind = read(stream, 1)[0]
+        if kind in (ENTRY_TX, ENTRY_TX_WITH_FEE):
+            entries.append(decode_tx(key_table, stream,
+                                     with_fee=kind == ENTRY_TX_WITH_FEE))
+        elif kind == ENTRY_REWARD:
+            entries.append(decode_reward(stream))
+        else:
+            raise ValueError('Invalid entry kind: {}'.format(kind))
+    return entries
+
+
+def encode_header(block):
+    """
+    Encodes the block fields other than its hash and data. The nonce comes
+    last, so that miners can hash everything before it only once.
+    """
+    target = block.get('target')
+    merkle_root = block.get('merkle_root')
+    flags = 0
+    if target is not None:
+        flags |= FLAG_HAS_TARGET
+    if merkle_root is not None:
+        flags |= FLAG_HAS_MERKLE_ROOT
+    header = HEADER.pack(FORMAT_VERSION, block.get('version', 1), flags,
+                         block['index'], encode_hash(block['previous_hash']),
+                         block['timestamp'],
+                         bytes.fromhex(target) if target is not None
+                         else bytes(HASH_SIZE))
+    if merkle_root is not None:
+        header += bytes.fromhex(merkle_root)
+    return header + NONCE.pack(block.get('nonce', 0))
+
+
+def decode_header(stream):
+    (format_version, version, flags, index, previous_hash, timestamp,
+     target) = read_struct(HEADER, stream)
+    if format_version != FORMAT_VERSION:
+        raise ValueError('Unsupported format version: {}'.format(
+            format_version))
+    block = {
+        'index': index,
+        'previous_hash': decode_hash(previous_hash),
+        'timestamp': timestamp,
+    }
+    if version != 1:
+        block['version'] = version
+    if flags & FLAG_HAS_TARGET:
+        block['target'] = target.hex()
+    if flags & FLAG_HAS_MERKLE_ROOT:
+        block['merkle_root'] = read(stream, HASH_SIZE).hex()
+    block['nonce'] = read_struct(NONCE, stream)[0]
+    return block
+
+
+def get_hash_template(block):
+    """
+    Returns the ``(prefix, suffix)`` around the nonce of the content hashed
+    for binary blocks. Version 2 blocks hash their header followed by their
+    data. From version 3, the header commits to the data through its Merkle
+    root and is hashed alone, whatever the size of the block.
+    """
+    header = encode_header(block)
+    if block.get('version', 1) >= 3:
+        return header[:-NONCE.size], b''
+    body = io.BytesIO()
+    encode_entries(block['data'], KeyTable(), body)
+    return header[:-NONCE.size], body.getvalue()
+
+
+def encode_block(block, key_table=None):
+    out = io.BytesIO()
+    out.write(encode_header(block))
+    out.write(encode_hash(block['hash']))
+    encode_entries(block['data'], key_table or KeyTable(), out)
+    return out.getvalue()
+
+
+def decode_block(data, key_table=None):
+    return read_block(io.BytesIO(data), key_table)
+
+
+def read_block(stream, key_table=None):
+    block = decode_header(stream)
+    block['hash'] = decode_hash(read(stream, HASH_SIZE))
+    block['data'] = decode_entries(key_table or KeyTable(), stream)
+    return block
+
+
+def encode_block_record(block, key_table):
+    """
+    Encodes a length prefixed block, as sent in binary block streams.
+    """
+    data = encode_block(block, key_table)
+    return COUNT.pack(len(data)) + data
+
+
+def read_block_records(stream):
+    """
+    Yields the blocks of a stream made of :func:`encode_block_record` records.
+    Public keys are shared across the whole stream.
+    """
+    key_table = KeyTable()
+    while True:
+        length = stream.read(COUNT.size)
+        if not length:
+            return
+        if len(length) < COUNT.size:
+            raise ValueError('Truncated block stream')
+        record = read(stream, COUNT.unpack(length)[0])
+        yield decode_block(record, key_table)
+
+
+def read(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError('Unexpected end of data')
+    return data
+
+
+def read_struct(fmt, stream):
+    return fmt.unpack(read(stream, fmt.size))
@@ -0,0 +1,87 @@
+import hashlib
+import json
+
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding
+from cryptography.hazmat.primitives.asymmetric.utils import (
+    decode_dss_signature, encode_dss_signature)
+
+from pycoin.cache import LRUCache
+from pycoin.exceptions import ValidationError
+from pycoin.wallet import (KEY_TYPE_ED25519, KEY_TYPE_RSA, KEY_TYPE_SECP256K1,
+                           SECP256K1_ORDER, KeySerializer, get_key_type)
+
+
+class SignatureVerifier(object):
+    """
+    Verifies transaction signatures, keeping the loaded public keys and the
+    signatures already found valid in LRU caches. Re-validating a known
+    signature is then a dict lookup instead of a signature verification.
+
+    Signatures are checked with the scheme of the key type: RSA-PSS,
+    Ed25519, or ECDSA over secp256k1 with low ``s`` values.
+    """
+    KEY_CACHE_SIZE = 1024
+    VERIFIED_CACHE_SIZE = 65536
+
+    def __init__(self, key_cache_size=KEY_CACHE_SIZE,
+                 verified_cache_size=VERIFIED_CACHE_SIZE):
+        self.keys = LRUCache(key_cache_size)
+        self.verified = LRUCache(verified_cache_size)
+
+    def load_public_key(self, public_key_hex, key_type=KEY_TYPE_RSA):
+        key = self.keys.get((key_type, public_key_hex))
+        if key is None:
+            key = KeySerializer.hex_to_pub_key(public_key_hex, key_type)
+            self.keys.put((key_type, public_key_hex), key)
+        return key
+
+    def verify(self, data, signature, public_key_hex, key_type=KEY_TYPE_RSA):
+        payload_hash = hashlib.sha256(
+            key_type.encode() + b'\0' + public_key_hex.encode() + b'\0' +
+            data).digest()
+        if self.verified.get((payload_hash, signature)):
+            return
+        try:
+            key = self.load_public_key(public_key_hex, key_type)
+            if key_type == KEY_TYPE_ED25519:
+                key.verify(signature, data)
+            elif key_type == KEY_TYPE_SECP256K1:
+                r, s = decode_dss_signature(signature)
+                if s > SECP256K1_ORDER // 2 or \
+                        encode_dss_signature(r, s) != signature:
+                    raise InvalidSignature()
+                key.verify(signature, data, ec.ECDSA(hashes.SHA256()))
+            else:
+                key.verify(
+                    signature, data, padding.PSS(
+                        mgf=padding.MGF1(hashes.SHA256()),
+                        salt_length=padding.PSS.MAX_LENGTH
+                    ),
+                    hashes.SHA256()
+                )
+        except (InvalidSignature, UnsupportedAlgorithm, ValueError,
+                TypeError):
+            raise ValidationError('Invalid signature')
+        self.verified.put((payload_hash, signature), True)
+
+    def verify_tx(self, tx_data):
+        """
+        Checks the signature of a transaction dict, made by the sender's
+        wallet over every field but ``type`` and ``signature``.
+        """
+        signed_data = {k: v for k, v in tx_data.items()
+                       if k not in ('type', 'signature')}
+        try:
+            signature = bytes.fromhex(tx_data['signature'])
+        except ValueError:
+            raise ValidationError('Invalid signature')
+        self.verify(json.dumps(signed_data, sort_keys=True).encode(),
+                    signature, tx_data['public_key'], get_key_type(tx_data))
+
+    def stats(self):
+        return {
+            'public_keys': self.keys.stats(),
+            'verified_signatures': self.verified.stats(),
+        }
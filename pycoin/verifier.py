@@ -0,0 +1,228 @@
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import os.path
+import time
+
+from pycoin.consts import Paths
+from pycoin.exceptions import ChainVerificationError, PyCoinException
+from pycoin.mempool import get_tx_fee, get_tx_id
+from pycoin.merkle import get_merkle_root
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork
+from pycoin.signatures import SignatureVerifier
+from pycoin.wallet import public_key_to_address
+
+VerificationReport = collections.namedtuple(
+    'VerificationReport', ['first_index', 'last_index', 'blocks', 'elapsed',
+                           'error'])
+
+# signature verifier of a verification worker process, see _check_block
+_signatures = None
+
+
+def get_block_content(block):
+    """
+    Rebuilds, from a stored block, the dict its hash was computed over.
+    """
+    content = {k: v for k, v in block.items() if k != 'hash'}
+    content['data'] = []
+    for item in block['data']:
+        if item['type'] == 'reward' and item.get('block') is None:
+            item = {k: v for k, v in item.items() if k != 'block'}
+        content['data'].append(item)
+    return content
+
+
+def _legacy_genesis_content(content):
+    # the genesis block used to be mined with integer initial capital
+    # amounts, which are read back from the database as floats
+    legacy = dict(content)
+    legacy['data'] = [dict(item, amount=int(item['amount']))
+                      if float(item['amount']).is_integer() else item
+                      for item in content['data']]
+    return legacy
+
+
+def _check_block(block):
+    """
+    Runs the checks that only need the block itself: hash, proof of work
+    and transaction signatures. Returns the reason the block is invalid, or
+    ``None``.
+    """
+    global _signatures
+    if _signatures is None:
+        _signatures = SignatureVerifier()
+    content = get_block_content(block)
+    proof_of_work = Sha256ProofOfWork(content)
+    if not proof_of_work.hash_is_valid(block['hash']):
+        return 'hash does not satisfy the block target'
+    if proof_of_work.hash_block(content) != block['hash']:
+        if block['index'] != 0 or proof_of_work.hash_block(
+                _legacy_genesis_content(content)) != block['hash']:
+            return 'hash does not match the block content'
+    if block.get('version', 1) >= 3 and \
+            get_merkle_root(block['data']) != block.get('merkle_root'):
+        return 'merkle root does not match the block data'
+    for item in block['data']:
+        if item['type'] != 'tx':
+            # only the genesis block mints coins
+            if block['index'] != 0:
+                return 'only the genesis block can hold {} entries'.format(
+                    item['type'])
+            continue
+        fee = get_tx_fee(item)
+        if not (math.isfinite(item['amount']) and item['amount'] > 0 and
+                math.isfinite(fee) and fee >= 0):
+            return 'invalid amount or fee for transaction from {} at {}'.format(
+                item['from'], item['ts'])
+        if public_key_to_address(item['public_key']) != item['from']:
+            return 'public key does not match the sender {}'.format(
+                item['from'])
+        try:
+            _signatures.verify_tx(item)
+        except PyCoinException as err:
+            return '{} for transaction from {} at {}'.format(
+                repr(err).lower(), item['from'], item['ts'])
+    return None
+
+
+class ChainVerifier(object):
+    """
+    Verifies the stored chain: block hashes, proof of work, links between
+    blocks, transaction signatures, balances and that no transaction is
+    confirmed twice.
+
+    Hash and signature checks run in parallel on ``workers`` processes, the
+    checks that depend on the previous blocks run in index order. The last
+    verified block is recorded in a checkpoint file, so the next run only
+    verifies the blocks added since.
+    """
+    BATCH_SIZE = 200
+    # allowed float rounding error when replaying balances
+    BALANCE_TOLERANCE = 1e-9
+
+    def __init__(self, blockchain, workers=None, checkpoint_path=None):
+        self.blockchain = blockchain
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            Paths.BLOCKCHAIN_DATA, 'verified.json')
+
+    def load_checkpoint(self):
+        if not os.path.isfile(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, index, hash_, balances, tx_ids):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'index': index, 'hash': hash_, 'balances': balances,
+                       'tx_ids': sorted(tx_ids)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def verify(self, full=False):
+        """
+        Verifies the blocks added since the last checkpoint, or the whole
+        chain if ``full`` is set. Returns a :class:`VerificationReport`;
+        its ``error`` is the :class:`ChainVerificationError` of the first
+        invalid block, if any.
+        """
+        checkpoint = None if full else self.load_checkpoint()
+        if checkpoint is not None and (
+                'tx_ids' not in checkpoint or
+                not self.is_on_chain(checkpoint)):
+            # the checkpoint block was rolled back by a reorganization, or
+            # the checkpoint predates the transaction ids
+            checkpoint = None
+        if checkpoint is None:
+            checkpoint = {'index': -1, 'hash': None, 'balances': {},
+                          'tx_ids': []}
+        last_index = checkpoint['index']
+        last_hash = checkpoint['hash']
+        balances = collections.defaultdict(float, checkpoint['balances'])
+        tx_ids = set(checkpoint['tx_ids'])
+        error = None
+        blocks = self.blockchain.iter_blocks(last_index, verbose=True)
+        _start = time.time()
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+            while error is None:
+                batch = list(itertools.islice(blocks, self.BATCH_SIZE))
+                if not batch:
+                    break
+                chunksize = max(1, len(batch) // (self.workers * 4))
+                reasons = pool.map(_check_block, batch, chunksize=chunksize)
+                for block, reason in zip(batch, reasons):
+                    try:
+                        if reason is not None:
+                            raise ChainVerificationError(block['index'],
+                                                         reason)
+                        self.check_link(block, last_index, last_hash)
+                        block_tx_ids = self.get_new_tx_ids(block, tx_ids)
+                        self.apply_balances(block, balances)
+                        tx_ids.update(block_tx_ids)
+                    except ChainVerificationError as err:
+                        error = err
+                        break
+                    last_index, last_hash = block['index'], block['hash']
+                self.save_checkpoint(last_index, last_hash, balances, tx_ids)
+        return VerificationReport(
+            first_index=checkpoint['index'] + 1, last_index=last_index,
+            blocks=last_index - checkpoint['index'],
+            elapsed=time.time() - _start, error=error)
+
+    def is_on_chain(self, checkpoint):
+        blocks = self.blockchain.get_blocks(checkpoint['index'],
+                                            checkpoint['index'] + 1)
+        return bool(blocks) and blocks[0]['hash'] == checkpoint['hash']
+
+    def check_link(self, block, last_index, last_hash):
+        if block['index'] != last_index + 1:
+            raise ChainVerificationError(
+                last_index + 1, 'block is missing')
+        if last_hash is None:
+            if block['previous_hash'] != '':
+                raise ChainVerificationError(
+                    block['index'], 'genesis block has a previous hash')
+        elif block['previous_hash'] != last_hash:
+            raise ChainVerificationError(
+                block['index'], 'previous hash does not match block {}'.format(
+                    last_index))
+
+    def get_new_tx_ids(self, block, tx_ids):
+        """
+        Returns the ids of the block's transactions, none of which may be
+        in ``tx_ids`` or twice in the block.
+        """
+        block_tx_ids = set()
+        for item in block['data']:
+            if item['type'] != 'tx':
+                continue
+            tx_id = get_tx_id(item)
+            if tx_id in tx_ids or tx_id in block_tx_ids:
+                raise ChainVerificationError(
+                    block['index'], 'transaction {} is confirmed twice'.format(
+                        tx_id))
+            block_tx_ids.add(tx_id)
+        return block_tx_ids
+
+    def apply_balances(self, block, balances):
+        # the block is applied only once all its transactions are checked,
+        # the balances must stay those of the last valid block
+        changes = collections.defaultdict(float)
+        for item in block['data']:
+            if item['type'] == 'tx':
+                available = balances[item['from']] + changes[item['from']]
+                spent = item['amount'] + get_tx_fee(item)
+                if available + self.BALANCE_TOLERANCE < spent:
+                    raise ChainVerificationError(
+                        block['index'],
+                        '{} spends more than its balance'.format(
+                            item['from']))
+                changes[item['from']] -= spent
+                changes[item['to']] += item['amount']
+            elif item['type'] == 'reward':
+                changes[item['to']] += item['amount']
+        for address, change in changes.items():
+            balances[address] += change
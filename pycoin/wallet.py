@@ -1,30 +1,72 @@
 import base64
+import csv
 import getpass
+import hashlib
+import http.client
 import json
 import os.path
 import pprint
 import re
+import threading
 import time
 import sys
-import urllib.request
 import urllib.parse
 
 import click
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
 
 from pycoin.client import BlockchainHttpClient
-from pycoin.consts import Paths, Network
+from pycoin.consts import Paths, Network, ensure_dir
 from pycoin.exceptions import ClientError
 from pycoin.validators import is_valid_address
 
+# RSA is the original key type: RSA wallets and their transactions have no
+# key_type field. Ed25519 and secp256k1 public keys are the hex of their raw
+# bytes (the compressed point for secp256k1) instead of a PEM
+KEY_TYPE_RSA = 'rsa'
+KEY_TYPE_ED25519 = 'ed25519'
+KEY_TYPE_SECP256K1 = 'secp256k1'
+KEY_TYPES = (KEY_TYPE_RSA, KEY_TYPE_ED25519, KEY_TYPE_SECP256K1)
+# order of the secp256k1 group. Of the two valid ECDSA signatures (r, s)
+# and (r, n - s) only the one with the lower s is accepted, a third party
+# can't then make another valid signature, and transaction id, of a
+# transaction
+SECP256K1_ORDER = int('FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFE'
+                      'BAAEDCE6AF48A03BBFD25E8CD0364141', 16)
+
+
+# transactions per request of `transaction create-batch`
+BATCH_SUBMIT_SIZE = 1000
+
+
+def get_key_type(tx_data):
+    return tx_data.get('key_type') or KEY_TYPE_RSA
+
+
+def public_key_to_address(public_key_hex):
+    data = hashlib.sha256(public_key_hex.encode()).digest()
+    return base64.urlsafe_b64encode(data)[:35].decode() + ".py"
+
 
 class Wallet(object):
-    def __init__(self, pub_key, priv_key, password=None):
+    """
+    Without a session, every signature decrypts the private key, which runs
+    the deliberately slow key derivation of its password. :meth:`unlock`
+    decrypts it once and keeps it in memory until :meth:`lock` is called,
+    or until no signature was made for ``idle_timeout`` seconds.
+    """
+    DEFAULT_IDLE_TIMEOUT = 5 * 60
+
+    def __init__(self, pub_key, priv_key, password=None,
+                 key_type=KEY_TYPE_RSA):
         self.pub_key = self.validate_is_hex(pub_key)
         self.priv_key = self.validate_is_hex(priv_key)
         self.password = password
+        self.key_type = key_type
+        self._session_key = None
+        self._idle_timeout = None
+        self._last_used = None
+        self._timer = None
+        self._session_lock = threading.Lock()
 
     def validate_is_hex(self, key):
         assert re.match(r'^[a-f0-9]+$', key) is not None
@@ -32,19 +74,76 @@ class Wallet(object):
 
     @property
     def address(self):
-        digest = hashes.Hash(hashes.SHA256(), backend=default_backend())
-        digest.update(self.pub_key.encode())
-        data = digest.finalize()
-        return base64.urlsafe_b64encode(data)[:35].decode() + ".py"
+        return public_key_to_address(self.pub_key)
 
     def to_dict(self):
         return {
             'public_key': self.pub_key,
             'private_key': self.priv_key,
-            'address': self.address
+            'address': self.address,
+            'key_type': self.key_type
         }
 
-    def create_tx(self, receiver_addr, amount):
+    @property
+    def is_unlocked(self):
+        with self._session_lock:
+            return self._session_key is not None
+
+    def unlock(self, password=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Decrypts the private key for the following signatures. Raises
+        ``ValueError`` for a wrong password.
+        """
+        password = password or self.password
+        if not password:
+            raise ValueError('Password is empty and cannot unlock wallet')
+        key = KeySerializer.hex_to_priv_key(self.priv_key, password)
+        with self._session_lock:
+            self._session_key = key
+            self._idle_timeout = idle_timeout
+            self._last_used = time.time()
+            self._schedule_lock(idle_timeout)
+
+    def lock(self):
+        """
+        Forgets the decrypted private key.
+        """
+        with self._session_lock:
+            self._session_key = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule_lock(self, delay):
+        # a single timer for the session, re-armed when it fires before
+        # the wallet was idle for long enough
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._lock_if_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _lock_if_idle(self):
+        with self._session_lock:
+            if self._session_key is None:
+                return
+            idle = time.time() - self._last_used
+            if idle >= self._idle_timeout:
+                self._session_key = None
+                self._timer = None
+            else:
+                self._schedule_lock(self._idle_timeout - idle)
+
+    def get_private_key(self):
+        with self._session_lock:
+            if self._session_key is not None:
+                self._last_used = time.time()
+                return self._session_key
+        if not self.password:
+            raise ValueError('Wallet is locked and has no password')
+        return KeySerializer.hex_to_priv_key(self.priv_key, self.password)
+
+    def create_tx(self, receiver_addr, amount, fee=None):
         tx_data = {
             'from': self.address,
             'to': receiver_addr,
@@ -52,17 +151,32 @@ class Wallet(object):
             'ts': time.time(),
             'public_key': self.pub_key
         }
-        if not self.password:
+        if fee:
+            tx_data['fee'] = fee
+        if self.key_type != KEY_TYPE_RSA:
+            tx_data['key_type'] = self.key_type
+        if not self.password and not self.is_unlocked:
             raise ValueError('Password is empty and cannot sign transaction')
         signature = self.sign(json.dumps(tx_data, sort_keys=True))
         tx_data['signature'] = signature.hex()
         return tx_data
 
     def sign(self, data):
+        # cryptography is slow to import, only load it when signing
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, padding
+        from cryptography.hazmat.primitives.asymmetric.utils import (
+            decode_dss_signature, encode_dss_signature)
+
         if isinstance(data, str):
             data = data.encode()
-        pub_key = KeySerializer.hex_to_pub_key(self.pub_key)
-        priv_key = KeySerializer.hex_to_priv_key(self.priv_key, self.password)
+        priv_key = self.get_private_key()
+        if self.key_type == KEY_TYPE_ED25519:
+            return priv_key.sign(data)
+        if self.key_type == KEY_TYPE_SECP256K1:
+            r, s = decode_dss_signature(
+                priv_key.sign(data, ec.ECDSA(hashes.SHA256())))
+            return encode_dss_signature(r, min(s, SECP256K1_ORDER - s))
         signature = priv_key.sign(data,
                                   padding.PSS(
                                       mgf=padding.MGF1(hashes.SHA256()),
@@ -73,8 +187,34 @@ class Wallet(object):
 
 
 class KeySerializer(object):
+    @classmethod
+    def generate_private_key(cls, key_type=KEY_TYPE_RSA):
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+        if key_type == KEY_TYPE_ED25519:
+            return ed25519.Ed25519PrivateKey.generate()
+        if key_type == KEY_TYPE_SECP256K1:
+            return ec.generate_private_key(ec.SECP256K1())
+        return rsa.generate_private_key(
+            65537, key_size=4096, backend=default_backend()
+        )
+
     @classmethod
     def pub_key_to_hex(cls, pub_key):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+        if isinstance(pub_key, ed25519.Ed25519PublicKey):
+            return pub_key.public_bytes(
+                encoding=serialization.Encoding.Raw,
+                format=serialization.PublicFormat.Raw
+            ).hex()
+        if isinstance(pub_key, ec.EllipticCurvePublicKey):
+            return pub_key.public_bytes(
+                encoding=serialization.Encoding.X962,
+                format=serialization.PublicFormat.CompressedPoint
+            ).hex()
         serialized = pub_key.public_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PublicFormat.SubjectPublicKeyInfo
@@ -83,6 +223,8 @@ class KeySerializer(object):
 
     @classmethod
     def priv_key_to_hex(cls, priv_key, password):
+        from cryptography.hazmat.primitives import serialization
+
         if isinstance(password, str):
             password = password.encode()
         encrypted_plain = priv_key.private_bytes(
@@ -93,14 +235,26 @@ class KeySerializer(object):
         return encrypted_plain.hex()
 
     @classmethod
-    def hex_to_pub_key(cls, pub_key):
+    def hex_to_pub_key(cls, pub_key, key_type=KEY_TYPE_RSA):
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
         pub_key_raw = bytes.fromhex(pub_key)
+        if key_type == KEY_TYPE_ED25519:
+            return ed25519.Ed25519PublicKey.from_public_bytes(pub_key_raw)
+        if key_type == KEY_TYPE_SECP256K1:
+            return ec.EllipticCurvePublicKey.from_encoded_point(
+                ec.SECP256K1(), pub_key_raw)
         pub_key_obj = serialization.load_pem_public_key(
             pub_key_raw, backend=default_backend())
         return pub_key_obj
 
     @classmethod
     def hex_to_priv_key(cls, priv_key, password):
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import serialization
+
         if isinstance(password, str):
             password = password.encode()
         priv_key_raw = bytes.fromhex(priv_key)
@@ -109,24 +263,55 @@ class KeySerializer(object):
         )
 
 
+def load_payouts(path):
+    """
+    Reads the payouts of a JSON file (an array of objects) or of a CSV file
+    (with a header line), both with ``to``, ``amount`` and optionally
+    ``fee`` fields. Returns ``(to, amount, fee)`` tuples and raises
+    ``ValueError`` on the first invalid payout.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError('Expected a JSON array of payouts')
+        else:
+            rows = list(csv.DictReader(f))
+    payouts = []
+    for position, row in enumerate(rows, 1):
+        try:
+            to_addr = row['to'].strip()
+            amount = float(row['amount'])
+            fee = float(row['fee']) if row.get('fee') not in (None, '') \
+                else None
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError('Malformed payout {}'.format(position))
+        if not is_valid_address(to_addr):
+            raise ValueError('Invalid address in payout {}: {}'.format(
+                position, to_addr))
+        payouts.append((to_addr, amount, fee))
+    return payouts
+
+
 class WalletManager(object):
     wallet_dir = os.path.join
 
     @classmethod
     def list_wallets(cls):
+        if not os.path.isdir(Paths.WALLET_DIR):
+            return []
         return os.listdir(Paths.WALLET_DIR)
 
     @classmethod
-    def create_wallet(cls, password):
+    def create_wallet(cls, password, key_type=KEY_TYPE_RSA):
         click.echo('Generating keys')
-        private_key = rsa.generate_private_key(
-            65537, key_size=4096, backend=default_backend()
-        )
+        private_key = KeySerializer.generate_private_key(key_type)
         public_key = private_key.public_key()
         wallet = Wallet(
             KeySerializer.pub_key_to_hex(public_key),
             KeySerializer.priv_key_to_hex(private_key, password),
-            password
+            password,
+            key_type
         )
         return wallet
 
@@ -143,7 +328,9 @@ class WalletManager(object):
             data = json.load(f)
         pub_key = data['public_key']
         priv_key = data['private_key']
-        return Wallet(pub_key, priv_key)
+        # wallets created before key types were RSA wallets
+        return Wallet(pub_key, priv_key,
+                      key_type=data.get('key_type', KEY_TYPE_RSA))
 
 
 @click.group()
@@ -157,19 +344,23 @@ def wallet_list():
     if not wallets:
         click.echo(click.style('No wallets found', fg='yellow'))
         sys.exit(-1)
-    for wallet in os.listdir(Paths.WALLET_DIR):
+    for wallet in wallets:
         click.echo(wallet)
 
 
 @cli.command('create')
 @click.argument('name')
-def wallet_create(name):
+@click.option('--key-type', type=click.Choice(KEY_TYPES), default=KEY_TYPE_RSA,
+              help='ed25519 and secp256k1 keys are generated, sign and '
+                   'verify much faster than RSA-4096 ones')
+def wallet_create(name, key_type):
     if WalletManager.wallet_exists(name):
         click.echo(click.style('Wallet already exists', fg='red'))
         sys.exit(-1)
     password = getpass.getpass('Password: ')
-    wallet = WalletManager.create_wallet(password)
+    wallet = WalletManager.create_wallet(password, key_type)
     click.echo('Writing to file')
+    ensure_dir(Paths.WALLET_DIR)
     with open(os.path.join(Paths.WALLET_DIR, name), 'w') as f:
         json.dump(wallet.to_dict(), f)
 
@@ -191,16 +382,18 @@ def wallet_inspect(name, node):
             data = json.load(f)
         click.echo(click.style('Wallet info', fg='yellow'))
         click.echo('address = {}'.format(data['address']))
+        click.echo('key type = {}'.format(
+            data.get('key_type', KEY_TYPE_RSA)))
         address = data['address']
     client = BlockchainHttpClient(node)
     try:
         data = client.get_balance(address)
-    except urllib.request.URLError as e:
+    except (OSError, http.client.HTTPException) as e:
         msg = 'Unable to contact node on {}: {}'.format(node, str(e))
         click.echo(click.style(msg, fg='red'))
         sys.exit(0)
     click.echo('balance = {}'.format(data['balance']))
-    click.echo('transactions:')
+    click.echo('latest transactions:')
     for tx in data['transactions']:
         if 'received' in tx:
             msg = '+ {} from {}'.format(tx['received'], tx['from'])
@@ -210,8 +403,12 @@ def wallet_inspect(name, node):
             color = 'green'
         else:
             msg = '- {} to {}'.format(tx['sent'], tx['to'])
+            if 'fee' in tx:
+                msg += ' (fee {})'.format(tx['fee'])
             color = 'red'
         click.echo(click.style(msg, fg=color))
+    if data.get('next_before') is not None:
+        click.echo('(older transactions not shown)')
 
 
 # Transactions
@@ -225,21 +422,96 @@ def cli_transactions():
 @click.argument('wallet')
 @click.argument('to')
 @click.argument('amount', type=click.FLOAT)
+@click.option('--fee', type=click.FLOAT, default=None,
+              help='Fee paid to get mined ahead of lower fee transactions')
 @click.option('--node', default='127.0.0.1:{}'.format(Network.NODE_PORT))
-def create_tx(wallet, to, amount, node):
+def create_tx(wallet, to, amount, fee, node):
     wallet = WalletManager.get_wallet(wallet)
     if not wallet:
         sys.exit(-1)
     click.echo('Sender address: {}'.format(wallet.address))
     wallet.password = getpass.getpass('Wallet password: ')
-    tx = wallet.create_tx(to, amount)
+    tx = wallet.create_tx(to, amount, fee)
     try:
         client = BlockchainHttpClient(node)
         resp = client.submit_tx(tx)
     except ClientError as e:
         click.echo(click.style(str(e), fg='red'))
         sys.exit(-1)
-    click.echo(click.style(resp, fg='green'))
+    click.echo(click.style(
+        'Submitted transaction {}'.format(resp['tx_id']), fg='green'))
+
+
+@cli_transactions.command('create-batch')
+@click.argument('wallet')
+@click.argument('payouts_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--node', default='127.0.0.1:{}'.format(Network.NODE_PORT))
+def create_tx_batch(wallet, payouts_file, node):
+    """
+    Signs the payouts of a CSV or JSON file (to, amount and an optional
+    fee) and submits them together.
+    """
+    wallet = WalletManager.get_wallet(wallet)
+    if not wallet:
+        sys.exit(-1)
+    try:
+        payouts = load_payouts(payouts_file)
+    except ValueError as e:
+        click.echo(click.style(str(e), fg='red'))
+        sys.exit(-1)
+    click.echo('Sender address: {}'.format(wallet.address))
+    # the key is decrypted once for all the payouts
+    try:
+        wallet.unlock(getpass.getpass('Wallet password: '))
+    except ValueError as e:
+        click.echo(click.style(str(e), fg='red'))
+        sys.exit(-1)
+    try:
+        txs = [wallet.create_tx(to, amount, fee) for to, amount, fee in payouts]
+    finally:
+        wallet.lock()
+    client = BlockchainHttpClient(node)
+    results = []
+    error = None
+    try:
+        for start in range(0, len(txs), BATCH_SUBMIT_SIZE):
+            results.extend(client.submit_txs(
+                txs[start:start + BATCH_SUBMIT_SIZE]))
+    except (ClientError, OSError, http.client.HTTPException) as e:
+        error = e
+    rejected = 0
+    for position, result in enumerate(results, 1):
+        if 'error' in result:
+            rejected += 1
+            click.echo(click.style('Payout {} rejected: {}'.format(
+                position, result['error']), fg='red'))
+    click.echo(click.style('Submitted {} of {} transactions'.format(
+        len(results) - rejected, len(txs)),
+        fg='green' if not rejected and error is None else 'yellow'))
+    if error is not None:
+        # the node may have queued the failed chunk before the error
+        click.echo(click.style(
+            'Payouts {} to {} were not acknowledged by the node: {}'.format(
+                len(results) + 1, len(txs), error), fg='red'))
+    if rejected or error is not None:
+        sys.exit(-1)
+
+
+@cli_transactions.command('status')
+@click.argument('tx_id')
+@click.option('--node', default='127.0.0.1:{}'.format(Network.NODE_PORT))
+def tx_status(tx_id, node):
+    try:
+        client = BlockchainHttpClient(node)
+        status = client.get_tx_status(tx_id)
+    except ClientError as e:
+        click.echo(click.style(str(e), fg='red'))
+        sys.exit(-1)
+    if status['status'] == 'confirmed':
+        click.echo(click.style(
+            'confirmed in block {}'.format(status['block']), fg='green'))
+    else:
+        click.echo(click.style(status['status'], fg='yellow'))
 
 
 # End Transactions
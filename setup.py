@@ -4,10 +4,14 @@ setup(
     name='pycoin',
     version='0.0.1',
     description='Proof of concept - blockchain',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
+    python_requires='>=3.8',
     install_requires=[
         'cryptography', 'click', 'peewee'
     ],
+    extras_require={
+        'node': ['flask', 'waitress'],
+    },
     entry_points={
         'console_scripts': [
             'pycoin-wallet = pycoin.wallet:cli',
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from pycoin.api import create_app
+from pycoin.persistence import STORAGE_BACKENDS
+from tests.utils import build_block, sign_tx
+
+BLOCK_COUNT = 1000
+RANGE_SIZES = (1, 10, 100, 1000)
+REQUESTS = 10
+
+
+def get_latency(client, size, before_request=None):
+    """
+    Mean latency in milliseconds of ``REQUESTS`` requests for the latest
+    ``size`` blocks.
+    """
+    elapsed = 0
+    for _ in range(REQUESTS):
+        if before_request is not None:
+            before_request()
+        start = time.perf_counter()
+        response = client.get('/blockchain/blocks?start=%d&end=%d' % (
+            BLOCK_COUNT - size, BLOCK_COUNT))
+        elapsed += time.perf_counter() - start
+        assert response.status_code == 200
+    return elapsed * 1000 / REQUESTS
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('storage', STORAGE_BACKENDS)
+def test_blocks_latency_by_range_size(make_blockchain, sender, receiver,
+                                      report, storage):
+    blockchain = make_blockchain(storage)
+    parent = blockchain.tree.tip
+    while parent.index < BLOCK_COUNT - 1:
+        parent = blockchain.add_block(build_block(blockchain, parent, [
+            sign_tx(sender, receiver.address, 0.01) for _ in range(5)]))
+    client = create_app(blockchain).test_client()
+
+    lines = []
+    for size in RANGE_SIZES:
+        cold = get_latency(client, size,
+                           before_request=blockchain.block_cache.clear)
+        warm = get_latency(client, size)
+        lines.append('%5d blocks: %8.2f ms cold, %8.2f ms warm' % (
+            size, cold, warm))
+    report('/blockchain/blocks latency (%s)' % storage, lines)
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import time
+import urllib.request
+
+import pytest
+
+from pycoin.api import create_app
+from pycoin.client import BlockchainHttpClient
+from tests.utils import build_block, create_wallet, serve_waitress, sign_tx
+
+ADDRESSES = 50
+LOOKUPS = 500
+NODE_THREADS = 4
+
+
+def get_rate(lookup, addresses):
+    start = time.perf_counter()
+    for position in range(LOOKUPS):
+        assert 'balance' in lookup(addresses[position % len(addresses)])
+    return LOOKUPS / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+def test_balance_lookups_per_second(make_blockchain, sender, report):
+    blockchain = make_blockchain('blockfile')
+    addresses = [create_wallet().address for _ in range(ADDRESSES)]
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [
+        sign_tx(sender, address, 1.0) for address in addresses]))
+
+    with serve_waitress(create_app(blockchain), NODE_THREADS) as node_addr:
+        client = BlockchainHttpClient(node_addr)
+        url = client.get_api_url(client.API_WALLET_BALANCE)
+
+        def per_call(address):
+            # a new connection for every request, as before the pool
+            with urllib.request.urlopen(url.format(address=address)) as resp:
+                return json.loads(resp.read().decode())
+
+        per_call_rate = get_rate(per_call, addresses)
+        pooled_rate = get_rate(client.get_address_balance, addresses)
+        start = time.perf_counter()
+        for _ in range(LOOKUPS // len(addresses)):
+            balances = asyncio.run(client.get_balances(addresses))
+            assert all(balances[address]['balance'] == 1.0
+                       for address in addresses)
+        fan_out_rate = LOOKUPS / (time.perf_counter() - start)
+        client.close()
+
+    report('/wallets/balance lookups (waitress node, %d threads)' %
+           NODE_THREADS, [
+               'connection per call: %8.0f /s' % per_call_rate,
+               'pooled connections:  %8.0f /s' % pooled_rate,
+               'get_balances:        %8.0f /s' % fan_out_rate,
+           ])
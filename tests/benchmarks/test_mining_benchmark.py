@@ -0,0 +1,47 @@
+import os
+import time
+
+import pytest
+
+from pycoin.blockchain import Blockchain
+from pycoin.consts import Difficulty
+from pycoin.pow.backends import MultiprocessMiningBackend, SerialMiningBackend
+from tests.test_pow import make_block
+from tests.utils import sign_tx
+
+WORKERS = (1, 2, 4, 8)
+BLOCKS = 5
+# about a million hashes per block
+TARGET = Difficulty.INITIAL_TARGET >> 8
+
+
+def get_hash_rate(backend, blocks):
+    """
+    Nonces below the one found per second, the work of a serial search.
+    """
+    attempts = 0
+    start = time.perf_counter()
+    for block in blocks:
+        nonce, _ = backend.search(block)
+        attempts += nonce + 1
+    return attempts / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+def test_hash_rate_by_workers(sender, receiver, report):
+    transactions = [sign_tx(sender, receiver.address, 0.01)
+                    for _ in range(100)]
+    blocks = []
+    for index in range(BLOCKS):
+        block = make_block(Blockchain.BLOCK_VERSION, transactions,
+                           target=TARGET)
+        block['index'] = index + 1
+        blocks.append(block)
+
+    serial_rate = get_hash_rate(SerialMiningBackend(), blocks)
+    lines = ['serial:    %10.0f hashes/s' % serial_rate]
+    for workers in WORKERS:
+        rate = get_hash_rate(MultiprocessMiningBackend(workers), blocks)
+        lines.append('%d workers: %10.0f hashes/s (x%.2f)' % (
+            workers, rate, rate / serial_rate))
+    report('multiprocess mining, %d cpus' % os.cpu_count(), lines)
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from pycoin.persistence import STORAGE_BACKENDS, get_storage
+from tests.utils import make_block_data, sign_tx
+
+# entries per block: blocks written
+BLOCK_SIZES = ((5, 200), (500, 20), (5000, 3))
+# blocks written, then read back by ranges of these sizes
+RANGE_CHAIN_LENGTH = 2000
+RANGE_SIZES = (1, 10, 100, 1000)
+RANGE_READ_BLOCKS = 20000
+
+
+@pytest.fixture(scope='module')
+def chains(sender, receiver):
+    """
+    For each block size, the blocks to write.
+    """
+    chains = {}
+    for size, count in BLOCK_SIZES:
+        blocks = []
+        previous_hash = ''
+        for index in range(count):
+            block = make_block_data(index, previous_hash, [
+                sign_tx(sender, receiver.address, 0.01)
+                for _ in range(size)])
+            previous_hash = block['hash']
+            blocks.append(block)
+        chains[size] = blocks
+    return chains
+
+
+def open_storage(tmp_path, storage_name, name):
+    path = tmp_path / name
+    if storage_name == 'sqlite':
+        path.mkdir()
+        path = path / 'blockchain.db'
+    return get_storage(storage_name, str(path))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('storage_name', STORAGE_BACKENDS)
+def test_persisted_blocks_per_second(tmp_path, chains, report,
+                                     storage_name):
+    lines = []
+    for size, blocks in chains.items():
+        storage = open_storage(tmp_path, storage_name, str(size))
+        start = time.perf_counter()
+        for block in blocks:
+            storage.append_block(block)
+        elapsed = time.perf_counter() - start
+        assert storage.get_block_count() == len(blocks)
+        storage.close()
+        lines.append('%5d entries: %8.1f blocks/s, %9.0f entries/s' % (
+            size, len(blocks) / elapsed, len(blocks) * size / elapsed))
+    report('persisted blocks per second (%s)' % storage_name, lines)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('storage_name', STORAGE_BACKENDS)
+def test_range_reads_per_second(tmp_path, sender, receiver, report,
+                                storage_name):
+    blocks = []
+    previous_hash = ''
+    for index in range(RANGE_CHAIN_LENGTH):
+        block = make_block_data(index, previous_hash, [
+            sign_tx(sender, receiver.address, 0.01) for _ in range(5)])
+        previous_hash = block['hash']
+        blocks.append(block)
+    storage = open_storage(tmp_path, storage_name, 'ranges')
+    start = time.perf_counter()
+    for block in blocks:
+        storage.append_block(block)
+    elapsed = time.perf_counter() - start
+    lines = ['append: %8.1f blocks/s' % (len(blocks) / elapsed)]
+
+    for size in RANGE_SIZES:
+        # ranges all over the chain, the same blocks read for every size
+        starts = [(position * 7919) % (len(blocks) - size + 1)
+                  for position in range(RANGE_READ_BLOCKS // size)]
+        start = time.perf_counter()
+        for range_start in starts:
+            assert len(storage.get_blocks(range_start,
+                                          range_start + size)) == size
+        elapsed = time.perf_counter() - start
+        lines.append('ranges of %4d: %8.1f blocks/s, %8.1f ranges/s' % (
+            size, len(starts) * size / elapsed, len(starts) / elapsed))
+    storage.close()
+    report('range reads (%s)' % storage_name, lines)
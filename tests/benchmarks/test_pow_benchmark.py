@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from pycoin.blockchain import Blockchain
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork
+from tests.test_pow import make_block
+from tests.utils import sign_tx
+
+TX_COUNTS = (0, 10, 100, 1000)
+ATTEMPTS = 20000
+NAIVE_ATTEMPTS = 500
+
+
+def get_naive_rate(proof_of_work, block):
+    """
+    Hashes per second when every attempt serializes the whole block.
+    """
+    start = time.perf_counter()
+    for nonce in range(NAIVE_ATTEMPTS):
+        block['nonce'] = nonce
+        proof_of_work.hash_is_valid(proof_of_work.hash_block(block))
+    return NAIVE_ATTEMPTS / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('version', [1, Blockchain.BLOCK_VERSION])
+def test_hash_rate_by_block_size(sender, receiver, report, version):
+    transactions = [sign_tx(sender, receiver.address, 0.01)
+                    for _ in range(max(TX_COUNTS))]
+    lines = []
+    for count in TX_COUNTS:
+        # no hash is below a zero target, every nonce of the range is tried
+        block = make_block(version, transactions[:count], target=0)
+        proof_of_work = Sha256ProofOfWork(block)
+        start = time.perf_counter()
+        assert proof_of_work.search_range(0, ATTEMPTS) is None
+        rate = ATTEMPTS / (time.perf_counter() - start)
+        naive_rate = get_naive_rate(proof_of_work, block)
+        lines.append('%5d txs: %10.0f hashes/s, %8.0f re-serializing '
+                     '(x%.0f)' % (count, rate, naive_rate, rate / naive_rate))
+    report('hash rate by block size (version %d)' % version, lines)
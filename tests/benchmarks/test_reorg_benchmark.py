@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from pycoin.persistence import STORAGE_BACKENDS
+from tests.utils import build_block, extend_branch, sign_tx
+
+DEPTHS = (1, 10, 50, 100)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('storage', STORAGE_BACKENDS)
+def test_reorg_cost_by_depth(make_blockchain, sender, receiver, report,
+                             storage):
+    lines = []
+    for depth in DEPTHS:
+        blockchain = make_blockchain(storage, name='%s-%d' % (storage, depth))
+        fork_point = blockchain.tree.tip
+        extend_branch(blockchain, fork_point, depth, sender, receiver)
+        branch = extend_branch(blockchain, fork_point, depth, sender,
+                               receiver, amount=0.02)
+        last = build_block(blockchain, blockchain.tree.get(branch[-1]['hash']),
+                           [sign_tx(sender, receiver.address, 0.02)])
+
+        start = time.perf_counter()
+        blockchain.add_block(last)
+        elapsed = time.perf_counter() - start
+
+        assert blockchain.tree.tip.hash == last['hash']
+        lines.append('depth %4d: %8.1f ms, %6.2f ms per block' % (
+            depth, elapsed * 1000, elapsed * 1000 / depth))
+        blockchain.verify_pool.shutdown()
+        blockchain.storage.close()
+    report('reorg cost by depth (%s)' % storage, lines)
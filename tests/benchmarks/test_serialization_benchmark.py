@@ -0,0 +1,50 @@
+import json
+import time
+
+import pytest
+
+from pycoin import serialization
+from pycoin.wallet import KEY_TYPE_RSA, KEY_TYPES
+from tests.utils import create_wallet, make_block_data, sign_tx
+
+TRANSACTIONS = 1000
+SENDERS = 10
+ROUNDS = 5
+
+
+def get_rate(function, block):
+    """
+    Blocks per second of ``function``, over ``ROUNDS`` calls.
+    """
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        function(block)
+    return ROUNDS / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('key_type', KEY_TYPES)
+def test_json_and_binary_encodings(rsa_wallet, receiver, report, key_type):
+    if key_type == KEY_TYPE_RSA:
+        senders = [rsa_wallet]
+    else:
+        senders = [create_wallet(key_type) for _ in range(SENDERS)]
+    block = make_block_data(1, 'ab' * 32, [
+        sign_tx(senders[position % len(senders)], receiver.address, 0.01)
+        for position in range(TRANSACTIONS)])
+    json_data = json.dumps(block).encode()
+    binary_data = serialization.encode_block(block)
+    assert serialization.decode_block(binary_data) == block
+
+    lines = []
+    for name, data, encode, decode in [
+            ('json', json_data, lambda block: json.dumps(block).encode(),
+             json.loads),
+            ('binary', binary_data, serialization.encode_block,
+             serialization.decode_block)]:
+        lines.append('%-6s %5.0f bytes/tx, encode %6.1f blocks/s, '
+                     'decode %6.1f blocks/s' % (
+                         name, len(data) / TRANSACTIONS,
+                         get_rate(encode, block), get_rate(decode, data)))
+    report('%s block, %d transactions, senders: %d' % (
+        key_type, TRANSACTIONS, len(senders)), lines)
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from pycoin.signatures import SignatureVerifier
+from pycoin.wallet import KEY_TYPE_RSA, KEY_TYPES, WalletManager
+from tests.utils import build_block, create_wallet, sign_tx
+
+TRANSACTIONS = 100
+# RSA keys take much longer to generate
+KEYGEN_COUNTS = {KEY_TYPE_RSA: 5}
+KEYGEN_COUNT = 50
+SIGNATURES = 500
+
+
+def get_submit_rate(blockchain, transactions, before_submit=None):
+    start = time.perf_counter()
+    for tx in transactions:
+        if before_submit is not None:
+            before_submit()
+        blockchain.submit_transaction(
+            tx['from'], tx['to'], tx['amount'], tx['ts'], tx['signature'],
+            tx['public_key'], tx.get('fee'), tx.get('key_type'))
+    return len(transactions) / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+def test_rsa_submit_rate(make_blockchain, sender, rsa_wallet, receiver,
+                         report):
+    blockchain = make_blockchain('blockfile')
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [
+        sign_tx(sender, rsa_wallet.address, 10.0)]))
+    transactions = [sign_tx(rsa_wallet, receiver.address, 0.01)
+                    for _ in range(TRANSACTIONS * 2)]
+    signatures = blockchain.signatures
+
+    cold = get_submit_rate(blockchain, transactions[:TRANSACTIONS],
+                           before_submit=signatures.keys.clear)
+    hot = get_submit_rate(blockchain, transactions[TRANSACTIONS:])
+    # a transaction gossiped again by a peer is already verified
+    start = time.perf_counter()
+    for tx in transactions:
+        signatures.verify_tx(tx)
+    verified = len(transactions) / (time.perf_counter() - start)
+
+    assert len(blockchain.mempool) == len(transactions)
+    report('RSA transaction submits', [
+        'cold key cache:   %8.0f tx/s' % cold,
+        'hot key cache:    %8.0f tx/s' % hot,
+        'already verified: %8.0f tx/s' % verified,
+    ])
+
+
+@pytest.mark.benchmark
+def test_rsa_batch_submit_rate(make_blockchain, sender, rsa_wallet, receiver,
+                               report):
+    blockchain = make_blockchain('blockfile')
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [
+        sign_tx(sender, rsa_wallet.address, 10.0)]))
+    transactions = [sign_tx(rsa_wallet, receiver.address, 0.01)
+                    for _ in range(TRANSACTIONS * 2)]
+
+    one_by_one = get_submit_rate(blockchain, transactions[:TRANSACTIONS])
+    start = time.perf_counter()
+    results = blockchain.submit_transactions(transactions[TRANSACTIONS:])
+    batch = TRANSACTIONS / (time.perf_counter() - start)
+
+    assert all('tx_id' in result for result in results)
+    report('RSA transaction batches (%d verification threads)' %
+           blockchain.VERIFY_WORKERS, [
+               'one by one: %8.0f tx/s' % one_by_one,
+               'batch:      %8.0f tx/s' % batch,
+           ])
+
+
+def get_rate(count, operation):
+    start = time.perf_counter()
+    for _ in range(count):
+        operation()
+    return count / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('key_type', KEY_TYPES)
+def test_key_operations_per_second(receiver, report, key_type):
+    keygen = get_rate(KEYGEN_COUNTS.get(key_type, KEYGEN_COUNT),
+                      lambda: WalletManager.create_wallet('password',
+                                                          key_type))
+    wallet = create_wallet(key_type)
+    sign = get_rate(SIGNATURES, lambda: wallet.sign(b'payload'))
+    transactions = iter([sign_tx(wallet, receiver.address, 0.01)
+                         for _ in range(SIGNATURES)])
+    # every transaction is new to the verifier, its key is cached
+    verifier = SignatureVerifier()
+    verify = get_rate(SIGNATURES,
+                      lambda: verifier.verify_tx(next(transactions)))
+    assert verifier.stats()['verified_signatures']['size'] == SIGNATURES
+
+    report('%s key operations' % key_type, [
+        'wallets created: %8.1f /s' % keygen,
+        'signatures:      %8.1f /s' % sign,
+        'verifications:   %8.1f /s' % verify,
+    ])
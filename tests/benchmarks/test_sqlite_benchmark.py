@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from pycoin.persistence import DB_MODES
+from pycoin.persistence.sqlite import SqliteStorage
+from tests.utils import make_block_data, sign_tx
+
+BLOCKS = 100
+ENTRIES = 50
+READERS = 4
+
+
+@pytest.fixture(scope='module')
+def blocks(sender, receiver):
+    blocks = []
+    previous_hash = ''
+    for index in range(BLOCKS):
+        block = make_block_data(index, previous_hash, [
+            sign_tx(sender, receiver.address, 0.01)
+            for _ in range(ENTRIES)])
+        previous_hash = block['hash']
+        blocks.append(block)
+    return blocks
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('db_mode', DB_MODES)
+def test_read_rate_during_writes(tmp_path, blocks, receiver, report,
+                                 db_mode):
+    storage = SqliteStorage(str(tmp_path / 'blockchain.db'), mode=db_mode)
+    storage.append_block(blocks[0])
+    writing = threading.Event()
+    writing.set()
+    reads = []
+
+    def read():
+        count = 0
+        while writing.is_set():
+            storage.get_address_history_page(receiver.address, 20)
+            storage.get_block_count()
+            count += 1
+        reads.append(count)
+
+    readers = [threading.Thread(target=read) for _ in range(READERS)]
+    for reader in readers:
+        reader.start()
+    start = time.perf_counter()
+    for block in blocks[1:]:
+        storage.append_block(block)
+    elapsed = time.perf_counter() - start
+    writing.clear()
+    for reader in readers:
+        reader.join()
+    storage.close()
+
+    report('sqlite reads during block writes (%s)' % db_mode, [
+        '%d readers: %8.0f reads/s' % (READERS, sum(reads) / elapsed),
+        'writer:    %8.1f blocks/s of %d entries' % (
+            (len(blocks) - 1) / elapsed, ENTRIES),
+    ])
@@ -0,0 +1,63 @@
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from tests.utils import get_python_env, run_python
+
+RUNS = 5
+NODE_START_TIMEOUT = 30
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_wallet_list(home):
+    start = time.perf_counter()
+    run_python(['-m', 'pycoin.wallet', 'list'], home)
+    return time.perf_counter() - start
+
+
+def time_node_start(home, run):
+    """
+    Seconds until a new node answers its first request.
+    """
+    port = get_free_port()
+    url = 'http://127.0.0.1:%d/blockchain/block_count' % port
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'pycoin.node', 'start', '--port', str(port),
+         '--threads', '4', '--db', str(home / ('node-%d.db' % run))],
+        env=get_python_env(home), stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < NODE_START_TIMEOUT:
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        pytest.fail('The node did not start')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.mark.benchmark
+def test_startup_time(tmp_path, report):
+    wallet_times = [time_wallet_list(tmp_path) for _ in range(RUNS)]
+    node_times = [time_node_start(tmp_path, run) for run in range(RUNS)]
+    report('startup time, median of %d runs' % RUNS, [
+        'pycoin-wallet list:  %6.0f ms' % (
+            statistics.median(wallet_times) * 1000),
+        'pycoin-node start:   %6.0f ms' % (
+            statistics.median(node_times) * 1000),
+    ])
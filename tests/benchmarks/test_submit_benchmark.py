@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from pycoin.api import create_app
+from pycoin.loadtest import get_percentile
+from pycoin.miner import MinerThread
+from pycoin.pow.backends import SerialMiningBackend
+
+TRANSACTIONS = 100
+
+
+class NetworkDifficultyBackend(SerialMiningBackend):
+    """
+    Takes ``MINING_TIME`` seconds per block, as mining at the difficulty of
+    a busy network would, instead of the milliseconds of the initial target.
+    """
+    MINING_TIME = 0.05
+
+    def search(self, block):
+        time.sleep(self.MINING_TIME)
+        return super().search(block)
+
+
+def get_latencies(client, transactions, after_submit=None):
+    """
+    Sorted latencies of ``/tx/submit`` in milliseconds.
+    """
+    latencies = []
+    for tx in transactions:
+        start = time.perf_counter()
+        response = client.post('/tx/submit', data=tx)
+        if after_submit is not None:
+            after_submit()
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return sorted(latencies)
+
+
+def wait_for_mined(blockchain):
+    deadline = time.time() + 60
+    while len(blockchain.mempool) >= blockchain.TX_PER_BLOCK:
+        assert time.time() < deadline, 'the miner fell behind'
+        time.sleep(0.01)
+
+
+@pytest.mark.benchmark
+def test_submit_latency_with_miner(make_blockchain, sender, receiver,
+                                   report):
+    lines = []
+    for mode in ('inline', 'miner thread'):
+        blockchain = make_blockchain('blockfile', name=mode)
+        blockchain.mining_backend = NetworkDifficultyBackend()
+        client = create_app(blockchain).test_client()
+        transactions = [sender.create_tx(receiver.address, 0.01)
+                        for _ in range(TRANSACTIONS)]
+        if mode == 'inline':
+            # as before the miner thread: the request that completes a
+            # batch mines its block
+            def mine():
+                if len(blockchain.mempool) >= blockchain.TX_PER_BLOCK:
+                    blockchain.mine_pending(timeout=0)
+            latencies = get_latencies(client, transactions, mine)
+        else:
+            miner = MinerThread(blockchain, poll_interval=0.1)
+            miner.start()
+            try:
+                latencies = get_latencies(client, transactions)
+                wait_for_mined(blockchain)
+            finally:
+                miner.stop()
+                miner.join()
+        assert blockchain.get_block_count() > 1
+        lines.append('%-12s p50 %7.2f ms, p99 %7.2f ms, max %7.2f ms' % (
+            mode, get_percentile(latencies, 50),
+            get_percentile(latencies, 99), latencies[-1]))
+    report('/tx/submit latency, %d transactions' % TRANSACTIONS, lines)
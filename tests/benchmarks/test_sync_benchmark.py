@@ -0,0 +1,28 @@
+import pytest
+
+from tests.utils import extend_branch, get_chain_hashes, serve_nodes
+
+BLOCK_COUNT = 2000
+PEER_COUNTS = (1, 2)
+
+
+@pytest.mark.benchmark
+def test_sync_blocks_per_second(make_blockchain, sender, receiver, report):
+    sources = [make_blockchain('blockfile', name='source%d' % index)
+               for index in range(max(PEER_COUNTS))]
+    blocks = extend_branch(sources[0], sources[0].tree.tip, BLOCK_COUNT,
+                           sender, receiver)
+    for source in sources[1:]:
+        for block in blocks:
+            source.add_block(block)
+    lines = []
+    for peer_count in PEER_COUNTS:
+        node = make_blockchain('blockfile', name='node%d' % peer_count)
+        with serve_nodes([node] + sources[:peer_count]) as (apps, _):
+            sync_report = apps[0].peers.sync()
+        assert sync_report.blocks == BLOCK_COUNT
+        assert get_chain_hashes(node) == get_chain_hashes(sources[0])
+        lines.append('%d peers: %d blocks in %6.2f s, %7.1f blocks/s' % (
+            peer_count, sync_report.blocks, sync_report.elapsed,
+            sync_report.blocks / sync_report.elapsed))
+    report('sync of %d blocks' % BLOCK_COUNT, lines)
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from pycoin.wallet import KEY_TYPE_RSA, KEY_TYPES, Wallet
+from tests.utils import create_wallet
+
+# signatures decrypting the key every time are much slower
+LOCKED_SIGNATURES = 20
+SESSION_SIGNATURES = 200
+
+
+def get_signature_rate(wallet, receiver, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        wallet.create_tx(receiver.address, 0.01)
+    return count / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('key_type', KEY_TYPES)
+def test_session_signatures_per_second(rsa_wallet, receiver, report,
+                                       key_type):
+    unlocked = (rsa_wallet if key_type == KEY_TYPE_RSA
+                else create_wallet(key_type))
+    # the same keys, decrypted with the password for every signature
+    locked = Wallet(unlocked.pub_key, unlocked.priv_key, 'password',
+                    key_type)
+    assert not locked.is_unlocked
+
+    locked_rate = get_signature_rate(locked, receiver, LOCKED_SIGNATURES)
+    session_rate = get_signature_rate(unlocked, receiver, SESSION_SIGNATURES)
+    report('%s transaction signatures' % key_type, [
+        'locked wallet:   %8.1f tx/s' % locked_rate,
+        'unlocked wallet: %8.1f tx/s' % session_rate,
+    ])
@@ -0,0 +1,126 @@
+import pytest
+
+from pycoin.blockchain import Blockchain
+from pycoin.consts import Difficulty, Genesis, InitialCapital
+from pycoin.persistence import STORAGE_BACKENDS, get_storage
+from pycoin.persistence.models import Reward
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork, format_target
+from pycoin.wallet import KEY_TYPE_RSA
+from tests.utils import create_wallet
+
+# benchmark results, printed at the end of the run
+_benchmark_reports = []
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true',
+                     help='Run the benchmarks of tests/benchmarks')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'benchmark: slow measurement, run with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter):
+    for title, lines in _benchmark_reports:
+        terminalreporter.section(title)
+        for line in lines:
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture
+def report():
+    """
+    Records the lines of a benchmark result, shown in the test summary.
+    """
+    def add_report(title, lines):
+        _benchmark_reports.append((title, list(lines)))
+    return add_report
+
+
+@pytest.fixture(scope='session')
+def sender():
+    """
+    The owner of the initial capital.
+    """
+    wallet = create_wallet()
+    yield wallet
+    wallet.lock()
+
+
+@pytest.fixture(scope='session')
+def receiver():
+    wallet = create_wallet()
+    yield wallet
+    wallet.lock()
+
+
+@pytest.fixture(scope='session')
+def rsa_wallet():
+    """
+    RSA keys take a while to generate, the tests share this wallet.
+    """
+    wallet = create_wallet(KEY_TYPE_RSA)
+    yield wallet
+    wallet.lock()
+
+
+@pytest.fixture(scope='session')
+def genesis(sender):
+    """
+    ``(nonce, hash)`` of a genesis block giving the initial capital to
+    ``sender``.
+    """
+    block = {
+        'index': 0,
+        'data': [{'type': 'reward', 'to': sender.address,
+                  'amount': float(InitialCapital.INITIAL_CAPITAL),
+                  'ts': Genesis.TIMESTAMP,
+                  'reason': Reward.INITIAL_CAPITAL}],
+        'previous_hash': '',
+        'timestamp': Genesis.TIMESTAMP,
+        'target': format_target(Difficulty.INITIAL_TARGET),
+    }
+    return Sha256ProofOfWork(block).search_for_correct_hash()
+
+
+@pytest.fixture
+def make_blockchain(tmp_path, monkeypatch, sender, genesis):
+    """
+    Opens blockchains on a new storage of the given type. Only one sqlite
+    storage can be open at a time.
+    """
+    monkeypatch.setattr(InitialCapital, 'INITIAL_OWNERS', [sender.address])
+    monkeypatch.setattr(Genesis, 'NONCE', genesis[0])
+    monkeypatch.setattr(Genesis, 'HASH', genesis[1])
+    opened = []
+
+    def open_blockchain(storage='sqlite', name='node', **kwargs):
+        path = tmp_path / name
+        if storage == 'sqlite':
+            path.mkdir(exist_ok=True)
+            path = path / 'blockchain.db'
+        blockchain = Blockchain(storage=get_storage(storage, str(path),
+                                                    **kwargs))
+        opened.append(blockchain)
+        return blockchain
+
+    yield open_blockchain
+    for blockchain in opened:
+        blockchain.verify_pool.shutdown()
+        blockchain.storage.close()
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def blockchain(request, make_blockchain):
+    return make_blockchain(request.param)
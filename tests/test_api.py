@@ -0,0 +1,352 @@
+import hashlib
+import io
+import time
+
+import pytest
+
+from pycoin import api, serialization
+from pycoin.api import create_app
+from pycoin.mempool import get_tx_id
+from pycoin.merkle import get_merkle_root, verify_tx_proof
+from pycoin.persistence.models import read_db
+from tests.utils import build_block, extend_branch, sign_tx, submit_tx
+
+
+@pytest.fixture
+def client(blockchain):
+    return create_app(blockchain).test_client()
+
+
+def test_blocks_range(blockchain, client, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 3, sender, receiver)
+
+    response = client.get('/blockchain/blocks?start=1&end=3&verbose=1')
+    assert response.status_code == 200
+    blocks = response.get_json()
+    assert blocks == blockchain.get_blocks(1, 3, verbose=True)
+    assert [block['index'] for block in blocks] == [1, 2]
+    assert blocks[0]['data'][0]['from'] == sender.address
+    assert blocks[0]['data'][0]['to'] == receiver.address
+
+
+def test_blocks_verbose_flag(blockchain, client, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 2, sender, receiver)
+    verbose = blockchain.get_blocks(0, 3, verbose=True)
+    short = blockchain.get_blocks(0, 3)
+    assert 'signature' not in short[1]['data'][0]
+
+    for query, blocks in [('', short), ('?verbose=false', short),
+                          ('?verbose=true', verbose), ('?verbose=1', verbose)]:
+        assert client.get('/blockchain/blocks' + query).get_json() == blocks
+    # both true values share the cached blocks
+    assert blockchain.block_cache.stats()['size'] == 6
+
+
+def test_blocks_range_query_count(make_blockchain, sender, receiver,
+                                  monkeypatch):
+    blockchain = make_blockchain('sqlite')
+    parent = blockchain.tree.tip
+    for _ in range(10):
+        parent = blockchain.add_block(build_block(blockchain, parent, [
+            sign_tx(sender, receiver.address, 0.01) for _ in range(3)]))
+    queries = []
+    execute_sql = read_db.execute_sql
+
+    def count_query(sql, *args, **kwargs):
+        queries.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+    monkeypatch.setattr(read_db, 'execute_sql', count_query)
+
+    blockchain.storage.get_blocks(0, 2)
+    small_range = len(queries)
+    assert small_range > 0
+    del queries[:]
+    blockchain.storage.get_blocks(0, 11)
+    assert len(queries) == small_range
+
+
+def test_submit_batch_reports_malformed_entries(blockchain, client, sender,
+                                                receiver):
+    transactions = [sender.create_tx(receiver.address, amount)
+                    for amount in (1.0, 2.0, 3.0, 4.0)]
+    transactions[1]['public_key'] = None
+    transactions[2]['signature'] = None
+    del transactions[3]['ts']
+    transactions.append(['not', 'a', 'transaction'])
+
+    response = client.post('/tx/submit_batch', json=transactions[:4])
+    assert response.status_code == 200
+    results = response.get_json()
+    assert results[0]['status'] == 'pending'
+    assert [result.get('error') for result in results[1:]] == \
+        ['Malformed transaction'] * 3
+    assert len(blockchain.mempool) == 1
+    response = client.post('/tx/submit_batch', json=transactions)
+    assert response.status_code == 400
+
+
+def test_submit_batch_results_in_order(blockchain, client, sender, receiver):
+    transactions = [sender.create_tx(receiver.address, index + 1.0)
+                    for index in range(10)]
+    # signatures of other transactions
+    for position in (2, 7):
+        transactions[position]['signature'] = \
+            transactions[position + 1]['signature']
+    transactions.append(transactions[0])
+
+    results = client.post('/tx/submit_batch', json=transactions).get_json()
+    assert len(results) == 11
+    for position, result in enumerate(results[:10]):
+        if position in (2, 7):
+            assert 'Invalid signature' in result['error']
+        else:
+            assert result == {'tx_id': get_tx_id(transactions[position]),
+                              'status': 'pending'}
+    assert 'already submitted' in results[10]['error']
+    assert len(blockchain.mempool) == 8
+
+
+@pytest.mark.parametrize('field, value, error', [
+    ('amount', 'nan', 'Invalid amount'),
+    ('amount', 'inf', 'Invalid amount'),
+    ('amount', '-1', 'Invalid amount'),
+    ('amount', '0', 'Invalid amount'),
+    ('fee', 'nan', 'Invalid fee'),
+    ('fee', 'inf', 'Invalid fee'),
+    ('fee', '-0.5', 'Invalid fee'),
+    ('ts', 'nan', 'Invalid timestamp'),
+])
+def test_submit_rejects_invalid_numbers(blockchain, client, sender, receiver,
+                                        field, value, error):
+    tx = sender.create_tx(receiver.address, 1.0, 0.1)
+    tx[field] = value
+    response = client.post('/tx/submit', data=tx)
+    assert response.status_code == 400
+    assert error in response.get_data(as_text=True)
+    assert len(blockchain.mempool) == 0
+    assert blockchain.get_available_balance(sender.address) == \
+        blockchain.get_addr_balance(sender.address)
+
+
+def test_history_pages_with_equal_timestamps(blockchain, client, sender,
+                                             receiver, monkeypatch):
+    # transactions signed within the same clock tick
+    with monkeypatch.context() as patch:
+        patch.setattr(time, 'time', lambda: 1600000000.0)
+        transactions = [sign_tx(sender, receiver.address, index + 1.0)
+                        for index in range(7)]
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip,
+                                     transactions[:4]))
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip,
+                                     transactions[4:]))
+    history = blockchain.get_address_history(receiver.address)
+    assert len(history) == 7
+
+    pages = []
+    url = '/wallets/info/%s?limit=3' % receiver.address
+    while url is not None:
+        info = client.get(url).get_json()
+        pages.append(info['transactions'])
+        url = None
+        if info['next_before'] is not None:
+            url = '/wallets/info/%s?limit=3&before=%s' % (
+                receiver.address, info['next_before'])
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [tx for page in pages for tx in page] == history[::-1]
+
+
+def test_history_pages_by_default(blockchain, client, sender, receiver,
+                                  monkeypatch):
+    monkeypatch.setattr(api, 'MAX_HISTORY_PAGE', 3)
+    transactions = [sign_tx(sender, receiver.address, index + 1.0)
+                    for index in range(5)]
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip,
+                                     transactions))
+    history = blockchain.get_address_history(receiver.address)
+
+    for url in ('/wallets/info/%s', '/wallets/info/%s?limit=100',
+                '/wallets/info/%s?limit=many'):
+        info = client.get(url % receiver.address).get_json()
+        assert info['transactions'] == history[:-4:-1]
+        assert info['next_before'] is not None
+    info = client.get('/wallets/info/%s?before=%s' % (
+        receiver.address, info['next_before'])).get_json()
+    assert info['transactions'] == history[1::-1]
+    assert info['next_before'] is None
+    assert info['balance'] == blockchain.get_addr_balance(receiver.address)
+
+
+def test_history_rejects_invalid_cursor(client, receiver):
+    response = client.get('/wallets/info/%s?limit=3&before=yesterday' %
+                          receiver.address)
+    assert response.status_code == 400
+    assert 'Invalid history cursor' in response.get_data(as_text=True)
+
+
+def test_transaction_status(blockchain, client, sender, receiver):
+    tx = sender.create_tx(receiver.address, 1.0)
+    response = client.post('/tx/submit', data=tx)
+    assert response.status_code == 200
+    tx_id = response.get_json()['tx_id']
+    assert client.get('/tx/status/' + tx_id).get_json() == {
+        'status': 'pending'}
+
+    blockchain.TX_PER_BLOCK = 1
+    block = blockchain.mine_pending(timeout=0)
+    assert client.get('/tx/status/' + tx_id).get_json() == {
+        'status': 'confirmed', 'block': block['index']}
+    assert client.get('/tx/status/' + 'ab' * 32).status_code == 404
+
+
+def test_transaction_proof(blockchain, client, sender, receiver):
+    # an odd number of transactions, the last one is paired with itself
+    transactions = [sign_tx(sender, receiver.address, index + 1.0)
+                    for index in range(5)]
+    block = build_block(blockchain, blockchain.tree.tip, transactions)
+    blockchain.add_block(block)
+    for tx in transactions:
+        response = client.get('/blockchain/proof/' + get_tx_id(tx))
+        assert response.status_code == 200
+        proof = response.get_json()
+        assert proof['block'] == block['index']
+        assert proof['block_hash'] == block['hash']
+        assert verify_tx_proof(proof)
+        assert verify_tx_proof(proof, expected_target=block['target'])
+        assert not verify_tx_proof(
+            proof, expected_target=int(block['target'], 16) // 2)
+
+    pending_id = submit_tx(blockchain, sender, receiver.address, 1.0)
+    assert client.get('/blockchain/proof/' + pending_id).status_code == 404
+    assert client.get('/blockchain/proof/' + 'ab' * 32).status_code == 404
+
+
+def test_transaction_proof_rejects_tampering(blockchain, client, sender,
+                                             receiver):
+    transactions = [sign_tx(sender, receiver.address, index + 1.0)
+                    for index in range(4)]
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip,
+                                     transactions))
+    proof = client.get('/blockchain/proof/' +
+                       get_tx_id(transactions[1])).get_json()
+    assert verify_tx_proof(proof)
+
+    sibling = dict(proof['proof'][0], hash='00' * 32)
+    assert not verify_tx_proof(dict(
+        proof, proof=[sibling] + proof['proof'][1:]))
+    swapped = [dict(step, side='right' if step['side'] == 'left' else 'left')
+               for step in proof['proof']]
+    assert not verify_tx_proof(dict(proof, proof=swapped))
+    assert not verify_tx_proof(dict(proof, proof=proof['proof'][:-1]))
+    assert not verify_tx_proof(dict(proof, tx=dict(proof['tx'], amount=100.0)))
+    assert not verify_tx_proof(dict(proof, tx=transactions[2]))
+
+    # a header claiming another Merkle root no longer hashes to the block
+    header = serialization.decode_header(
+        io.BytesIO(bytes.fromhex(proof['header'])))
+    header['merkle_root'] = get_merkle_root([proof['tx']])
+    assert not verify_tx_proof(dict(
+        proof, header=serialization.encode_header(header).hex()))
+
+
+def test_transaction_proof_with_forged_header(blockchain, client, sender,
+                                              receiver):
+    tx = sign_tx(sender, receiver.address, 1.0)
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [tx]))
+    proof = client.get('/blockchain/proof/' + get_tx_id(tx)).get_json()
+    tip = blockchain.get_blocks(proof['block'], proof['block'] + 1)[0]
+
+    # a header of its own, mined against the easiest target: any hash is
+    # valid
+    forged = serialization.decode_header(
+        io.BytesIO(bytes.fromhex(proof['header'])))
+    forged.update(target='f' * 64, nonce=1)
+    header = serialization.encode_header(forged)
+    forged_proof = dict(proof, header=header.hex(),
+                        block_hash=hashlib.sha256(header).hexdigest())
+    assert verify_tx_proof(forged_proof)
+    assert not verify_tx_proof(forged_proof, expected_target=tip['target'])
+
+
+def test_conditional_block_count(blockchain, client, sender, receiver):
+    response = client.get('/blockchain/block_count')
+    assert response.get_json() == {'block_count': 1}
+    etag = response.headers['ETag']
+    assert etag == '"%s"' % blockchain.tree.tip.hash
+
+    response = client.get('/blockchain/block_count',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    extend_branch(blockchain, blockchain.tree.tip, 1, sender, receiver)
+    response = client.get('/blockchain/block_count',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json() == {'block_count': 2}
+    assert response.headers['ETag'] != etag
+
+
+def test_conditional_blocks(blockchain, client, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 2, sender, receiver)
+    response = client.get('/blockchain/blocks?start=0&end=2')
+    etag = response.headers['ETag']
+    response = client.get('/blockchain/blocks?start=0&end=2',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    # another block changes the whole chain, not the range
+    extend_branch(blockchain, blockchain.tree.tip, 1, sender, receiver)
+    assert client.get('/blockchain/blocks?start=0&end=2',
+                      headers={'If-None-Match': etag}).status_code == 304
+    response = client.get('/blockchain/blocks',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 4
+
+
+def test_reorganization_invalidates_cached_blocks(blockchain, client, sender,
+                                                  receiver):
+    fork_point = blockchain.tree.tip
+    extend_branch(blockchain, fork_point, 2, sender, receiver)
+    old_blocks = client.get('/blockchain/blocks').get_json()
+    generation = blockchain.block_cache_generation
+
+    branch = extend_branch(blockchain, fork_point, 3, sender, receiver,
+                           amount=0.02)
+    assert blockchain.tree.tip.hash == branch[-1]['hash']
+    assert blockchain.block_cache_generation == generation + 1
+    # only the blocks read since the rollback are cached
+    assert blockchain.block_cache.stats()['size'] == 0
+
+    blocks = client.get('/blockchain/blocks').get_json()
+    assert blocks != old_blocks
+    assert [block['hash'] for block in blocks[1:]] == \
+        [block['hash'] for block in branch]
+    assert blocks == blockchain.get_blocks(0, None)
+
+
+def test_node_stats_hit_rates(blockchain, client, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 3, sender, receiver)
+    client.get('/blockchain/blocks')
+    client.get('/blockchain/blocks')
+    client.get('/blockchain/blocks?start=2')
+
+    stats = client.get('/node/stats').get_json()
+    assert stats['blocks']['misses'] == 4
+    assert stats['blocks']['hits'] == 6
+    assert stats['blocks']['hit_rate'] == 0.6
+    assert stats['blocks']['size'] == 4
+    assert 0 < stats['blocks']['bytes'] <= stats['blocks']['maxbytes']
+    # the signatures of the added blocks were verified once
+    assert stats['signatures']['verified_signatures']['size'] == 3
+    assert stats['mempool']['size'] == 0
+
+
+def test_mempool_stats(blockchain, client, sender, receiver):
+    for fee in (0.5, 0.1):
+        submit_tx(blockchain, sender, receiver.address, 1.0, fee)
+    stats = client.get('/mempool/stats').get_json()
+    assert stats['size'] == 2
+    assert (stats['min_fee'], stats['max_fee']) == (0.1, 0.5)
+    assert stats['bytes'] > 0
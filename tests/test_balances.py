@@ -0,0 +1,89 @@
+import pytest
+
+from pycoin.balances import AccountStateIndex
+from pycoin.exceptions import NotEnoughBalanceError, ValidationError
+from pycoin.mempool import get_tx_id
+from tests.utils import extend_branch
+
+ALICE = 'alice.py'
+BOB = 'bob.py'
+
+
+def make_tx(from_addr, to_addr, amount, fee=None, ts=1.0):
+    tx = {'type': 'tx', 'from': from_addr, 'to': to_addr, 'amount': amount,
+          'ts': ts, 'signature': 'ab'}
+    if fee is not None:
+        tx['fee'] = fee
+    return tx
+
+
+@pytest.fixture
+def index():
+    index = AccountStateIndex()
+    index.apply_block({'data': [{'type': 'reward', 'to': ALICE,
+                                 'amount': 10.0}]})
+    return index
+
+
+def test_reserve_and_release(index):
+    index.reserve('tx1', ALICE, 4.0)
+    assert index.get_balance(ALICE) == 10.0
+    assert index.get_available_balance(ALICE) == 6.0
+    with pytest.raises(ValidationError):
+        index.reserve('tx1', ALICE, 1.0)
+    index.release('tx1')
+    index.release('tx1')
+    assert index.get_available_balance(ALICE) == 10.0
+
+
+def test_pending_transactions_cannot_overdraw_together(index):
+    index.reserve('tx1', ALICE, 6.0)
+    # enough for each of them, not for both
+    with pytest.raises(NotEnoughBalanceError):
+        index.reserve('tx2', ALICE, 6.0)
+    assert index.get_available_balance(ALICE) == 4.0
+    index.reserve('tx2', ALICE, 4.0)
+    assert index.get_available_balance(ALICE) == 0.0
+
+
+def test_apply_block_confirms_reservations(index):
+    tx = make_tx(ALICE, BOB, 3.0, fee=0.5)
+    index.reserve(get_tx_id(tx), ALICE, 3.5)
+    index.apply_block({'data': [tx]})
+    assert index.get_balance(ALICE) == 6.5
+    assert index.get_available_balance(ALICE) == 6.5
+    assert index.get_balance(BOB) == 3.0
+    index.revert_block({'data': [tx]})
+    assert index.get_balance(ALICE) == 10.0
+    assert index.get_balance(BOB) == 0.0
+
+
+def test_get_overdrawn(index):
+    index.reserve('tx1', ALICE, 3.0)
+    index.reserve('tx2', ALICE, 3.0)
+    index.reserve('tx3', ALICE, 3.0)
+    assert index.get_overdrawn() == []
+    # a block of another node spends 5 of the 10 coins
+    index.apply_block({'data': [make_tx(ALICE, BOB, 5.0)]})
+    # the latest reservations go first, until the rest is covered
+    assert index.get_overdrawn() == ['tx3', 'tx2']
+
+
+def test_check_block_counts_earlier_transactions(index):
+    index.check_block({'data': [make_tx(ALICE, BOB, 6.0),
+                                make_tx(BOB, ALICE, 6.0, ts=2.0)]})
+    with pytest.raises(NotEnoughBalanceError):
+        index.check_block({'data': [make_tx(ALICE, BOB, 6.0),
+                                    make_tx(ALICE, BOB, 6.0, ts=2.0)]})
+
+
+def test_rollback_matches_rebuilt_index(blockchain, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 4, sender, receiver,
+                  amount=1.5)
+    blockchain.rollback_blocks(1)
+    rebuilt = AccountStateIndex.from_storage(blockchain.storage)
+    for wallet in (sender, receiver):
+        assert blockchain.get_addr_balance(wallet.address) == \
+            pytest.approx(rebuilt.get_balance(wallet.address))
+    assert blockchain.get_addr_balance(receiver.address) == \
+        pytest.approx(1.5)
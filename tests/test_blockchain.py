@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from pycoin.consts import Difficulty
+from pycoin.exceptions import NotEnoughBalanceError, ValidationError
+from pycoin.pow.sha256_hash_pow import parse_target
+from tests.utils import build_block, sign_tx, submit_tx
+
+
+def add_blocks(blockchain, sender, receiver, interval, count):
+    parent = blockchain.tree.tip
+    for _ in range(count):
+        parent = blockchain.add_block(build_block(
+            blockchain, parent, [sign_tx(sender, receiver.address, 0.01)],
+            timestamp=parent.ts + interval))
+    return parent
+
+
+@pytest.mark.parametrize('offset', [-1, 0])
+def test_backdated_block_is_rejected(blockchain, sender, receiver, offset):
+    tip = blockchain.tree.tip
+    block = build_block(blockchain, tip,
+                        [sign_tx(sender, receiver.address, 1.0)],
+                        timestamp=tip.ts + offset)
+    with pytest.raises(ValidationError, match='before its parent'):
+        blockchain.add_block(block)
+    assert blockchain.tree.tip is tip
+
+
+def test_retarget_is_capped_by_max_target(blockchain, sender, receiver):
+    # blocks hours apart, as when no transactions came
+    tip = add_blocks(blockchain, sender, receiver, 3600,
+                     Difficulty.RETARGET_INTERVAL - 1)
+    assert blockchain.get_next_target(tip) == Difficulty.MAX_TARGET
+
+
+def test_retarget_makes_fast_blocks_harder(blockchain, sender, receiver):
+    tip = add_blocks(blockchain, sender, receiver, 1,
+                     Difficulty.RETARGET_INTERVAL - 1)
+    assert blockchain.get_next_target(tip) == \
+        parse_target(tip.target) // Difficulty.MAX_ADJUSTMENT
+
+
+def test_mined_block_follows_parent_stamped_ahead(blockchain, sender,
+                                                  receiver):
+    # the clock of the node that mined the parent is a minute ahead
+    blockchain.add_block(build_block(
+        blockchain, blockchain.tree.tip,
+        [sign_tx(sender, receiver.address, 1.0)],
+        timestamp=time.time() + 60))
+    parent = blockchain.tree.tip
+    block = blockchain.generate_new_block(
+        [sign_tx(sender, receiver.address, 1.0)])
+    assert block['timestamp'] > parent.ts
+    assert blockchain.tree.tip.hash == block['hash']
+
+
+def test_peer_block_drops_overdrawn_pending(blockchain, sender, receiver):
+    overdrawn = submit_tx(blockchain, sender, receiver.address, 30.0)
+    # another node confirms a transaction of the same sender first
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [
+        sign_tx(sender, receiver.address, 40.0)]))
+
+    assert blockchain.get_tx_status(overdrawn) is None
+    assert len(blockchain.mempool) == 0
+    assert blockchain.mempool.stats()['removed'] == 1
+    assert blockchain.get_available_balance(sender.address) == \
+        pytest.approx(blockchain.get_addr_balance(sender.address))
+
+
+def test_mined_blocks_check_balances(blockchain, sender, receiver):
+    tip = blockchain.tree.tip
+    with pytest.raises(NotEnoughBalanceError):
+        blockchain.generate_new_block(
+            [sign_tx(sender, receiver.address, 1000.0)])
+    assert blockchain.tree.tip is tip
+    assert blockchain.get_block_count() == 1
+
+
+def test_mine_pending(blockchain, sender, receiver):
+    blockchain.TX_PER_BLOCK = 1
+    tx_id = submit_tx(blockchain, sender, receiver.address, 1.0)
+
+    block = blockchain.mine_pending(timeout=0)
+    assert blockchain.get_tx_status(tx_id) == {'status': 'confirmed',
+                                               'block': block['index']}
+    assert blockchain.get_addr_balance(receiver.address) == \
+        pytest.approx(1.0)
+    assert blockchain.get_available_balance(sender.address) == \
+        pytest.approx(blockchain.get_addr_balance(sender.address))
+
+
+def test_mine_pending_drops_unaffordable_batch(blockchain, sender, receiver):
+    blockchain.TX_PER_BLOCK = 1
+    # queued without reserving the sender's balance
+    blockchain.mempool.add(sign_tx(sender, receiver.address, 1000.0))
+
+    with pytest.raises(NotEnoughBalanceError):
+        blockchain.mine_pending(timeout=0)
+    assert len(blockchain.mempool) == 0
+    assert blockchain.mempool.stats()['removed'] == 1
+    assert blockchain.get_block_count() == 1
+
+
+def test_block_with_a_forged_signature_is_rejected(blockchain, sender,
+                                                   receiver):
+    transactions = [sign_tx(sender, receiver.address, index + 1.0)
+                    for index in range(8)]
+    transactions[5]['signature'] = transactions[4]['signature']
+    tip = blockchain.tree.tip
+    with pytest.raises(ValidationError, match='Invalid signature'):
+        blockchain.add_block(build_block(blockchain, tip, transactions))
+    assert blockchain.tree.tip is tip
+    assert blockchain.get_block_count() == 1
@@ -0,0 +1,50 @@
+from pycoin.cache import LRUCache, SizedLRUCache
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3,
+                             'misses': 1, 'hit_rate': 0.75}
+
+
+def test_sized_cache_evicts_by_bytes():
+    cache = SizedLRUCache(10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'
+    # 12 bytes, the least recently used block goes
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.bytes == 8
+    # several blocks go for a large one
+    cache.put('d', b'123456789')
+    assert cache.get('a') is None and cache.get('c') is None
+    assert cache.bytes == 9
+    assert len(cache) == 1
+
+
+def test_sized_cache_replaces_and_skips_too_large_values():
+    cache = SizedLRUCache(10)
+    cache.put('a', b'1234')
+    cache.put('a', b'12')
+    assert cache.bytes == 2
+    # larger than the whole cache, and not worth evicting everything for
+    cache.put('b', b'12345678901')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'12'
+    # the old value of a key is dropped even when the new one isn't kept
+    cache.put('a', b'12345678901')
+    assert cache.get('a') is None
+    assert cache.bytes == 0
+
+    cache.put('a', b'1234')
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+    assert cache.stats()['maxbytes'] == 10
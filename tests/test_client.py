@@ -0,0 +1,160 @@
+import asyncio
+import collections
+import http.server
+import threading
+import time
+
+import pytest
+
+from pycoin.api import create_app
+from pycoin.client import BlockchainHttpClient
+from tests.utils import build_block, create_wallet, serve_app, sign_tx
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers after ``delay`` seconds, with the statuses of ``statuses`` then
+    200s.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        server = self.server
+        server.requests[self.command] += 1
+        server.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(server.delay)
+        status = server.statuses.pop(0) if server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body) + 2))
+        self.end_headers()
+        self.wfile.write(b'[' + body + b']')
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def make_server():
+    started = []
+
+    def start_server():
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        server.requests = collections.Counter()
+        server.connections = set()
+        server.delay = 0
+        server.statuses = []
+        thread = threading.Thread(target=server.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.start()
+        started.append((server, thread))
+        return server
+
+    yield start_server
+    for server, thread in started:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server()
+
+
+@pytest.fixture
+def client(server):
+    client = BlockchainHttpClient('127.0.0.1:%d' % server.server_port,
+                                  timeout=0.2, retries=2, backoff=0)
+    yield client
+    client.close()
+
+
+def test_post_is_not_retried_after_a_timeout(server, client):
+    # the node got the transaction, but answers too late
+    server.delay = 0.5
+    with pytest.raises(OSError):
+        client.post_json('/tx/submit_batch', [])
+    assert server.requests['POST'] == 1
+
+
+def test_get_is_retried_after_a_timeout(server, client):
+    server.delay = 0.5
+    with pytest.raises(OSError):
+        client.get_json('/blockchain/block_count')
+    assert server.requests['GET'] == 3
+
+
+def test_unavailable_node_is_retried(server, client):
+    # a 503 means the node didn't handle the request
+    server.statuses = [503]
+    assert client.post_json('/tx/submit_batch', {'tx': 1}) == [{'tx': 1}]
+    assert server.requests['POST'] == 2
+    assert client.get_json('/blockchain/block_count') == []
+
+
+def test_connections_are_reused(server, client):
+    for _ in range(5):
+        client.get_json('/blockchain/block_count')
+    assert server.requests['GET'] == 5
+    assert len(server.connections) == 1
+
+
+def test_requests_take_turns_over_nodes(make_server):
+    servers = [make_server(), make_server()]
+    client = BlockchainHttpClient(
+        ['127.0.0.1:%d' % server.server_port for server in servers])
+    for _ in range(4):
+        client.get_json('/blockchain/block_count')
+    client.close()
+    assert [server.requests['GET'] for server in servers] == [2, 2]
+
+
+def test_unreachable_node_is_skipped(server):
+    # nothing listens on port 1, its requests are retried on the next node
+    client = BlockchainHttpClient(
+        ['127.0.0.1:1', '127.0.0.1:%d' % server.server_port], backoff=0)
+    for _ in range(4):
+        assert client.get_json('/blockchain/block_count') == []
+    client.close()
+    assert server.requests['GET'] == 4
+
+
+def test_get_balances_are_concurrent(server):
+    server.delay = 0.2
+    client = BlockchainHttpClient('127.0.0.1:%d' % server.server_port,
+                                  pool_size=8)
+    addresses = ['address%d' % position for position in range(8)]
+    start = time.time()
+    balances = asyncio.run(client.get_balances(addresses))
+    client.close()
+    # one after the other, they would take 1.6 seconds
+    assert time.time() - start < 1.0
+    assert balances == {address: [] for address in addresses}
+    assert server.requests['GET'] == 8
+
+
+def test_get_balances(blockchain, sender, receiver):
+    other = create_wallet()
+    blockchain.add_block(build_block(blockchain, blockchain.tree.tip, [
+        sign_tx(sender, receiver.address, 2.0)]))
+    tx = sender.create_tx(other.address, 1.0)
+    blockchain.submit_transaction(
+        tx['from'], tx['to'], tx['amount'], tx['ts'], tx['signature'],
+        tx['public_key'], tx.get('fee'), tx.get('key_type'))
+    addresses = [sender.address, receiver.address, other.address]
+
+    with serve_app(create_app(blockchain)) as node_addr:
+        client = BlockchainHttpClient(node_addr)
+        balances = asyncio.run(client.get_balances(addresses))
+        client.close()
+    assert balances == {address: {
+        'balance': blockchain.get_addr_balance(address),
+        'available': blockchain.get_available_balance(address),
+    } for address in addresses}
+    assert balances[receiver.address]['balance'] == 2.0
+    assert balances[other.address] == {'balance': 0.0, 'available': 0.0}
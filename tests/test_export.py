@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from pycoin import serialization
+from pycoin.api import create_app
+from pycoin.client import BlockchainHttpClient
+from tests.utils import extend_branch, serve_app
+
+
+def without_empty_reward_block(blocks):
+    """
+    The binary encoding has no room for rewards without a block, the
+    genesis ones, which then come without the ``block`` key.
+    """
+    return [dict(block, data=[
+        {k: v for k, v in item.items() if k != 'block' or v is not None}
+        for item in block['data']]) for block in blocks]
+
+
+@pytest.fixture
+def chain(blockchain, sender, receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 6, sender, receiver)
+    return blockchain
+
+
+@pytest.fixture
+def client(chain):
+    with serve_app(create_app(chain)) as node_addr:
+        client = BlockchainHttpClient(node_addr)
+        yield client
+        client.close()
+
+
+def test_export_ndjson(chain):
+    client = create_app(chain).test_client()
+    response = client.get('/blockchain/export?after=2&limit=3')
+    assert response.mimetype == 'application/x-ndjson'
+    blocks = [json.loads(line) for line in response.data.splitlines()]
+    assert blocks == chain.get_blocks(3, 6, verbose=True)
+
+    response = client.get('/blockchain/export?verbose=false')
+    blocks = [json.loads(line) for line in response.data.splitlines()]
+    assert blocks == chain.get_blocks(0, None)
+    assert 'signature' not in blocks[1]['data'][0]
+
+
+def test_export_binary(chain):
+    client = create_app(chain).test_client()
+    response = client.get('/blockchain/export?after=0&limit=4&format=binary')
+    assert response.mimetype == 'application/octet-stream'
+    blocks = list(serialization.read_block_records(io.BytesIO(response.data)))
+    assert blocks == chain.get_blocks(1, 5, verbose=True)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+@pytest.mark.parametrize('after', [-1, 0, 3])
+def test_iter_blocks_across_pages(chain, client, binary, after):
+    # pages of 3 blocks: the last page is full when 6 blocks come
+    client.EXPORT_PAGE_SIZE = 3
+    blocks = list(client.iter_blocks(after, binary=binary))
+    expected = chain.get_blocks(after + 1, None, verbose=True)
+    if binary:
+        expected = without_empty_reward_block(expected)
+    assert blocks == expected
+
+
+def test_iter_blocks_not_verbose(chain, client):
+    client.EXPORT_PAGE_SIZE = 4
+    assert list(client.iter_blocks(verbose=False)) == \
+        chain.get_blocks(0, None)
+
+
+def test_get_block_range(chain, client):
+    assert client.get_block_range(2, 3) == \
+        chain.get_blocks(2, 5, verbose=True)
+    assert client.get_block_range(6, 10) == \
+        chain.get_blocks(6, 7, verbose=True)
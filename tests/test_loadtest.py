@@ -0,0 +1,61 @@
+import pytest
+from click.testing import CliRunner
+
+from pycoin import node
+from pycoin.api import create_app
+from pycoin.loadtest import LoadTester, get_percentile
+from tests.utils import create_wallet, serve_waitress
+
+
+@pytest.fixture
+def node_addr(blockchain):
+    with serve_waitress(create_app(blockchain), threads=2) as node_addr:
+        yield node_addr
+
+
+def test_get_percentile():
+    values = list(range(1, 11))
+    assert [get_percentile(values, percent) for percent in (0, 50, 90, 99)] \
+        == [1, 5, 9, 10]
+    assert get_percentile([], 50) == 0.0
+
+
+def test_load_endpoints(blockchain, node_addr, sender, receiver):
+    tester = LoadTester(node_addr, concurrency=2, duration=0.2)
+    for requests in (tester.wallet_requests(receiver.address),
+                     tester.block_requests()):
+        report = tester.run('endpoint', requests)
+        assert report.requests > 0
+        assert report.errors == 0
+        assert report.latencies == sorted(report.latencies)
+
+    # the last transaction of a wallet without funds is refused
+    transactions = [sender.create_tx(receiver.address, 0.01)
+                    for _ in range(5)]
+    transactions.append(create_wallet().create_tx(receiver.address, 0.01))
+    tester.duration = 10
+    report = tester.run('submit', tester.submit_requests(transactions))
+    assert (report.requests, report.errors) == (6, 1)
+    assert len(blockchain.mempool) == 5
+
+
+def test_load_test_command(node_addr, receiver):
+    result = CliRunner().invoke(node.cli, [
+        'loadtest', '--node', node_addr, '--endpoint', 'wallets',
+        '--endpoint', 'blocks', '--duration', '0.2', '--concurrency', '2',
+        '--address', receiver.address])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert [line.split(':')[0] for line in lines] == ['wallets', 'blocks']
+    assert all('(0 errors)' in line and 'p99' in line for line in lines)
+
+
+def test_load_test_command_submits(blockchain, node_addr, receiver):
+    # signed by a new wallet, without funds
+    result = CliRunner().invoke(node.cli, [
+        'loadtest', '--node', node_addr, '--endpoint', 'submit',
+        '--transactions', '3', '--address', receiver.address])
+    assert result.exit_code == 0, result.output
+    assert 'Signing 3 transactions' in result.output
+    assert 'submit: 3 requests (3 errors)' in result.output
+    assert len(blockchain.mempool) == 0
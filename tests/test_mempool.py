@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from pycoin import mempool as mempool_module
+from pycoin.exceptions import ValidationError
+from pycoin.mempool import Mempool, get_tx_id, get_tx_size
+from tests.utils import create_wallet, sign_tx
+
+
+def test_take_batch_by_fee_in_sender_order(sender, receiver):
+    other = create_wallet()
+    first = sign_tx(sender, other.address, 1.0, fee=0.1)
+    second = sign_tx(sender, other.address, 1.0, fee=5.0)
+    third = sign_tx(receiver, other.address, 1.0, fee=1.0)
+    mempool = Mempool()
+    for tx in (first, second, third):
+        mempool.add(tx)
+
+    # the high fee of the second transaction waits for the first one
+    assert mempool.take_batch(2, timeout=0) == [third, first]
+    assert len(mempool) == 1
+    assert get_tx_id(first) in mempool
+    assert mempool.take_batch(2, timeout=0) == []
+
+    # back ahead of the transactions submitted since
+    mempool.restore([third, first])
+    assert mempool.take_batch(3, timeout=0) == [third, first, second]
+    mempool.confirm([third, first, second])
+    assert get_tx_id(first) not in mempool
+    assert mempool.stats()['mining'] == 0
+
+
+def test_cheapest_transactions_are_evicted(sender, receiver):
+    removed = []
+    mempool = Mempool(max_count=2, on_remove=removed.append)
+    transactions = [sign_tx(sender, receiver.address, 1.0, fee=fee)
+                    for fee in (1.0, 2.0, 3.0, 0.5)]
+    for tx in transactions[:3]:
+        mempool.add(tx)
+    assert removed == [get_tx_id(transactions[0])]
+    with pytest.raises(ValidationError, match='Mempool is full'):
+        mempool.add(transactions[3])
+    with pytest.raises(ValidationError, match='already submitted'):
+        mempool.add(transactions[1])
+
+    stats = mempool.stats()
+    assert stats['size'] == 2
+    assert stats['evicted'] == 1
+    assert (stats['min_fee'], stats['max_fee']) == (2.0, 3.0)
+
+
+def test_size_limit_in_bytes(sender, receiver):
+    transactions = [sign_tx(sender, receiver.address, 1.0, fee=fee)
+                    for fee in (2.0, 1.0, 3.0)]
+    sizes = [get_tx_size(tx) for tx in transactions]
+    mempool = Mempool(max_bytes=sizes[0] + sizes[1])
+    for tx in transactions:
+        mempool.add(tx)
+
+    assert get_tx_id(transactions[1]) not in mempool
+    assert mempool.stats()['bytes'] == sizes[0] + sizes[2]
+
+
+def test_waiting_transactions_expire(sender, receiver, monkeypatch):
+    removed = []
+    mempool = Mempool(expiry=60, on_remove=removed.append)
+    now = time.time()
+    monkeypatch.setattr(mempool_module.time, 'time', lambda: now)
+    old = sign_tx(sender, receiver.address, 1.0)
+    mempool.add(old)
+    now += 30
+    recent = sign_tx(sender, receiver.address, 2.0)
+    mempool.add(recent)
+
+    now += 31
+    mempool.expire()
+    assert removed == [get_tx_id(old)]
+    assert get_tx_id(recent) in mempool
+    assert mempool.stats()['expired'] == 1
@@ -0,0 +1,38 @@
+import sys
+import types
+
+from pycoin import node
+
+
+class App(object):
+    def __init__(self):
+        self.runs = []
+
+    def run(self, host, port, **kwargs):
+        self.runs.append(dict(kwargs, host=host, port=port))
+
+
+def test_start_defaults_to_no_debugger():
+    context = node.cli.commands['start'].make_context('start', [])
+    assert context.params['debug'] is False
+    assert context.params['threads'] is None
+
+
+def test_serve_debugger_only_on_localhost():
+    app = App()
+    node.serve(app, 8000)
+    node.serve(app, 8000, debug=True)
+    assert [(run['host'], run['debug']) for run in app.runs] == \
+        [('0.0.0.0', False), ('127.0.0.1', True)]
+
+
+def test_serve_with_threads(monkeypatch):
+    served = []
+    waitress = types.SimpleNamespace(
+        serve=lambda app, **kwargs: served.append(kwargs))
+    monkeypatch.setitem(sys.modules, 'waitress', waitress)
+    app = App()
+    node.serve(app, 8000, threads=8)
+    assert app.runs == []
+    assert served[0]['threads'] == 8
+    assert served[0]['port'] == 8000
@@ -0,0 +1,146 @@
+import time
+
+import pytest
+
+from pycoin.mempool import get_tx_id
+from pycoin.peers import PeerManager
+from tests.utils import (build_block, extend_branch, get_chain_hashes,
+                         serve_nodes, sign_tx)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
+
+
+def record_received(peers):
+    """
+    Records what ``peers`` answers to the items gossiped to it.
+    """
+    received = []
+    receive_tx, receive_block = peers.receive_tx, peers.receive_block
+
+    def record(receive, key):
+        def wrapper(data):
+            status = receive(data)
+            received.append((key(data), status))
+            return status
+        return wrapper
+    peers.receive_tx = record(receive_tx, get_tx_id)
+    peers.receive_block = record(receive_block, lambda block: block['hash'])
+    return received
+
+
+@pytest.fixture
+def make_nodes(make_blockchain):
+    """
+    Opens blockfile blockchains, the sqlite storage being one per process.
+    """
+    def open_nodes(count):
+        return [make_blockchain('blockfile', name='node%d' % index)
+                for index in range(count)]
+    return open_nodes
+
+
+def test_gossip_goes_around_once(make_nodes, sender, receiver):
+    first, second = make_nodes(2)
+    with serve_nodes([first, second]) as (apps, _):
+        first_received = record_received(apps[0].peers)
+        second_received = record_received(apps[1].peers)
+
+        tx = sign_tx(sender, receiver.address, 1.0)
+        tx_id = get_tx_id(tx)
+        assert apps[0].peers.receive_tx(tx) == 'accepted'
+        wait_for(lambda: len(first_received) == 2)
+        # the second node accepted it and sent it back, the first one knew it
+        assert second_received == [(tx_id, 'accepted')]
+        assert first_received[1:] == [(tx_id, 'known')]
+        assert tx_id in second.mempool
+
+        block = build_block(second, second.tree.tip, [
+            sign_tx(sender, receiver.address, 2.0)])
+        second.add_block(block)
+        wait_for(lambda: len(second_received) == 2)
+        assert first_received[2:] == [(block['hash'], 'accepted')]
+        assert second_received[1:] == [(block['hash'], 'known')]
+        assert first.tree.tip.hash == block['hash']
+
+        # gossiped again, by a third node say
+        assert apps[1].peers.receive_tx(tx) == 'known'
+        assert apps[0].peers.receive_block(block) == 'known'
+
+
+def test_orphan_block_starts_a_sync(make_nodes, sender, receiver):
+    first, second = make_nodes(2)
+    blocks = extend_branch(second, second.tree.tip, 5, sender, receiver)
+    with serve_nodes([first, second]) as (apps, _):
+        assert apps[0].peers.receive_block(blocks[-1]) == 'syncing'
+        wait_for(lambda: first.tree.tip.hash == blocks[-1]['hash'])
+    assert get_chain_hashes(first) == get_chain_hashes(second)
+
+
+def test_sync_steps_back_to_the_fork(make_nodes, sender, receiver):
+    first, second = make_nodes(2)
+    for block in extend_branch(second, second.tree.tip, 3, sender, receiver):
+        first.add_block(block)
+    extend_branch(first, first.tree.tip, 2, sender, receiver)
+    extend_branch(second, second.tree.tip, 4, sender, receiver, amount=0.02)
+    with serve_nodes([first, second]) as (apps, _):
+        peers = apps[0].peers
+        # the first range requested doesn't reach back to the fork
+        peers.SYNC_RANGE_SIZE = 2
+        fetched = []
+        fetch_range = peers.fetch_range
+
+        def record_fetch(sources, start, count):
+            fetched.append(start)
+            return fetch_range(sources, start, count)
+        peers.fetch_range = record_fetch
+
+        report = peers.sync()
+    assert fetched[0] == 6
+    assert min(fetched) == 4
+    assert report.height == 8
+    assert get_chain_hashes(first) == get_chain_hashes(second)
+
+
+def test_sync_spreads_ranges_over_peers(make_nodes, sender, receiver):
+    first, second, third, short = make_nodes(4)
+    blocks = extend_branch(second, second.tree.tip, 12, sender, receiver)
+    for block in blocks:
+        third.add_block(block)
+    for block in blocks[:6]:
+        short.add_block(block)
+    with serve_nodes([first, second, third, short]) as (apps, addrs):
+        peers = apps[0].peers
+        peers.SYNC_RANGE_SIZE = 2
+        served = {}
+        for addr, client in peers.clients.items():
+            def get_block_range(start, count, addr=addr,
+                                get_block_range=client.get_block_range):
+                served.setdefault(addr, []).append(start)
+                return get_block_range(start, count)
+            client.get_block_range = get_block_range
+
+        report = peers.sync()
+    assert report.blocks == 12
+    assert report.height == 13
+    assert get_chain_hashes(first) == get_chain_hashes(second)
+    # every peer holding a range took some, the short chain only early ones
+    assert set(served) == set(addrs[1:])
+    assert max(served[addrs[3]]) + 2 <= 7
+    assert sorted(start for starts in served.values() for start in starts) \
+        == list(range(1, 13, 2))
+
+
+def test_sync_skips_unreachable_peers(make_nodes, sender, receiver):
+    first, second = make_nodes(2)
+    blocks = extend_branch(second, second.tree.tip, 4, sender, receiver)
+    with serve_nodes([first, second]) as (apps, addrs):
+        peers = PeerManager(first, ['127.0.0.1:1', addrs[1]])
+        report = peers.sync()
+    assert report.blocks == 4
+    assert first.tree.tip.hash == blocks[-1]['hash']
@@ -0,0 +1,228 @@
+import os
+import threading
+
+import pytest
+
+from pycoin.mempool import get_tx_id
+from pycoin.persistence import STORAGE_BACKENDS, get_storage
+from pycoin.persistence.blockfile import INDEX_RECORD, BlockFileStorage
+from pycoin.persistence.models import (AddressHistory, Block, BlockData,
+                                       Reward, db)
+from pycoin.persistence.sqlite import SqliteStorage
+from tests.utils import make_block_data, sign_tx
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def storage(request, tmp_path):
+    path = tmp_path / 'blocks'
+    if request.param == 'sqlite':
+        path.mkdir()
+        path = path / 'blockchain.db'
+    storage = get_storage(request.param, str(path))
+    yield storage
+    storage.close()
+
+
+def make_chain(sender, receiver, count, start=0, previous_hash=''):
+    """
+    Blocks with one transaction each, of ``index + 1`` coins.
+    """
+    blocks = []
+    for index in range(start, start + count):
+        block = make_block_data(index, previous_hash, [
+            sign_tx(sender, receiver.address, index + 1.0)])
+        previous_hash = block['hash']
+        blocks.append(block)
+    return blocks
+
+
+def test_append_block_round_trip(storage, sender, receiver):
+    # more entries than rows per INSERT statement
+    entries = [sign_tx(sender, receiver.address, index + 1.0)
+               for index in range(SqliteStorage.INSERT_BATCH_SIZE * 2 + 1)]
+    entries.insert(1, {'type': 'reward', 'to': receiver.address,
+                       'amount': 1.0, 'ts': entries[0]['ts'],
+                       'reason': Reward.REASON_MINE, 'block': 0})
+    blocks = [make_block_data(0, '', entries[:1]),
+              make_block_data(1, '%064x' % 1, entries)]
+    for block in blocks:
+        storage.append_block(block)
+
+    assert storage.get_block_count() == 2
+    assert storage.get_blocks(0, 2) == blocks
+
+
+def test_failed_append_leaves_no_block(tmp_path, sender, receiver,
+                                       monkeypatch):
+    storage = SqliteStorage(str(tmp_path / 'blockchain.db'))
+    block = make_block_data(0, '', [sign_tx(sender, receiver.address, 1.0)])
+    storage.append_block(block)
+    failed = sign_tx(sender, receiver.address, 2.0)
+
+    def fail(block_data):
+        raise RuntimeError('disk full')
+    # the last rows of a block are written after its transactions
+    monkeypatch.setattr(AddressHistory, 'rows_for_block', fail)
+    with pytest.raises(RuntimeError):
+        storage.append_block(make_block_data(1, block['hash'], [failed]))
+
+    assert storage.get_blocks(0, 2) == [block]
+    assert storage.get_tx_block(get_tx_id(failed)) is None
+    storage.close()
+
+
+def test_wal_reads_while_a_block_is_written(tmp_path, sender, receiver):
+    storage = SqliteStorage(str(tmp_path / 'blockchain.db'), mode='wal')
+    block = make_block_data(0, '', [sign_tx(sender, receiver.address, 1.0)])
+    storage.append_block(block)
+    counts = []
+
+    # the lock a commit takes, which locks readers out of a rollback journal
+    with db.atomic('EXCLUSIVE'):
+        Block.create(index=1, previous_hash=block['hash'], hash='%064x' % 2,
+                     ts=block['timestamp'], nonce=0)
+        # API threads read through their own read only connection
+        reader = threading.Thread(
+            target=lambda: counts.append(storage.get_block_count()))
+        reader.start()
+        reader.join(timeout=5)
+        assert counts == [1]
+    assert storage.get_block_count() == 2
+    storage.close()
+
+
+def test_lookup_indexes(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'blockchain.db'))
+    for model, column in [(Reward, 'to_addr'), (BlockData, 'block_id')]:
+        indexes = db.get_indexes(model._meta.table_name)
+        assert [column] in [index.columns for index in indexes]
+    storage.close()
+
+
+def test_delete_blocks(storage, sender, receiver):
+    blocks = make_chain(sender, receiver, 5)
+    for block in blocks:
+        storage.append_block(block)
+
+    storage.delete_blocks(3)
+    assert storage.get_block_count() == 3
+    assert storage.get_blocks(0, 5) == blocks[:3]
+    for block in blocks:
+        tx_id = get_tx_id(block['data'][0])
+        expected = block['index'] if block['index'] < 3 else None
+        assert storage.get_tx_block(tx_id) == expected
+    # the deleted transactions are gone from the histories of both sides
+    assert [entry['received'] for entry in
+            storage.get_address_history(receiver.address)] == [1.0, 2.0, 3.0]
+    assert [entry['sent'] for entry in
+            storage.get_address_history(sender.address)] == [1.0, 2.0, 3.0]
+    page, _ = storage.get_address_history_page(receiver.address, 10)
+    assert [entry['received'] for entry in page] == [3.0, 2.0, 1.0]
+
+    storage.delete_blocks(3)
+    assert storage.get_block_count() == 3
+    # another branch takes the place of the deleted blocks
+    branch = make_chain(sender, receiver, 2, start=3,
+                        previous_hash=blocks[2]['hash'])
+    for block in branch:
+        storage.append_block(block)
+    assert storage.get_blocks(0, 5) == blocks[:3] + branch
+
+
+def open_blockfile(path, segment_size=None, monkeypatch=None):
+    if segment_size is not None:
+        monkeypatch.setattr(BlockFileStorage, 'SEGMENT_SIZE', segment_size)
+    return BlockFileStorage(str(path))
+
+
+@pytest.fixture
+def blockfile_chain(tmp_path, sender, receiver):
+    """
+    A closed blockfile storage of 3 blocks, and its blocks.
+    """
+    blocks = make_chain(sender, receiver, 3)
+    storage = BlockFileStorage(str(tmp_path / 'blocks'))
+    for block in blocks:
+        storage.append_block(block)
+    storage.close()
+    return storage, blocks
+
+
+def assert_recovered(storage, blocks, sender, receiver):
+    """
+    Checks that a storage recovered the ``blocks`` and appends after them
+    as usual.
+    """
+    assert storage.get_block_count() == len(blocks)
+    assert storage.get_blocks(0, len(blocks) + 1) == blocks
+    assert os.path.getsize(storage.get_index_path()) == \
+        len(blocks) * INDEX_RECORD.size
+    segment, offset, length, _ = storage._index[-1]
+    assert os.path.getsize(storage.get_segment_path(segment)) == \
+        offset + length
+    assert not os.path.exists(storage.get_segment_path(segment + 1))
+    [block] = make_chain(sender, receiver, 1, start=len(blocks),
+                         previous_hash=blocks[-1]['hash'])
+    storage.append_block(block)
+    storage.close()
+    storage = BlockFileStorage(storage.directory)
+    assert storage.get_blocks(0, len(blocks) + 2) == blocks + [block]
+    assert storage.get_tx_block(get_tx_id(block['data'][0])) == len(blocks)
+    storage.close()
+
+
+def test_recover_partial_index_record(blockfile_chain, sender, receiver):
+    storage, blocks = blockfile_chain
+    with open(storage.get_index_path(), 'ab') as f:
+        f.write(INDEX_RECORD.pack(0, 10 ** 6, 100, bytes(32))[:10])
+
+    assert_recovered(BlockFileStorage(storage.directory), blocks, sender,
+                     receiver)
+
+
+def test_recover_index_past_segment_end(blockfile_chain, sender, receiver):
+    storage, blocks = blockfile_chain
+    # the last block was only partly written when its index record was
+    segment, offset, length, _ = storage._index[-1]
+    with open(storage.get_segment_path(segment), 'ab') as f:
+        f.truncate(offset + length // 2)
+
+    recovered = BlockFileStorage(storage.directory)
+    assert recovered.get_tx_block(get_tx_id(blocks[-1]['data'][0])) is None
+    assert_recovered(recovered, blocks[:-1], sender, receiver)
+
+
+@pytest.mark.parametrize('segment_size', [None, 1])
+def test_recover_unindexed_data(tmp_path, sender, receiver, monkeypatch,
+                                segment_size):
+    # with a segment size of 1, every block has a segment of its own
+    blocks = make_chain(sender, receiver, 3)
+    storage = open_blockfile(tmp_path / 'blocks', segment_size, monkeypatch)
+    for block in blocks:
+        storage.append_block(block)
+    storage.close()
+    # blocks written without their index record
+    with open(storage.get_index_path(), 'ab') as f:
+        f.truncate(INDEX_RECORD.size)
+
+    recovered = BlockFileStorage(storage.directory)
+    for block in blocks[1:]:
+        tx_id = get_tx_id(block['data'][0])
+        assert recovered.get_tx_block(tx_id) is None
+    assert [entry['received'] for entry in
+            recovered.get_address_history(receiver.address)] == [1.0]
+    assert_recovered(recovered, blocks[:1], sender, receiver)
+
+
+def test_delete_blocks_across_segments(tmp_path, sender, receiver,
+                                       monkeypatch):
+    blocks = make_chain(sender, receiver, 4)
+    storage = open_blockfile(tmp_path / 'blocks', 1, monkeypatch)
+    for block in blocks:
+        storage.append_block(block)
+    # maps the segments about to be deleted
+    assert storage.get_blocks(0, 4) == blocks
+
+    storage.delete_blocks(1)
+    assert storage.get_blocks(0, 4) == blocks[:1]
+    assert_recovered(storage, blocks[:1], sender, receiver)
@@ -0,0 +1,49 @@
+import pytest
+
+from pycoin.blockchain import Blockchain
+from pycoin.consts import Difficulty
+from pycoin.merkle import get_merkle_root
+from pycoin.pow.backends import MultiprocessMiningBackend
+from pycoin.pow.sha256_hash_pow import Sha256ProofOfWork, format_target
+from tests.utils import sign_tx
+
+
+def make_block(version, transactions, target=Difficulty.INITIAL_TARGET):
+    block = {
+        'index': 1,
+        'previous_hash': '00' * 32,
+        'timestamp': 1500000000.0,
+        'nonce': 0,
+        'target': format_target(target),
+        'data': transactions,
+    }
+    if version > 1:
+        block['version'] = version
+        block['merkle_root'] = get_merkle_root(transactions)
+    return block
+
+
+@pytest.mark.parametrize('version', [1, Blockchain.BLOCK_VERSION])
+def test_search_finds_lowest_valid_nonce(sender, receiver, version):
+    block = make_block(version, [sign_tx(sender, receiver.address, 1.0)])
+    nonce, block_hash = Sha256ProofOfWork(block).search_for_correct_hash()
+
+    proof_of_work = Sha256ProofOfWork(block)
+    assert proof_of_work.hash_block(dict(block, nonce=nonce)) == block_hash
+    assert Sha256ProofOfWork.verify(dict(block, nonce=nonce,
+                                         hash=block_hash))
+    for lower in range(nonce):
+        assert not proof_of_work.hash_is_valid(
+            proof_of_work.hash_block(dict(block, nonce=lower)))
+    # searching a later range continues from the same midstate
+    assert proof_of_work.search_range(nonce + 1, nonce + 1) is None
+    assert proof_of_work.search_range(0, nonce + 1) == (nonce, block_hash)
+
+
+def test_multiprocess_search_finds_valid_nonce(sender, receiver):
+    block = make_block(Blockchain.BLOCK_VERSION,
+                       [sign_tx(sender, receiver.address, 1.0)],
+                       target=Difficulty.INITIAL_TARGET >> 4)
+    backend = MultiprocessMiningBackend(workers=2, chunk_size=2 ** 10)
+    nonce, block_hash = backend.search(block)
+    assert Sha256ProofOfWork.verify(dict(block, nonce=nonce, hash=block_hash))
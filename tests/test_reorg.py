@@ -0,0 +1,154 @@
+import json
+
+import pytest
+
+from pycoin.balances import AccountStateIndex
+from pycoin.exceptions import NotEnoughBalanceError
+from pycoin.mempool import get_tx_id
+from pycoin.verifier import ChainVerifier
+from tests.utils import (build_block, extend_branch, get_chain_hashes,
+                         sign_tx, submit_tx)
+
+
+def assert_state_matches_storage(blockchain, *wallets):
+    stored = AccountStateIndex.from_storage(blockchain.storage)
+    for wallet in wallets:
+        assert blockchain.get_addr_balance(wallet.address) == pytest.approx(
+            stored.get_balance(wallet.address))
+
+
+@pytest.mark.parametrize('depth', [1, 5, 25])
+def test_deep_reorg(blockchain, sender, receiver, tmp_path, depth):
+    extend_branch(blockchain, blockchain.tree.tip, 2, sender, receiver)
+    fork_point = blockchain.tree.tip
+    old_blocks = extend_branch(blockchain, fork_point, depth, sender,
+                               receiver)
+    old_tip = blockchain.tree.tip
+    # warms the block cache with the blocks about to be rolled back
+    blockchain.get_serialized_blocks(0, None)
+
+    new_blocks = extend_branch(blockchain, fork_point, depth, sender,
+                               receiver, amount=0.02)
+    # as much work as the main chain isn't enough
+    assert blockchain.tree.tip is old_tip
+    new_blocks += extend_branch(
+        blockchain, blockchain.tree.get(new_blocks[-1]['hash']), 1, sender,
+        receiver, amount=0.02)
+
+    assert blockchain.tree.tip.hash == new_blocks[-1]['hash']
+    assert blockchain.get_block_count() == fork_point.index + depth + 2
+    assert get_chain_hashes(blockchain)[fork_point.index + 1:] == \
+        [block['hash'] for block in new_blocks]
+    assert [json.loads(block) for block in
+            blockchain.get_serialized_blocks(0, None)] == \
+        blockchain.get_blocks(0, None)
+    for block in new_blocks:
+        tx_id = get_tx_id(block['data'][0])
+        assert blockchain.get_tx_status(tx_id) == {
+            'status': 'confirmed', 'block': block['index']}
+    # the abandoned branch is kept aside, its transactions are pending again
+    for block in old_blocks:
+        assert block['hash'] in blockchain.tree
+        tx_id = get_tx_id(block['data'][0])
+        assert blockchain.get_tx_status(tx_id) == {'status': 'pending'}
+    assert len(blockchain.mempool) == depth
+    assert_state_matches_storage(blockchain, sender, receiver)
+    report = ChainVerifier(blockchain, 1, str(tmp_path / 'verified.json'))\
+        .verify(full=True)
+    assert report.error is None
+    assert report.last_index == blockchain.get_block_count() - 1
+
+
+def test_back_and_forth_reorgs(blockchain, sender, receiver):
+    fork_point = blockchain.tree.tip
+    first = extend_branch(blockchain, fork_point, 3, sender, receiver)
+    second = extend_branch(blockchain, fork_point, 4, sender, receiver,
+                           amount=0.02)
+    assert blockchain.tree.tip.hash == second[-1]['hash']
+    first += extend_branch(blockchain, blockchain.tree.get(first[-1]['hash']),
+                           2, sender, receiver)
+    assert blockchain.tree.tip.hash == first[-1]['hash']
+    assert get_chain_hashes(blockchain)[1:] == \
+        [block['hash'] for block in first]
+    assert len(blockchain.mempool) == len(second)
+    assert_state_matches_storage(blockchain, sender, receiver)
+
+
+def test_invalid_branch_restores_chain(blockchain, sender, receiver):
+    fork_point = blockchain.tree.tip
+    extend_branch(blockchain, fork_point, 2, sender, receiver)
+    old_tip = blockchain.tree.tip
+    old_hashes = get_chain_hashes(blockchain)
+    balance = blockchain.get_addr_balance(sender.address)
+    side_blocks = extend_branch(blockchain, fork_point, 2, sender, receiver,
+                                amount=0.02)
+    invalid = build_block(blockchain,
+                          blockchain.tree.get(side_blocks[-1]['hash']),
+                          [sign_tx(sender, receiver.address, 1000.0)])
+
+    # the heavier branch only turns out invalid once it is applied
+    with pytest.raises(NotEnoughBalanceError):
+        blockchain.add_block(invalid)
+
+    assert blockchain.tree.tip is old_tip
+    assert get_chain_hashes(blockchain) == old_hashes
+    assert blockchain.get_addr_balance(sender.address) == \
+        pytest.approx(balance)
+    assert invalid['hash'] not in blockchain.tree
+    assert len(blockchain.mempool) == 0
+    assert_state_matches_storage(blockchain, sender, receiver)
+    # the valid blocks of the branch are kept, it can still win
+    valid = build_block(blockchain,
+                        blockchain.tree.get(side_blocks[-1]['hash']),
+                        [sign_tx(sender, receiver.address, 0.02)])
+    blockchain.add_block(valid)
+    assert get_chain_hashes(blockchain)[1:] == \
+        [block['hash'] for block in side_blocks + [valid]]
+    assert_state_matches_storage(blockchain, sender, receiver)
+
+
+def test_reorg_requeues_orphaned_transactions(blockchain, sender, receiver):
+    fork_point = blockchain.tree.tip
+    shared = sign_tx(sender, receiver.address, 1.0)
+    orphaned = sign_tx(sender, receiver.address, 2.0)
+    blockchain.add_block(build_block(blockchain, fork_point,
+                                     [shared, orphaned]))
+    new_block = build_block(blockchain, fork_point, [shared])
+    blockchain.add_block(new_block)
+    blockchain.add_block(build_block(
+        blockchain, blockchain.tree.get(new_block['hash']),
+        [sign_tx(sender, receiver.address, 3.0)]))
+
+    assert blockchain.get_tx_status(get_tx_id(shared)) == {
+        'status': 'confirmed', 'block': 1}
+    assert blockchain.get_tx_status(get_tx_id(orphaned)) == {
+        'status': 'pending'}
+    assert len(blockchain.mempool) == 1
+    # the requeued transaction reserves its amount again
+    assert blockchain.get_available_balance(sender.address) == \
+        pytest.approx(blockchain.get_addr_balance(sender.address) - 2.0)
+
+
+def test_reorg_drops_overdrawn_pending_transactions(blockchain, sender,
+                                                    receiver):
+    fork_point = blockchain.tree.tip
+    orphaned = sign_tx(sender, receiver.address, 10.0)
+    blockchain.add_block(build_block(blockchain, fork_point, [orphaned]))
+    overdrawn = submit_tx(blockchain, sender, receiver.address, 30.0)
+    assert blockchain.get_available_balance(sender.address) == \
+        pytest.approx(10.0)
+
+    # the new branch spends 40 of the 50 coins the pending ones reserved
+    new_block = build_block(blockchain, fork_point,
+                            [sign_tx(sender, receiver.address, 20.0)])
+    blockchain.add_block(new_block)
+    blockchain.add_block(build_block(
+        blockchain, blockchain.tree.get(new_block['hash']),
+        [sign_tx(sender, receiver.address, 20.0)]))
+
+    assert blockchain.get_tx_status(overdrawn) is None
+    assert blockchain.get_tx_status(get_tx_id(orphaned)) == {
+        'status': 'pending'}
+    assert blockchain.get_available_balance(sender.address) == \
+        pytest.approx(0.0)
+    assert blockchain.mempool.stats()['removed'] == 1
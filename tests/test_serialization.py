@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+from pycoin import serialization
+from pycoin.exceptions import ValidationError
+from pycoin.persistence.models import Reward
+from pycoin.wallet import KEY_TYPE_SECP256K1
+from tests.utils import create_wallet, make_block_data, sign_tx
+
+
+@pytest.fixture(scope='module')
+def secp256k1_wallet():
+    return create_wallet(KEY_TYPE_SECP256K1)
+
+
+@pytest.fixture
+def transactions(sender, receiver, rsa_wallet, secp256k1_wallet):
+    """
+    Transactions of every key type, with and without a fee.
+    """
+    return [sign_tx(sender, receiver.address, 1.0),
+            sign_tx(rsa_wallet, receiver.address, 2.0, fee=0.25),
+            sign_tx(secp256k1_wallet, receiver.address, 3.0),
+            sign_tx(sender, rsa_wallet.address, 4.0, fee=0.5),
+            sign_tx(rsa_wallet, sender.address, 5.0)]
+
+
+def test_block_round_trip(transactions, receiver):
+    rewards = [{'type': 'reward', 'to': receiver.address, 'amount': 50.0,
+                'ts': 1.0, 'reason': Reward.INITIAL_CAPITAL},
+               {'type': 'reward', 'to': receiver.address, 'amount': 1.0,
+                'ts': 2.0, 'reason': Reward.REASON_MINE, 'block': 7}]
+    block = make_block_data(3, 'ab' * 32, rewards + transactions)
+    assert serialization.decode_block(serialization.encode_block(block)) == \
+        block
+
+
+def test_genesis_and_version_1_round_trip(receiver):
+    block = {'index': 0, 'previous_hash': '', 'timestamp': 1.5,
+             'nonce': 12, 'hash': 'cd' * 32, 'data': [
+                 {'type': 'reward', 'to': receiver.address, 'amount': 50.0,
+                  'ts': 1.5, 'reason': Reward.INITIAL_CAPITAL}]}
+    assert serialization.decode_block(serialization.encode_block(block)) == \
+        block
+
+
+def test_stream_references_known_keys(transactions):
+    blocks = [make_block_data(index, '%064x' % index, transactions)
+              for index in range(1, 4)]
+    key_table = serialization.KeyTable()
+    records = [serialization.encode_block_record(block, key_table)
+               for block in blocks]
+    # the senders' keys are only written in the first block
+    assert len(records[1]) == len(records[2]) < len(records[0])
+    assert list(serialization.read_block_records(
+        io.BytesIO(b''.join(records)))) == blocks
+    # a record can't be read without the blocks before it
+    with pytest.raises(ValueError, match='Unknown public key reference'):
+        list(serialization.read_block_records(io.BytesIO(records[1])))
+
+
+def test_truncated_stream_is_refused(transactions):
+    record = serialization.encode_block_record(
+        make_block_data(1, '', transactions), serialization.KeyTable())
+    for size in (2, len(record) - 1):
+        with pytest.raises(ValueError):
+            list(serialization.read_block_records(io.BytesIO(record[:size])))
+
+
+def test_invalid_entries_are_refused(transactions):
+    for item in [dict(transactions[0], key_type='dsa'),
+                 dict(transactions[0], to='short.py'),
+                 {'type': 'coinbase'}]:
+        block = dict(make_block_data(1, '', []), data=[item])
+        with pytest.raises((ValueError, ValidationError)):
+            serialization.encode_block(block)
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import (
+    decode_dss_signature, encode_dss_signature)
+
+from pycoin.exceptions import ValidationError
+from pycoin.signatures import SignatureVerifier
+from pycoin.wallet import (KEY_TYPE_ED25519, KEY_TYPE_RSA, KEY_TYPE_SECP256K1,
+                           KEY_TYPES, SECP256K1_ORDER, KeySerializer)
+from tests.utils import create_wallet, sign_tx
+
+
+@pytest.fixture(scope='module', params=KEY_TYPES)
+def wallet(request, rsa_wallet):
+    if request.param == KEY_TYPE_RSA:
+        return rsa_wallet
+    return create_wallet(request.param)
+
+
+def test_verify_caches_valid_signatures(wallet, receiver):
+    verifier = SignatureVerifier()
+    tx = sign_tx(wallet, receiver.address, 1.0)
+    verifier.verify_tx(tx)
+    verifier.verify_tx(tx)
+    verifier.verify_tx(sign_tx(wallet, receiver.address, 2.0))
+
+    stats = verifier.stats()
+    assert stats['verified_signatures']['hits'] == 1
+    assert stats['verified_signatures']['size'] == 2
+    # the second transaction of the sender reuses its loaded key
+    assert stats['public_keys']['misses'] == 1
+    assert stats['public_keys']['hits'] == 1
+
+
+def test_verify_rejects_altered_transactions(wallet, receiver):
+    verifier = SignatureVerifier()
+    tx = sign_tx(wallet, receiver.address, 1.0)
+    verifier.verify_tx(tx)
+    # a verified signature doesn't vouch for other contents
+    with pytest.raises(ValidationError):
+        verifier.verify_tx(dict(tx, amount=100.0))
+    with pytest.raises(ValidationError):
+        verifier.verify_tx(dict(tx, public_key=receiver.pub_key))
+    assert verifier.stats()['verified_signatures']['size'] == 1
+
+
+def test_verify_rejects_high_s_signatures(receiver):
+    wallet = create_wallet(KEY_TYPE_SECP256K1)
+    tx = sign_tx(wallet, receiver.address, 1.0)
+    r, s = decode_dss_signature(bytes.fromhex(tx['signature']))
+    assert s <= SECP256K1_ORDER // 2
+    # the same signature with the other s is just as valid for ECDSA, and
+    # would give the transaction another id
+    high_s = encode_dss_signature(r, SECP256K1_ORDER - s)
+    signed_data = {key: value for key, value in tx.items()
+                   if key not in ('type', 'signature')}
+    KeySerializer.hex_to_pub_key(tx['public_key'], KEY_TYPE_SECP256K1).verify(
+        high_s, json.dumps(signed_data, sort_keys=True).encode(),
+        ec.ECDSA(hashes.SHA256()))
+
+    verifier = SignatureVerifier()
+    with pytest.raises(ValidationError):
+        verifier.verify_tx(dict(tx, signature=high_s.hex()))
+    verifier.verify_tx(tx)
+
+
+def test_key_type_defaults_to_rsa(rsa_wallet, receiver):
+    verifier = SignatureVerifier()
+    # transactions signed before key types existed have none
+    tx = sign_tx(rsa_wallet, receiver.address, 1.0)
+    assert 'key_type' not in tx
+    verifier.verify_tx(tx)
+
+    other = sign_tx(create_wallet(KEY_TYPE_ED25519), receiver.address, 1.0)
+    del other['key_type']
+    with pytest.raises(ValidationError):
+        verifier.verify_tx(other)
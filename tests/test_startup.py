@@ -0,0 +1,38 @@
+import json
+
+from tests.utils import run_python
+
+LOADED_MODULES = '''
+import json, sys
+{imports}
+print(json.dumps(sorted(name for name in sys.modules
+                        if name.split('.')[0] in ('cryptography', 'flask'))))
+'''
+
+
+def get_loaded_modules(home, imports):
+    process = run_python(['-c', LOADED_MODULES.format(imports=imports)], home,
+                         check=True)
+    # the last line, after the output of the command
+    loaded = json.loads(process.stdout.splitlines()[-1])
+    return {name.split('.')[0] for name in loaded}
+
+
+def test_wallet_list_skips_heavy_imports(tmp_path):
+    (tmp_path / '.pycoin' / 'wallets').mkdir(parents=True)
+    (tmp_path / '.pycoin' / 'wallets' / 'savings').write_text('{}')
+    imports = '''
+from pycoin.wallet import cli
+cli.main(['list'], standalone_mode=False)
+'''
+    assert get_loaded_modules(tmp_path, imports) == set()
+    process = run_python(['-m', 'pycoin.wallet', 'list'], tmp_path,
+                         check=True)
+    assert process.stdout.split() == [b'savings']
+
+
+def test_node_import_has_no_side_effects(tmp_path):
+    imports = 'import pycoin.node, pycoin.persistence.models'
+    assert get_loaded_modules(tmp_path, imports) == set()
+    # neither the data directory nor the database is created
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from pycoin.persistence.models import Reward
+from pycoin.verifier import ChainVerifier
+from tests.utils import build_block, extend_branch, sign_tx
+
+
+@pytest.fixture
+def verifier(blockchain, tmp_path):
+    return ChainVerifier(blockchain, 1, str(tmp_path / 'verified.json'))
+
+
+def append_unchecked(blockchain, transactions):
+    """
+    Stores a mined block after the tip without validating it, as a tampered
+    database would hold it.
+    """
+    block = build_block(blockchain, blockchain.tree.tip, transactions)
+    blockchain.storage.append_block(block)
+    return block
+
+
+def test_verify_resumes_from_checkpoint(blockchain, verifier, sender,
+                                        receiver):
+    extend_branch(blockchain, blockchain.tree.tip, 3, sender, receiver)
+    report = verifier.verify()
+    assert (report.first_index, report.last_index, report.error) == \
+        (0, 3, None)
+    extend_branch(blockchain, blockchain.tree.tip, 2, sender, receiver)
+    report = verifier.verify()
+    assert (report.first_index, report.blocks, report.error) == (4, 2, None)
+
+
+@pytest.mark.parametrize('checkpointed', [False, True])
+def test_verify_detects_replayed_transactions(blockchain, verifier, sender,
+                                              receiver, checkpointed):
+    block = extend_branch(blockchain, blockchain.tree.tip, 1, sender,
+                          receiver)[0]
+    if checkpointed:
+        assert verifier.verify().error is None
+    append_unchecked(blockchain, block['data'])
+
+    error = verifier.verify().error
+    assert error.index == 2
+    assert 'confirmed twice' in str(error)
+
+
+def test_verify_detects_rewards_after_genesis(blockchain, verifier,
+                                              receiver):
+    append_unchecked(blockchain, [{
+        'type': 'reward', 'to': receiver.address, 'amount': 100.0,
+        'ts': blockchain.tree.tip.ts, 'reason': Reward.REASON_MINE}])
+
+    error = verifier.verify().error
+    assert error.index == 1
+    assert 'only the genesis block' in str(error)
+
+
+def test_verify_detects_invalid_amounts(blockchain, verifier, sender,
+                                        receiver):
+    append_unchecked(blockchain, [
+        dict(sign_tx(sender, receiver.address, 1.0), amount=-1.0)])
+
+    error = verifier.verify().error
+    assert error.index == 1
+    assert 'invalid amount or fee' in str(error)
+
+
+def test_checkpoint_without_tx_ids_is_ignored(blockchain, verifier, sender,
+                                              receiver):
+    block = extend_branch(blockchain, blockchain.tree.tip, 1, sender,
+                          receiver)[0]
+    assert verifier.verify().error is None
+    with open(verifier.checkpoint_path) as f:
+        checkpoint = json.load(f)
+    del checkpoint['tx_ids']
+    with open(verifier.checkpoint_path, 'w') as f:
+        json.dump(checkpoint, f)
+    append_unchecked(blockchain, block['data'])
+
+    report = verifier.verify()
+    assert report.first_index == 0
+    assert report.error.index == 2
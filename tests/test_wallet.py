@@ -0,0 +1,115 @@
+import json
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from pycoin import wallet as wallet_cli
+from pycoin.client import BlockchainHttpClient
+from pycoin.consts import Paths
+from pycoin.exceptions import ClientError
+from pycoin.wallet import KEY_TYPE_ED25519, KeySerializer, Wallet, WalletManager
+
+
+@pytest.fixture
+def payouts(tmp_path, monkeypatch, sender, receiver):
+    """
+    A saved wallet of ``sender``, with 'password' as password, and a CSV
+    file of five payouts.
+    """
+    monkeypatch.setattr(Paths, 'WALLET_DIR', str(tmp_path / 'wallets'))
+    (tmp_path / 'wallets').mkdir()
+    (tmp_path / 'wallets' / 'sender').write_text(
+        json.dumps(sender.to_dict()))
+    path = tmp_path / 'payouts.csv'
+    path.write_text('to,amount\n' + ''.join(
+        '{},{}\n'.format(receiver.address, amount) for amount in range(1, 6)))
+    return str(path)
+
+
+def create_batch(monkeypatch, payouts, password='password'):
+    monkeypatch.setattr(wallet_cli.getpass, 'getpass', lambda prompt: password)
+    return CliRunner().invoke(
+        wallet_cli.cli, ['transaction', 'create-batch', 'sender', payouts])
+
+
+def test_create_batch_wrong_password(monkeypatch, payouts):
+    def submit_txs(client, txs):
+        pytest.fail('Nothing should be submitted')
+    monkeypatch.setattr(BlockchainHttpClient, 'submit_txs', submit_txs)
+
+    result = create_batch(monkeypatch, payouts, password='wrong')
+    assert isinstance(result.exception, SystemExit)
+    assert result.exit_code != 0
+    assert 'Traceback' not in result.output
+    assert 'password' in result.output.lower()
+
+
+def test_create_batch_reports_unacknowledged_chunks(monkeypatch, payouts):
+    monkeypatch.setattr(wallet_cli, 'BATCH_SUBMIT_SIZE', 2)
+    chunks = []
+
+    def submit_txs(client, txs):
+        chunks.append(txs)
+        if len(chunks) == 2:
+            raise ClientError('Service unavailable')
+        return [{'tx_id': tx['signature'][:8], 'status': 'pending'}
+                for tx in txs]
+    monkeypatch.setattr(BlockchainHttpClient, 'submit_txs', submit_txs)
+
+    result = create_batch(monkeypatch, payouts)
+    assert result.exit_code != 0
+    assert len(chunks) == 2
+    assert 'Submitted 2 of 5 transactions' in result.output
+    assert 'Payouts 3 to 5 were not acknowledged by the node: ' \
+        'Service unavailable' in result.output
+
+
+@pytest.fixture
+def locked_wallet():
+    """
+    A wallet loaded without its password, which only signs once unlocked.
+    """
+    created = WalletManager.create_wallet('password', KEY_TYPE_ED25519)
+    wallet = Wallet(created.pub_key, created.priv_key,
+                    key_type=KEY_TYPE_ED25519)
+    yield wallet
+    wallet.lock()
+
+
+def test_session_decrypts_the_key_once(locked_wallet, receiver, monkeypatch):
+    decrypted = []
+    hex_to_priv_key = KeySerializer.hex_to_priv_key
+
+    def count_decryption(priv_key, password):
+        decrypted.append(password)
+        return hex_to_priv_key(priv_key, password)
+    monkeypatch.setattr(KeySerializer, 'hex_to_priv_key', count_decryption)
+
+    with pytest.raises(ValueError):
+        locked_wallet.create_tx(receiver.address, 1.0)
+    with pytest.raises(ValueError):
+        locked_wallet.unlock('wrong')
+    assert not locked_wallet.is_unlocked
+    locked_wallet.unlock('password')
+    for amount in range(3):
+        locked_wallet.create_tx(receiver.address, amount + 1.0)
+    assert decrypted == ['wrong', 'password']
+
+    locked_wallet.lock()
+    assert not locked_wallet.is_unlocked
+    with pytest.raises(ValueError):
+        locked_wallet.create_tx(receiver.address, 1.0)
+
+
+def test_session_locks_when_idle(locked_wallet, receiver):
+    locked_wallet.unlock('password', idle_timeout=0.3)
+    time.sleep(0.2)
+    locked_wallet.create_tx(receiver.address, 1.0)
+    # the timer went off while the last signature was recent
+    time.sleep(0.2)
+    assert locked_wallet.is_unlocked
+    deadline = time.time() + 5
+    while locked_wallet.is_unlocked and time.time() < deadline:
+        time.sleep(0.01)
+    assert not locked_wallet.is_unlocked
@@ -0,0 +1,176 @@
+import contextlib
+import os
+import subprocess
+import sys
+import threading
+
+from werkzeug.serving import make_server
+
+from pycoin.api import create_app
+from pycoin.blockchain import Blockchain
+from pycoin.consts import Difficulty, Genesis
+from pycoin.merkle import get_merkle_root
+from pycoin.peers import PeerManager
+from pycoin.pow.sha256_hash_pow import format_target
+from pycoin.wallet import KEY_TYPE_ED25519, WalletManager
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_wallet(key_type=KEY_TYPE_ED25519):
+    wallet = WalletManager.create_wallet('password', key_type)
+    # signs without going through the key derivation every time
+    wallet.unlock()
+    return wallet
+
+
+def sign_tx(wallet, to_addr, amount, fee=None):
+    """
+    A transaction of ``wallet`` as it is stored in blocks.
+    """
+    tx = wallet.create_tx(to_addr, amount, fee)
+    return dict(tx, type='tx')
+
+
+def submit_tx(blockchain, wallet, to_addr, amount, fee=None):
+    tx = wallet.create_tx(to_addr, amount, fee)
+    return blockchain.submit_transaction(
+        tx['from'], tx['to'], tx['amount'], tx['ts'], tx['signature'],
+        tx['public_key'], tx.get('fee'), tx.get('key_type'))
+
+
+def build_block(blockchain, parent, transactions, timestamp=None):
+    """
+    Mines a block extending the tree node ``parent``, as another node
+    would. By default blocks are stamped ``Difficulty.BLOCK_INTERVAL``
+    seconds apart, so that the target doesn't change however fast they are
+    built.
+    """
+    if timestamp is None:
+        timestamp = parent.ts + Difficulty.BLOCK_INTERVAL
+    block = {
+        'version': blockchain.BLOCK_VERSION,
+        'index': parent.index + 1,
+        'previous_hash': parent.hash,
+        'timestamp': timestamp,
+        'nonce': 0,
+        'target': format_target(blockchain.get_next_target(parent)),
+        'merkle_root': get_merkle_root(transactions),
+        'data': transactions,
+    }
+    block['nonce'], block['hash'] = blockchain.mining_backend.search(block)
+    return block
+
+
+def extend_branch(blockchain, parent, count, sender, receiver, amount=0.01):
+    """
+    Adds ``count`` blocks after ``parent``, each with one transaction from
+    ``sender`` to ``receiver``. Returns the added blocks.
+    """
+    blocks = []
+    for _ in range(count):
+        block = build_block(blockchain, parent, [
+            sign_tx(sender, receiver.address, amount)])
+        parent = blockchain.add_block(block)
+        blocks.append(block)
+    return blocks
+
+
+def get_chain_hashes(blockchain):
+    return [block['hash'] for block in
+            blockchain.get_blocks(0, blockchain.get_block_count())]
+
+
+def make_block_data(index, previous_hash, transactions):
+    """
+    A block as storages receive it, with made up proof of work: storages
+    don't check it.
+    """
+    return {
+        'version': Blockchain.BLOCK_VERSION,
+        'index': index,
+        'previous_hash': previous_hash,
+        'hash': '%064x' % (index + 1),
+        'timestamp': Genesis.TIMESTAMP + index * Difficulty.BLOCK_INTERVAL,
+        'nonce': index,
+        'target': format_target(Difficulty.INITIAL_TARGET),
+        'merkle_root': get_merkle_root(transactions),
+        'data': transactions,
+    }
+
+
+def get_python_env(home):
+    """
+    Environment of a python process with this checkout importable and
+    ``home`` as the home directory, so that the ``~/.pycoin`` it uses is a
+    temporary one.
+    """
+    return dict(os.environ, HOME=str(home), PYTHONPATH=ROOT_DIR)
+
+
+def run_python(args, home, **kwargs):
+    return subprocess.run([sys.executable] + list(args),
+                          env=get_python_env(home), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, **kwargs)
+
+
+@contextlib.contextmanager
+def serve_app(app):
+    """
+    Serves ``app`` on an ephemeral port of this machine, from a thread.
+    Yields its ``host:port`` address.
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    try:
+        yield '127.0.0.1:{}'.format(server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextlib.contextmanager
+def serve_waitress(app, threads):
+    """
+    Serves ``app`` with waitress, as ``pycoin-node start --threads`` does,
+    on an ephemeral port. Unlike the werkzeug server, it keeps connections
+    alive between requests. Yields its ``host:port`` address.
+    """
+    import waitress
+    server = waitress.create_server(app, host='127.0.0.1', port=0,
+                                    threads=threads,
+                                    asyncore_loop_timeout=0.05)
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    try:
+        yield '127.0.0.1:{}'.format(server.effective_port)
+    finally:
+        def stop():
+            # the loop ends once the server and its connections are closed
+            for channel in list(server._map.values()):
+                channel.close()
+        # from the thread of the loop, which may be polling them
+        server.trigger.pull_trigger(stop)
+        thread.join()
+        server.task_dispatcher.shutdown()
+
+
+@contextlib.contextmanager
+def serve_nodes(blockchains):
+    """
+    Serves a node API for each blockchain, every node having the others as
+    peers. Yields their apps and addresses.
+    """
+    apps = [create_app(blockchain) for blockchain in blockchains]
+    with contextlib.ExitStack() as stack:
+        addrs = [stack.enter_context(serve_app(app)) for app in apps]
+        for app, addr in zip(apps, addrs):
+            # replaces the manager create_app made without peers
+            del app.blockchain.tx_listeners[:]
+            del app.blockchain.block_listeners[:]
+            app.peers = PeerManager(app.blockchain,
+                                    [peer for peer in addrs if peer != addr])
+        yield apps, addrs